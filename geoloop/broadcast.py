@@ -0,0 +1,55 @@
+"""Fan-out av live-hendelser til dashboardet (Server-Sent Events).
+
+Produsenter (sensorpolling, kontrollsyklus, API-endringer) kaller
+``publish`` én gang; meldingen kodes én gang og legges i køen til hver
+tilkoblet klient. Belastningen på Pi-en avhenger dermed ikke av hvor mange
+faner som er åpne.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+_QUEUE_SIZE = 64  # meldinger per klient før de eldste forkastes
+
+_subscribers: set[asyncio.Queue[bytes]] = set()
+
+
+def encode(event: str, data: dict) -> bytes:
+    """Kod en melding i SSE-format."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+def publish(event: str, data: dict) -> None:
+    """Send en hendelse til alle abonnenter. Må kalles fra event-loopen."""
+    if not _subscribers:
+        return
+    message = encode(event, data)
+    for queue in _subscribers:
+        if queue.full():
+            # Treg klient: forkast eldste melding heller enn å blokkere produsenten
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+
+@asynccontextmanager
+async def subscribe() -> AsyncIterator[asyncio.Queue[bytes]]:
+    """Registrer en klient så lenge konteksten er åpen."""
+    queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=_QUEUE_SIZE)
+    _subscribers.add(queue)
+    logger.debug("SSE-klient tilkoblet (%d aktive)", len(_subscribers))
+    try:
+        yield queue
+    finally:
+        _subscribers.discard(queue)
+        logger.debug("SSE-klient frakoblet (%d aktive)", len(_subscribers))
+
+
+def subscriber_count() -> int:
+    return len(_subscribers)
@@ -21,6 +21,11 @@ class WeatherConfig:
 @dataclass
 class DatabaseConfig:
     path: str = "geoloop.db"
+    flush_interval_seconds: int = 300
+    flush_max_rows: int = 100
+    wal: bool = True
+    read_pool_size: int = 2
+    archive_dir: str | None = None
 
 
 @dataclass
@@ -38,6 +43,7 @@ class RelayConfig:
 @dataclass
 class SensorConfig:
     id: str
+    timeout_seconds: float = 2.0
 
 
 @dataclass
@@ -0,0 +1,100 @@
+"""Langtidsarkiv for sensordata som har gått ut av retensjonsvinduet.
+
+Utløpte 30-min bøtter skrives til én kolonnefil per måned
+(``sensors-YYYY-MM.npz``) med ``timestamp`` (int64, epoch-sekunder) og én
+float32-kolonne per sensor, der NaN betyr manglende verdi.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from array import array
+from collections import defaultdict
+from pathlib import Path
+
+from geoloop.db.columnar import read_npz, write_npz
+
+logger = logging.getLogger(__name__)
+
+_TIMESTAMP = "timestamp"
+
+
+def _month(ts: int) -> str:
+    return time.strftime("%Y-%m", time.gmtime(ts))
+
+
+def _months_between(since: int, until: int) -> list[str]:
+    year, month = map(int, _month(since).split("-"))
+    last = _month(until)
+    months = []
+    while True:
+        current = f"{year:04d}-{month:02d}"
+        months.append(current)
+        if current >= last:
+            return months
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class SensorArchive:
+    """Månedsinndelte kolonnefiler for sensorsykluser."""
+
+    def __init__(self, directory: str | Path) -> None:
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, month: str) -> Path:
+        return self._dir / f"sensors-{month}.npz"
+
+    def append(self, cycles: list[tuple[int, dict[str, float | None]]]) -> None:
+        """Legg sykluser til i riktig månedsfil. Eksisterende tidsstempler overskrives."""
+        by_month: dict[str, list[tuple[int, dict[str, float | None]]]] = defaultdict(list)
+        for ts, values in cycles:
+            by_month[_month(ts)].append((ts, values))
+
+        for month, new_cycles in by_month.items():
+            path = self._path(month)
+            merged = dict(self._read_file(path)) if path.exists() else {}
+            for ts, values in new_cycles:
+                merged[ts] = {name: value for name, value in values.items() if value is not None}
+            self._write_file(path, sorted(merged.items()))
+            logger.debug("Arkivert %d sykluser til %s", len(new_cycles), path.name)
+
+    def read(self, since: int, until: int) -> list[tuple[int, dict[str, float]]]:
+        """Hent arkiverte sykluser med ``since <= ts < until``, sortert på tid."""
+        if until <= since:
+            return []
+        cycles: list[tuple[int, dict[str, float]]] = []
+        for month in _months_between(since, until - 1):
+            path = self._path(month)
+            if not path.exists():
+                continue
+            cycles.extend(
+                (ts, values) for ts, values in self._read_file(path) if since <= ts < until
+            )
+        return cycles
+
+    @staticmethod
+    def _write_file(path: Path, cycles: list[tuple[int, dict[str, float]]]) -> None:
+        names = sorted({name for _, values in cycles for name in values})
+        columns: dict[str, array] = {_TIMESTAMP: array("q", (ts for ts, _ in cycles))}
+        for name in names:
+            columns[name] = array("f", (values.get(name, math.nan) for _, values in cycles))
+        write_npz(path, columns)
+
+    @staticmethod
+    def _read_file(path: Path) -> list[tuple[int, dict[str, float]]]:
+        columns = read_npz(path)
+        timestamps = columns.pop(_TIMESTAMP)
+        return [
+            (
+                ts,
+                {
+                    name: values[i]
+                    for name, values in columns.items()
+                    if not math.isnan(values[i])
+                },
+            )
+            for i, ts in enumerate(timestamps)
+        ]
@@ -0,0 +1,224 @@
+"""Asynkron fasade over ``Store``.
+
+All skriving (og lesing mot ``:memory:``) kjøres på én dedikert skrivetråd
+som henter jobber fra en kø, slik at flush og kompaktering aldri blokkerer
+event-loopen. Lesing mot fil-databaser går parallelt i en trådpool med like
+mange tråder som ``Store`` har leseforbindelser.
+
+Nye hendelser publiseres til live-strømmen (``geoloop.broadcast``) når de
+er tatt imot; sensorsykluser publiseres av sensorpollingen, som kjenner
+snapshotet med siste gyldige verdier.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable
+
+from geoloop import broadcast, metrics
+from geoloop.db.store import Store
+
+logger = logging.getLogger(__name__)
+
+_Job = tuple[Callable[[], Any], Future]
+
+
+def _timed(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Kjør ``func`` i databasetråden og mål tiden (uten ventetid i køen)."""
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - start, operation=func.__name__)
+
+
+class AsyncStore:
+    """Awaitbar ``Store`` med skrivetråd og lesepool."""
+
+    def __init__(self, store: Store) -> None:
+        self._store = store
+        self._jobs: queue.SimpleQueue[_Job | None] = queue.SimpleQueue()
+        self._writer = threading.Thread(
+            target=self._run_writer, name="geoloop-db-writer", daemon=True
+        )
+        self._writer.start()
+        self._readers: ThreadPoolExecutor | None = None
+        if store.read_pool_size > 0:
+            self._readers = ThreadPoolExecutor(
+                max_workers=store.read_pool_size, thread_name_prefix="geoloop-db-reader"
+            )
+        self._closed = False
+
+    @property
+    def store(self) -> Store:
+        """Den underliggende synkrone ``Store`` (kun for bruk utenfor event-loopen)."""
+        return self._store
+
+    @property
+    def write_version(self) -> int:
+        """Skrivevannmerket til ``Store`` (leses uten å gå via skrivetråden)."""
+        return self._store.write_version
+
+    def _run_writer(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            func, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func())
+            except BaseException as exc:
+                future.set_exception(exc)
+
+    async def _write(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self._closed:
+            raise RuntimeError("AsyncStore er lukket")
+        future: Future = Future()
+        self._jobs.put((partial(_timed, func, *args, **kwargs), future))
+        return await asyncio.wrap_future(future)
+
+    async def _read(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self._readers is None:
+            return await self._write(func, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(_timed, func, *args, **kwargs))
+
+    # --- Skriving ---
+
+    async def log_weather(self, **kwargs: Any) -> None:
+        await self._write(self._store.log_weather, **kwargs)
+
+    async def log_sensor(self, sensor_id: str, value: float, **kwargs: Any) -> None:
+        await self._write(self._store.log_sensor, sensor_id, value, **kwargs)
+
+    async def log_sensors(
+        self, values: dict[str, float | None], *, timestamp: datetime | None = None
+    ) -> None:
+        await self._write(self._store.log_sensors, values, timestamp=timestamp)
+
+    async def log_event(
+        self, event_type: str, message: str = "", *, timestamp: datetime | None = None
+    ) -> None:
+        timestamp = timestamp or datetime.now(timezone.utc)
+        await self._write(self._store.log_event, event_type, message, timestamp=timestamp)
+        broadcast.publish(
+            "event",
+            {
+                "timestamp": timestamp.isoformat(timespec="seconds"),
+                "event_type": event_type,
+                "message": message,
+            },
+        )
+
+    async def flush(self) -> None:
+        await self._write(self._store.flush)
+
+    async def compact_sensor_data(self) -> None:
+        await self._write(self._store.compact_sensor_data)
+
+    async def save_forecast_cache(self, location: str, body: bytes, **kwargs: Any) -> None:
+        await self._write(self._store.save_forecast_cache, location, body, **kwargs)
+
+    async def touch_forecast_cache(self, location: str, **kwargs: Any) -> bool:
+        return await self._write(self._store.touch_forecast_cache, location, **kwargs)
+
+    async def save_forecast_issuance(
+        self, location: str, issued_at: datetime, timeseries: list[dict], **kwargs: Any
+    ) -> bool:
+        return await self._write(
+            self._store.save_forecast_issuance, location, issued_at, timeseries, **kwargs
+        )
+
+    # --- Lesing ---
+
+    async def get_weather_log(
+        self,
+        limit: int = 100,
+        *,
+        before_id: int | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[dict]:
+        return await self._read(
+            self._store.get_weather_log,
+            limit=limit,
+            before_id=before_id,
+            since=since,
+            until=until,
+        )
+
+    async def get_sensor_log(self, sensor_id: str | None = None, limit: int = 100) -> list[dict]:
+        return await self._read(self._store.get_sensor_log, sensor_id=sensor_id, limit=limit)
+
+    async def get_events(
+        self,
+        limit: int = 100,
+        *,
+        before_id: int | None = None,
+        event_type: str | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[dict]:
+        return await self._read(
+            self._store.get_events,
+            limit=limit,
+            before_id=before_id,
+            event_type=event_type,
+            since=since,
+            until=until,
+        )
+
+    async def get_sensor_history(
+        self, hours: int = 24, limit: int = 0, method: str = "avg"
+    ) -> list[dict]:
+        return await self._read(
+            self._store.get_sensor_history, hours=hours, limit=limit, method=method
+        )
+
+    async def get_sensor_history_columns(
+        self, hours: int = 24, limit: int = 0, method: str = "avg"
+    ) -> dict:
+        return await self._read(
+            self._store.get_sensor_history_columns, hours=hours, limit=limit, method=method
+        )
+
+    async def get_sensor_rollups(
+        self, resolution: int, hours: int = 24, sensor_id: str | None = None
+    ) -> list[dict]:
+        return await self._read(
+            self._store.get_sensor_rollups, resolution, hours=hours, sensor_id=sensor_id
+        )
+
+    async def get_heating_periods(self, hours: int = 24) -> list[dict]:
+        return await self._read(self._store.get_heating_periods, hours=hours)
+
+    async def stats(self) -> dict:
+        return await self._read(self._store.stats)
+
+    async def load_forecast_cache(self, location: str) -> dict | None:
+        return await self._read(self._store.load_forecast_cache, location)
+
+    async def get_forecast_at(self, location: str, moment: datetime) -> dict | None:
+        return await self._read(self._store.get_forecast_at, location, moment)
+
+    async def close(self) -> None:
+        """Vent på lesere, flush bufferen og stopp skrivetråden."""
+        if self._closed:
+            return
+        if self._readers is not None:
+            await asyncio.to_thread(self._readers.shutdown, True)
+        try:
+            await self._write(self._store.close)
+        finally:
+            self._closed = True
+            self._jobs.put(None)
+            await asyncio.to_thread(self._writer.join)
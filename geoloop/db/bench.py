@@ -0,0 +1,234 @@
+"""Ytelsestest for ``Store`` med syntetiske data.
+
+Genererer sensorsykluser, værdata og hendelser for en valgfri periode og
+måler innsettingsrate, kompakteringstid og p50/p99-latens for
+historikkspørringene dashboardet gjør. Resultatet skrives som JSON slik at
+regresjoner i lagringslaget kan sammenlignes mellom versjoner.
+
+Kjøres som::
+
+    python -m geoloop.db.bench --days 90 --sensors 5 --output bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from geoloop.db.pyramid import LEVELS
+from geoloop.db.store import DEFAULT_SENSORS, Store
+
+# (hours, limit) som dashboardet bruker, jf. PERIOD_CFG i app.js
+DASHBOARD_QUERIES = LEVELS
+
+# Typisk nivå per sensor (°C); ekstra sensorer får nivåer rundt 10 °C
+_BASE_LEVELS = {
+    "loop_inlet": 2.0,
+    "loop_outlet": 6.0,
+    "hp_inlet": 35.0,
+    "hp_outlet": 45.0,
+    "tank": 44.0,
+}
+
+
+def _sensor_names(count: int) -> list[str]:
+    names = list(DEFAULT_SENSORS[:count])
+    names += [f"extra_{i}" for i in range(count - len(names))]
+    return names
+
+
+def generate(
+    store: Store,
+    *,
+    days: float,
+    sensors: int = len(DEFAULT_SENSORS),
+    poll_seconds: int = 60,
+    weather_seconds: int = 600,
+    end: datetime | None = None,
+    seed: int = 1,
+) -> int:
+    """Fyll ``store`` med syntetiske data og returner antall sykluser.
+
+    Sensorverdiene følger en døgnkurve med støy; værdata logges hvert
+    ``weather_seconds`` og varmeperioder gir ``heating_on``/``heating_off``.
+    """
+    rng = random.Random(seed)
+    names = _sensor_names(sensors)
+    end = end or datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    cycles = int(days * 86400 / poll_seconds)
+    heating = False
+
+    for i in range(cycles):
+        ts = start + timedelta(seconds=i * poll_seconds)
+        phase = 2 * math.pi * (ts.timestamp() % 86400) / 86400
+        store.log_sensors(
+            {
+                name: round(
+                    _BASE_LEVELS.get(name, 10.0) + 3 * math.sin(phase) + rng.gauss(0, 0.2), 2
+                )
+                for name in names
+            },
+            timestamp=ts,
+        )
+        if i * poll_seconds % weather_seconds == 0:
+            air = 1.0 + 4 * math.sin(phase - math.pi / 2) + rng.gauss(0, 0.5)
+            store.log_weather(
+                temperature=round(air, 1),
+                precipitation=round(max(0.0, rng.gauss(0, 0.5)), 1),
+                humidity=round(rng.uniform(60, 100)),
+                wind_speed=round(rng.uniform(0, 8), 1),
+                timestamp=ts,
+            )
+            if heating != (air < 1.0):
+                heating = air < 1.0
+                store.log_event(
+                    "heating_on" if heating else "heating_off", "syntetisk", timestamp=ts
+                )
+    store.flush()
+    return cycles
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    ms = sorted(s * 1000 for s in samples)
+    cuts = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return {
+        "p50_ms": round(statistics.median(ms), 3),
+        "p99_ms": round(cuts[98], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def bench_insert(path: Path, readings: int, **store_kwargs) -> dict:
+    """Mål innsettingsrate for ``log_sensor`` (avlesninger per sekund)."""
+    store = Store(path, **store_kwargs)
+    ts = datetime.now(timezone.utc) - timedelta(seconds=readings)
+    names = DEFAULT_SENSORS
+    started = time.perf_counter()
+    for i in range(readings):
+        store.log_sensor(names[i % len(names)], 20.0, timestamp=ts + timedelta(seconds=i))
+    store.flush()
+    elapsed = time.perf_counter() - started
+    store.close()
+    return {
+        "readings": readings,
+        "seconds": round(elapsed, 4),
+        "readings_per_second": round(readings / elapsed, 1),
+    }
+
+
+def bench_history(store: Store, iterations: int, method: str = "avg") -> list[dict]:
+    """Mål latens for ``get_sensor_history`` for hver dashboardkombinasjon."""
+    results = []
+    for hours, limit in DASHBOARD_QUERIES:
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            rows = store.get_sensor_history(hours=hours, limit=limit, method=method)
+            samples.append(time.perf_counter() - started)
+        results.append(
+            {"hours": hours, "limit": limit, "rows": len(rows), **_percentiles(samples)}
+        )
+    return results
+
+
+def run(
+    *,
+    days: float = 30,
+    sensors: int = len(DEFAULT_SENSORS),
+    insert_readings: int = 5000,
+    iterations: int = 50,
+    directory: Path | None = None,
+) -> dict:
+    """Kjør hele suiten og returner resultatene som en dict."""
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        tmp_path = Path(tmp)
+        insert = {
+            "unbuffered": bench_insert(tmp_path / "insert.db", insert_readings),
+            "buffered": bench_insert(
+                tmp_path / "insert-buffered.db",
+                insert_readings,
+                flush_interval=3600,
+                flush_max_rows=100,
+            ),
+        }
+
+        store = Store(tmp_path / "dataset.db", flush_interval=3600, flush_max_rows=500)
+        started = time.perf_counter()
+        cycles = generate(store, days=days, sensors=sensors)
+        generate_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        store.compact_sensor_data()
+        first_compaction = time.perf_counter() - started
+        started = time.perf_counter()
+        store.compact_sensor_data()
+        incremental_compaction = time.perf_counter() - started
+
+        history = bench_history(store, iterations)
+        # Dashboardet bruker minmax, som leses fra graf-pyramiden
+        history_minmax = bench_history(store, iterations, method="minmax")
+        stats = store.stats()
+        store.close()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+        },
+        "dataset": {
+            "days": days,
+            "sensors": sensors,
+            "cycles": cycles,
+            "generate_seconds": round(generate_seconds, 3),
+            "size_bytes": stats["size_bytes"],
+            "tables": stats["tables"],
+        },
+        "insert": insert,
+        "compaction": {
+            "first_seconds": round(first_compaction, 4),
+            "incremental_seconds": round(incremental_compaction, 4),
+        },
+        "history": history,
+        "history_minmax": history_minmax,
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Ytelsestest for GeoLoop-databasen")
+    parser.add_argument("--days", type=float, default=30, help="Periode med syntetiske data")
+    parser.add_argument("--sensors", type=int, default=len(DEFAULT_SENSORS))
+    parser.add_argument("--insert-readings", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=50, help="Spørringer per kombinasjon")
+    parser.add_argument("--dir", type=Path, default=None, help="Katalog for midlertidige databaser")
+    parser.add_argument("--output", type=Path, default=None, help="JSON-fil (standard: stdout)")
+    args = parser.parse_args(argv)
+
+    results = run(
+        days=args.days,
+        sensors=args.sensors,
+        insert_readings=args.insert_readings,
+        iterations=args.iterations,
+        directory=args.dir,
+    )
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
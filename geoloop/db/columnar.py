@@ -0,0 +1,91 @@
+"""Kolonnefiler i NumPy ``.npz``-format uten NumPy-avhengighet.
+
+Filene er zip-arkiver med én ``.npy``-fil (format 1.0) per kolonne og kan
+leses direkte med ``numpy.load`` for analyse utenfor Pi-en.
+"""
+
+from __future__ import annotations
+
+import ast
+import io
+import os
+import struct
+import sys
+import zipfile
+from array import array
+from pathlib import Path
+from typing import BinaryIO
+
+_MAGIC = b"\x93NUMPY\x01\x00"
+
+# array-typekode ↔ NumPy dtype (uten byte-rekkefølge)
+_DTYPES = {"b": "i1", "B": "u1", "h": "i2", "i": "i4", "q": "i8", "f": "f4", "d": "f8"}
+_TYPECODES = {dtype: code for code, dtype in _DTYPES.items()}
+
+
+def _encode_npy(values: array) -> bytes:
+    dtype = _DTYPES.get(values.typecode)
+    if dtype is None:
+        raise ValueError(f"Typekode støttes ikke: {values.typecode!r}")
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    header = f"{{'descr': '<{dtype}', 'fortran_order': False, 'shape': ({len(values)},), }}"
+    # Magic + lengde + header skal gå opp i 64 byte, avsluttet med linjeskift
+    padding = 64 - (len(_MAGIC) + 2 + len(header) + 1) % 64
+    header_bytes = (header + " " * (padding % 64) + "\n").encode("latin1")
+    return _MAGIC + struct.pack("<H", len(header_bytes)) + header_bytes + values.tobytes()
+
+
+def _decode_npy(data: bytes) -> array:
+    if data[:6] != _MAGIC[:6]:
+        raise ValueError("Ikke en .npy-fil")
+    major = data[6]
+    if major == 1:
+        (header_len,) = struct.unpack("<H", data[8:10])
+        offset = 10
+    else:
+        (header_len,) = struct.unpack("<I", data[8:12])
+        offset = 12
+    header = ast.literal_eval(data[offset:offset + header_len].decode("latin1"))
+    descr: str = header["descr"]
+    typecode = _TYPECODES.get(descr[1:])
+    if typecode is None or header["fortran_order"] or len(header["shape"]) != 1:
+        raise ValueError(f"Kolonnetype støttes ikke: {header}")
+    values = array(typecode)
+    values.frombytes(data[offset + header_len:])
+    big_endian_data = descr[0] == ">"
+    if big_endian_data != (sys.byteorder == "big") and descr[0] != "|":
+        values.byteswap()
+    return values
+
+
+def encode_npz(columns: dict[str, array]) -> bytes:
+    """Kod kolonner som komprimert ``.npz`` i minnet (f.eks. til en BLOB)."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, values in columns.items():
+            zf.writestr(f"{name}.npy", _encode_npy(values))
+    return buffer.getvalue()
+
+
+def decode_npz(data: bytes) -> dict[str, array]:
+    """Motstykket til ``encode_npz``."""
+    return read_npz(io.BytesIO(data))
+
+
+def write_npz(path: Path, columns: dict[str, array]) -> None:
+    """Skriv kolonner komprimert til ``path`` (atomisk via midlertidig fil)."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(encode_npz(columns))
+    os.replace(tmp, path)
+
+
+def read_npz(path: Path | BinaryIO) -> dict[str, array]:
+    """Les alle kolonner fra en ``.npz``-fil."""
+    with zipfile.ZipFile(path) as zf:
+        return {
+            name[:-4]: _decode_npy(zf.read(name))
+            for name in zf.namelist()
+            if name.endswith(".npy")
+        }
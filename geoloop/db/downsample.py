@@ -0,0 +1,91 @@
+"""Toppbevarende nedsampling av tidsserier.
+
+Begge metodene tar en tidssortert liste med ``(epoch, verdi)`` uten
+manglende verdier og returnerer nøyaktig ``threshold`` punkter (eller alle,
+hvis serien er kortere). Hver serie behandles i én lineær gjennomgang.
+"""
+
+from __future__ import annotations
+
+Point = tuple[int, float]
+
+
+def lttb(points: list[Point], threshold: int) -> list[Point]:
+    """Largest-Triangle-Three-Buckets.
+
+    Første og siste punkt beholdes; fra hver bøtte imellom velges punktet
+    som danner størst trekant med forrige valgte punkt og snittet av neste
+    bøtte. Korte fall og topper gir store trekanter og overlever.
+    """
+    n = len(points)
+    if threshold >= n or threshold <= 0:
+        return list(points)
+    if threshold < 3:
+        return [points[0], points[-1]][:threshold]
+
+    selected = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+
+        # Snittet av neste bøtte (siste bøtte peker på sluttpunktet)
+        next_points = points[end:next_end] or points[-1:]
+        avg_x = sum(p[0] for p in next_points) / len(next_points)
+        avg_y = sum(p[1] for p in next_points) / len(next_points)
+
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(points[best])
+        a = best
+    selected.append(points[-1])
+    return selected
+
+
+def minmax(points: list[Point], threshold: int) -> list[Point]:
+    """Min/maks-omhylling: laveste og høyeste punkt fra hver bøtte.
+
+    Serien deles i ``threshold // 2`` bøtter; ved oddetall beholdes i
+    tillegg første punkt. Flate bøtter gir første og siste punkt, slik at
+    resultatet alltid har nøyaktig ``threshold`` punkter.
+    """
+    n = len(points)
+    if threshold >= n or threshold <= 0:
+        return list(points)
+    if threshold < 2:
+        # For få punkter til både min og maks
+        return points[:1]
+
+    selected: list[Point] = []
+    offset = 0
+    if threshold % 2:
+        selected.append(points[0])
+        offset = 1
+    buckets = threshold // 2
+    size = (n - offset) / buckets
+    for i in range(buckets):
+        start = offset + int(i * size)
+        end = offset + int((i + 1) * size)
+        lo = hi = start
+        for j in range(start + 1, end):
+            value = points[j][1]
+            if value < points[lo][1]:
+                lo = j
+            elif value > points[hi][1]:
+                hi = j
+        if lo == hi:
+            lo, hi = start, end - 1
+        first, second = sorted((lo, hi))
+        selected.append(points[first])
+        selected.append(points[second])
+    return selected
+
+
+DOWNSAMPLERS = {"lttb": lttb, "minmax": minmax}
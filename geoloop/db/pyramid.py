@@ -0,0 +1,115 @@
+"""Ferdigberegnede graf-serier per zoomnivå i dashboardet.
+
+For hvert (timer, punkter)-par i ``LEVELS`` holdes en min/maks-omhylling
+i faste, epoch-justerte tidsbøtter: laveste og høyeste avlesning (med
+tidspunkt) per sensor per bøtte. Nye sykluser legges inn inkrementelt ved
+hver flush, og gamle bøtter faller ut når de glir ut av vinduet. En
+``/api/history``-forespørsel for et kjent nivå leser dermed bare noen få
+titalls bøtter fra minnet i stedet for å spørre SQLite.
+
+Som ``downsample.minmax`` bevarer omhyllingen topper og bunner, men
+bøttene følger klokken i stedet for antall punkter, så serien er stabil
+mellom oppdateringer. Alle sensorer deler tidspunktene i hver bøtte, slik
+at serien har omtrent ``limit`` rader uansett antall sensorer.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterable
+
+# (timer, punkter) som dashboardet bruker, jf. PERIOD_CFG i app.js
+LEVELS = ((1, 120), (6, 120), (24, 120), (168, 70))
+
+
+class _Level:
+    __slots__ = ("span", "width", "buckets")
+
+    def __init__(self, hours: int, points: int) -> None:
+        self.span = hours * 3600
+        # To punkter (min og maks) per bøtte
+        self.width = max(1, self.span // max(1, points // 2))
+        # bøttestart → sensor → [min_ts, min_verdi, maks_ts, maks_verdi]
+        self.buckets: dict[int, dict[str, list]] = {}
+
+    def add(self, ts: int, values: dict[str, float]) -> None:
+        bucket = self.buckets.setdefault(ts - ts % self.width, {})
+        for name, value in values.items():
+            envelope = bucket.get(name)
+            if envelope is None:
+                bucket[name] = [ts, value, ts, value]
+                continue
+            if value < envelope[1] or (value == envelope[1] and ts < envelope[0]):
+                envelope[0], envelope[1] = ts, value
+            if value > envelope[3] or (value == envelope[3] and ts > envelope[2]):
+                envelope[2], envelope[3] = ts, value
+
+    def evict(self, now: int) -> None:
+        oldest = now - self.span - self.width
+        for start in [start for start in self.buckets if start < oldest]:
+            del self.buckets[start]
+
+
+class HistoryPyramid:
+    """Min/maks-omhylling per zoomnivå, trådsikker for én skriver og flere lesere."""
+
+    def __init__(self, levels: Iterable[tuple[int, int]] = LEVELS) -> None:
+        self._levels = {(hours, points): _Level(hours, points) for hours, points in levels}
+        self._lock = threading.Lock()
+
+    @property
+    def span(self) -> int:
+        """Lengste vindu i sekunder (hvor langt tilbake data må fylles inn)."""
+        return max((level.span for level in self._levels.values()), default=0)
+
+    def covers(self, hours: int, limit: int) -> bool:
+        return (hours, limit) in self._levels
+
+    def add(self, cycles: Iterable[tuple[int, dict[str, float]]], now: int) -> None:
+        """Legg inn sykluser (epoch, verdier uten None) og kast utgåtte bøtter."""
+        cycles = list(cycles)
+        with self._lock:
+            for level in self._levels.values():
+                oldest = now - level.span - level.width
+                for ts, values in cycles:
+                    if ts >= oldest:
+                        level.add(ts, values)
+                level.evict(now)
+
+    def series(
+        self, hours: int, limit: int, names: list[str], now: int
+    ) -> list[tuple[int, dict[str, float | None]]]:
+        """Ferdig serie for et nivå: (epoch, verdier) i tidsrekkefølge.
+
+        Hver bøtte gir høyst to rader som alle sensorer deler (omtrent
+        ``limit`` rader totalt): første rad har hver sensors tidligste
+        ekstremverdi, andre rad den seneste. Radene får tidspunktet til
+        første henholdsvis siste ekstremverdi i bøtten, så en sensors punkt
+        kan flyttes inntil én bøttebredde. Sensorer uten verdi er None.
+        """
+        level = self._levels[(hours, limit)]
+        since = now - level.span
+        wanted = set(names)
+        series: list[tuple[int, dict[str, float | None]]] = []
+        with self._lock:
+            for start, bucket in sorted(level.buckets.items()):
+                if start + level.width <= since:
+                    continue
+                first: dict[str, float] = {}
+                last: dict[str, float] = {}
+                first_ts = last_ts = None
+                for name, (lo_ts, lo, hi_ts, hi) in bucket.items():
+                    if name not in wanted:
+                        continue
+                    points = sorted(p for p in ((lo_ts, lo), (hi_ts, hi)) if p[0] >= since)
+                    if not points:
+                        continue
+                    (a_ts, first[name]), (b_ts, last[name]) = points[0], points[-1]
+                    first_ts = a_ts if first_ts is None else min(first_ts, a_ts)
+                    last_ts = b_ts if last_ts is None else max(last_ts, b_ts)
+                if not first:
+                    continue
+                series.append((first_ts, {**dict.fromkeys(names), **first}))
+                if last_ts != first_ts:
+                    series.append((last_ts, {**dict.fromkeys(names), **last}))
+        return series
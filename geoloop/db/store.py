@@ -1,64 +1,517 @@
 from __future__ import annotations
 
+import logging
+import math
+import queue
 import sqlite3
-from datetime import datetime, timedelta, timezone
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from array import array
 from pathlib import Path
 
+from geoloop.db.archive import SensorArchive
+from geoloop.db.columnar import decode_npz, encode_npz
+from geoloop.db.downsample import DOWNSAMPLERS
+from geoloop.db.pyramid import HistoryPyramid
+
+# Pragmas for fil-databaser. mmap/cache holdes moderate pga. 256 MB minnegrense
+# i containeren på RPi.
+_MMAP_SIZE = 32 * 1024 * 1024
+_WRITER_CACHE_KIB = 8192
+_READER_CACHE_KIB = 4096
+
+# Skjemaversjon i PRAGMA user_version. v2: heltalls epoch-tidsstempler og
+# sensorordbok med heltallsnøkler. v3: aggregattabell (sensor_rollups).
+# v4: radtellere (table_stats) vedlikeholdt av triggere.
+_SCHEMA_VERSION = 4
+
+# Standardsensorene registreres fra start, slik at historikk alltid har de
+# samme nøklene som dashboardet forventer.
+DEFAULT_SENSORS = ("loop_inlet", "loop_outlet", "hp_inlet", "hp_outlet", "tank")
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS weather_log (
+        id            INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp     INTEGER NOT NULL,
+        temperature   REAL,
+        precipitation REAL,
+        humidity      REAL,
+        wind_speed    REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sensors (
+        id   INTEGER PRIMARY KEY,
+        name TEXT    NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sensor_cycles (
+        timestamp INTEGER PRIMARY KEY,
+        compacted INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sensor_rollups (
+        resolution INTEGER NOT NULL,
+        bucket     INTEGER NOT NULL,
+        sensor     INTEGER NOT NULL REFERENCES sensors (id),
+        min_value  REAL    NOT NULL,
+        max_value  REAL    NOT NULL,
+        total      REAL    NOT NULL,
+        count      INTEGER NOT NULL,
+        PRIMARY KEY (resolution, bucket, sensor)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS table_stats (
+        name      TEXT    PRIMARY KEY,
+        row_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS compaction_state (
+        level     INTEGER PRIMARY KEY,
+        watermark INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS system_events (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp  INTEGER NOT NULL,
+        event_type TEXT    NOT NULL,
+        message    TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS forecast_cache (
+        location      TEXT    PRIMARY KEY,
+        fetched_at    INTEGER NOT NULL,
+        expires       INTEGER,
+        last_modified TEXT,
+        body          BLOB    NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS forecast_issuances (
+        location    TEXT    NOT NULL,
+        issued_at   INTEGER NOT NULL,
+        fetched_at  INTEGER NOT NULL,
+        valid_from  INTEGER NOT NULL,
+        valid_until INTEGER NOT NULL,
+        data        BLOB    NOT NULL,
+        PRIMARY KEY (location, issued_at)
+    ) WITHOUT ROWID
+    """,
+    # Indekser for bla-/filtreringsspørringene i get_events og get_weather_log
+    "CREATE INDEX IF NOT EXISTS system_events_type_id ON system_events (event_type, id)",
+    "CREATE INDEX IF NOT EXISTS system_events_timestamp ON system_events (timestamp)",
+    "CREATE INDEX IF NOT EXISTS weather_log_timestamp ON weather_log (timestamp)",
+    # Oppslag på hentetidspunkt i get_forecast_at
+    "CREATE INDEX IF NOT EXISTS forecast_issuances_fetched "
+    "ON forecast_issuances (location, fetched_at)",
+)
+
+# Kompaktering: (nivå, bøttestørrelse, minimumsalder) i sekunder. Nivå 2 kjøres
+# først slik at 5-min bøtter som har blitt eldre enn 24t slås sammen.
+_COMPACTION_LEVELS = ((2, 1800, 86400), (1, 300, 3600))
+_RETENTION_SECONDS = 7 * 86400
+# Hver transaksjon dekker maks så mange bøtter, og hver kjøring maks så mange
+# transaksjoner per nivå. Et etterslep tas igjen over flere kjøringer.
+_COMPACTION_CHUNK_BUCKETS = 48
+_COMPACTION_MAX_CHUNKS = 6
+
+# Verdikolonner i prognosearkivet (float32, NaN = mangler)
+FORECAST_FIELDS = (
+    "air_temperature",
+    "precipitation_amount",
+    "relative_humidity",
+    "wind_speed",
+)
+
+# Tabeller med radteller i table_stats, slik at statistikk er O(1)
+_COUNTED_TABLES = ("sensor_cycles", "sensor_rollups", "weather_log", "system_events")
+
+_COUNTER_TRIGGERS = tuple(
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_count_{action}
+    AFTER {action.upper()} ON {table}
+    BEGIN
+        UPDATE table_stats SET row_count = row_count {op} 1 WHERE name = '{table}';
+    END
+    """
+    for table in _COUNTED_TABLES
+    for action, op in (("insert", "+"), ("delete", "-"))
+)
+
+# Aggregater (min/maks/sum/antall) som holdes oppdatert ved hver innsetting:
+# (oppløsning, retensjon) i sekunder. None = behold for alltid.
+_ROLLUPS = (
+    (300, 30 * 86400),
+    (1800, 365 * 86400),
+    (3600, 2 * 365 * 86400),
+    (86400, None),
+)
+
+# Tekst-tidsstempel (ISO-8601) → epoch-sekunder, brukt ved migrering fra v1
+_EPOCH_FROM_TEXT = "CAST(strftime('%s', timestamp) AS INTEGER)"
+
+logger = logging.getLogger(__name__)
+
+
+def _epoch(timestamp: datetime | None) -> int:
+    return int((timestamp or datetime.now(timezone.utc)).timestamp())
+
+
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _iso_z(ts: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+
+def _column(sensor_key: int) -> str:
+    return f"s{sensor_key}"
+
+
+def _pick_rollup(bucket_seconds: int, since: int, now: int, fallback: bool) -> int | None:
+    """Velg groveste aggregat med oppløsning ≤ bøttestørrelsen som dekker perioden.
+
+    Med ``fallback`` brukes ellers det fineste aggregatet som dekker
+    perioden, selv om det gir flere punkter enn ønsket.
+    """
+    covering = [
+        resolution
+        for resolution, retention in _ROLLUPS
+        if retention is None or since >= now - retention
+    ]
+    fitting = [resolution for resolution in covering if resolution <= bucket_seconds]
+    if fitting:
+        return max(fitting)
+    if fallback and covering:
+        return min(covering)
+    return None
+
 
 class Store:
-    """SQLite-basert logging for GeoLoop."""
+    """SQLite-basert logging for GeoLoop.
+
+    Sensordata lagres i ``sensor_cycles`` med én rad per pollesyklus og én
+    kolonne per sensor (``s<id>``), der ``sensors`` er ordboken fra
+    sensornavn til heltallsnøkkel. Alle tidsstempler lagres som
+    epoch-sekunder (UTC) og gjøres om til ISO-8601 ved lesing.
+
+    Sensoravlesninger kan bufres i minnet og skrives samlet
+    (``flush_interval``/``flush_max_rows``) for å redusere antall
+    commits — og dermed slitasje — på SD-kortet. En grense satt til 0 er
+    av; med begge på 0 (standard) skrives hver syklus umiddelbart.
 
-    def __init__(self, path: str | Path = ":memory:") -> None:
+    Fil-databaser kjøres i WAL-modus med én skriveforbindelse og en liten
+    pool av skrivebeskyttede leseforbindelser, slik at spørringer fra
+    dashboardet aldri venter på innsettinger. ``:memory:`` bruker én
+    delt forbindelse.
+
+    Med ``archive_dir`` arkiveres sykluser som går ut av retensjonen til
+    månedsvise kolonnefiler, og lange historikkspørringer henter fra
+    arkivet der rådataene ikke strekker til.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = ":memory:",
+        *,
+        flush_interval: float = 0.0,
+        flush_max_rows: int = 0,
+        wal: bool = True,
+        read_pool_size: int = 2,
+        archive_dir: str | Path | None = None,
+    ) -> None:
+        self._path = str(path)
         self._conn = sqlite3.connect(
-            str(path),
+            self._path,
             detect_types=sqlite3.PARSE_DECLTYPES,
             check_same_thread=False,
         )
         self._conn.row_factory = sqlite3.Row
-        self._create_tables()
+        self._flush_interval = flush_interval
+        self._flush_max_rows = flush_max_rows
+        self._sensor_buffer: dict[int, dict[str, float]] = {}
+        self._sensor_keys: dict[str, int] = {}
+        self._last_flush = time.monotonic()
+        self._write_version = 0
+        self._archive = SensorArchive(archive_dir) if archive_dir else None
+        self._pyramid = HistoryPyramid()
+
+        in_memory = self._path in ("", ":memory:")
+        self._wal = wal and not in_memory
+        if self._wal:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE}")
+            self._conn.execute(f"PRAGMA cache_size=-{_WRITER_CACHE_KIB}")
+
         self._migrate()
+        self._create_tables()
+        self._conn.commit()
+
+        self._readers: queue.Queue[sqlite3.Connection] | None = None
+        self._read_pool_size = read_pool_size if self._wal else 0
+        if self._read_pool_size > 0:
+            self._readers = queue.Queue()
+            for _ in range(read_pool_size):
+                self._readers.put(self._open_reader())
+        self._seed_pyramid()
+
+    def _seed_pyramid(self) -> None:
+        """Fyll graf-pyramiden for det lengste zoomvinduet.
+
+        Kompakterte perioder fylles fra aggregatenes min/maks, slik at
+        toppene og bunnene overlever en omstart.
+        """
+        now = int(time.time())
+        self._pyramid.add(self._envelope_cycles(self._conn, now - self._pyramid.span), now)
+
+    @property
+    def read_pool_size(self) -> int:
+        """Antall leseforbindelser som kan brukes parallelt fra andre tråder.
+
+        0 betyr at all lesing går via skriveforbindelsen.
+        """
+        return self._read_pool_size
+
+    def _open_reader(self) -> sqlite3.Connection:
+        """Åpne en skrivebeskyttet leseforbindelse mot samme fil."""
+        uri = Path(self._path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=ON")
+        conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{_READER_CACHE_KIB}")
+        return conn
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """Lån en leseforbindelse fra poolen (eller skriveforbindelsen)."""
+        if self._readers is None:
+            yield self._conn
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
 
     def _create_tables(self) -> None:
-        cur = self._conn.cursor()
-        cur.executescript("""
-            CREATE TABLE IF NOT EXISTS weather_log (
-                id        INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT    NOT NULL,
-                temperature    REAL,
-                precipitation  REAL,
-                humidity       REAL,
-                wind_speed     REAL
-            );
-
-            CREATE TABLE IF NOT EXISTS sensor_log (
-                id        INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT    NOT NULL,
-                sensor_id TEXT    NOT NULL,
-                value     REAL,
-                compacted INTEGER DEFAULT 0
-            );
-
-            CREATE INDEX IF NOT EXISTS idx_sensor_log_ts
-                ON sensor_log (timestamp);
-
-            CREATE TABLE IF NOT EXISTS system_events (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp  TEXT    NOT NULL,
-                event_type TEXT    NOT NULL,
-                message    TEXT
-            );
-        """)
-        self._conn.commit()
+        """Opprett skjemaet og registrer standardsensorene."""
+        for statement in (*_SCHEMA, *_COUNTER_TRIGGERS):
+            self._conn.execute(statement)
+        self._load_sensor_keys()
+        self._sensor_keys = self._ensure_sensors(DEFAULT_SENSORS)
+
+    def _load_sensor_keys(self) -> None:
+        self._sensor_keys = {
+            row["name"]: row["id"]
+            for row in self._conn.execute("SELECT id, name FROM sensors ORDER BY id").fetchall()
+        }
+
+    def _ensure_sensors(self, names: Iterable[str]) -> dict[str, int]:
+        """Registrer nye sensornavn i ordboken og legg til en kolonne for hver.
+
+        Returnerer en utvidet kopi av nøkkeltabellen. Kalleren publiserer den
+        etter commit, slik at lesere i andre tråder aldri spør etter en
+        kolonne som ikke er synlig ennå.
+        """
+        keys = dict(self._sensor_keys)
+        for name in names:
+            if name in keys:
+                continue
+            key = self._conn.execute(
+                "INSERT INTO sensors (name) VALUES (?)", (name,)
+            ).lastrowid
+            self._conn.execute(f"ALTER TABLE sensor_cycles ADD COLUMN {_column(key)} REAL")
+            keys[name] = key
+        return keys
 
     def _migrate(self) -> None:
-        """Legg til nye kolonner/indekser for eksisterende databaser."""
+        """Oppgrader eldre databaser til gjeldende skjema på stedet.
+
+        v1 → v2: tabellene (ISO-tekst i ``timestamp``) døpes om, dataene
+        kopieres over i v2-tabellene med epoch-sekunder, og de gamle
+        tabellene slettes. Både lang ``sensor_log`` og bred
+        ``sensor_cycles`` med navngitte kolonner støttes som kilde.
+
+        v2 → v3: ``sensor_rollups`` fylles fra eksisterende sykluser.
+
+        v3 → v4: radtellerne i ``table_stats`` settes fra ``COUNT(*)``.
+
+        Ved enhver oppgradering får kompakteringsnivåer uten vannmerke et
+        vannmerke fra allerede kompakterte rader.
+        """
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= _SCHEMA_VERSION:
+            return
+
         cur = self._conn.cursor()
-        columns = {row[1] for row in cur.execute("PRAGMA table_info(sensor_log)").fetchall()}
-        if "compacted" not in columns:
-            cur.execute("ALTER TABLE sensor_log ADD COLUMN compacted INTEGER DEFAULT 0")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_sensor_log_ts ON sensor_log (timestamp)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_sensor_log_compacted ON sensor_log (compacted, timestamp)")
+        cur.execute("BEGIN")
+        try:
+            legacy = self._migrate_v2(cur) if version < 2 else []
+            self._create_tables()
+            if version < 3:
+                self._backfill_rollups(cur)
+            if version < 4:
+                self._seed_table_stats(cur)
+            self._seed_watermarks(cur)
+            cur.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
             self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+        if legacy:
+            # Frigjør plassen fra tekst-tidsstemplene
+            self._conn.execute("VACUUM")
+        if version > 0 or legacy:
+            logger.info("Database migrert fra skjema v%d til v%d", version, _SCHEMA_VERSION)
+
+    def _migrate_v2(self, cur: sqlite3.Cursor) -> list[str]:
+        """Flytt v1-tabeller over i v2-skjemaet. Returnerer migrerte tabeller."""
+        existing = {
+            row[0]
+            for row in cur.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            ).fetchall()
+        }
+        legacy = [
+            name
+            for name in ("weather_log", "system_events", "sensor_cycles", "sensor_log")
+            if name in existing
+        ]
+
+        for name in legacy:
+            cur.execute(f"ALTER TABLE {name} RENAME TO {name}_v1")
+        self._create_tables()
+
+        if "weather_log" in legacy:
+            cur.execute(f"""
+                INSERT INTO weather_log
+                    (id, timestamp, temperature, precipitation, humidity, wind_speed)
+                SELECT id, {_EPOCH_FROM_TEXT}, temperature, precipitation, humidity, wind_speed
+                FROM weather_log_v1
+            """)
+        if "system_events" in legacy:
+            cur.execute(f"""
+                INSERT INTO system_events (id, timestamp, event_type, message)
+                SELECT id, {_EPOCH_FROM_TEXT}, event_type, message
+                FROM system_events_v1
+            """)
+        if "sensor_cycles" in legacy:
+            self._migrate_wide_v1(cur)
+        if "sensor_log" in legacy:
+            self._migrate_long_v1(cur)
+
+        for name in legacy:
+            cur.execute(f"DROP TABLE {name}_v1")
+        return legacy
+
+    def _backfill_rollups(self, cur: sqlite3.Cursor) -> None:
+        """Bygg aggregater fra syklusene som allerede finnes.
+
+        Kompakterte rader teller som én måling, så antallet blir et
+        underestimat for data eldre enn én time — snittet påvirkes ikke.
+        """
+        for resolution, _retention in _ROLLUPS:
+            for key in self._sensor_keys.values():
+                col = _column(key)
+                cur.execute(f"""
+                    INSERT INTO sensor_rollups
+                        (resolution, bucket, sensor, min_value, max_value, total, count)
+                    SELECT {resolution}, (timestamp / {resolution}) * {resolution} AS bucket, {key},
+                           MIN({col}), MAX({col}), SUM({col}), COUNT({col})
+                    FROM sensor_cycles
+                    WHERE {col} IS NOT NULL
+                    GROUP BY bucket
+                """)
+
+    def _migrate_wide_v1(self, cur: sqlite3.Cursor) -> None:
+        """Kopier v1 ``sensor_cycles`` med én kolonne per sensornavn."""
+        names = [
+            row[1]
+            for row in cur.execute("PRAGMA table_info(sensor_cycles_v1)").fetchall()
+            if row[1] not in ("id", "timestamp", "compacted")
+        ]
+        self._sensor_keys = self._ensure_sensors(names)
+        targets = ", ".join(_column(self._sensor_keys[name]) for name in names)
+        sources = ", ".join(f'"{name}"' for name in names)
+        cur.execute(f"""
+            INSERT OR IGNORE INTO sensor_cycles (timestamp, compacted, {targets})
+            SELECT {_EPOCH_FROM_TEXT}, compacted, {sources}
+            FROM sensor_cycles_v1
+            ORDER BY id
+        """)
+
+    def _migrate_long_v1(self, cur: sqlite3.Cursor) -> None:
+        """Pivoter v1 ``sensor_log`` (én rad per avlesning) til sykluser."""
+        columns = {row[1] for row in cur.execute("PRAGMA table_info(sensor_log_v1)").fetchall()}
+        compacted = "MAX(compacted)" if "compacted" in columns else "0"
+        names = [
+            row[0]
+            for row in cur.execute("SELECT DISTINCT sensor_id FROM sensor_log_v1").fetchall()
+        ]
+        if not names:
+            return
+        self._sensor_keys = self._ensure_sensors(names)
+        targets = ", ".join(_column(self._sensor_keys[name]) for name in names)
+        pivot = ", ".join("MAX(CASE WHEN sensor_id = ? THEN value END)" for _ in names)
+        cur.execute(
+            f"""
+            INSERT OR IGNORE INTO sensor_cycles (timestamp, compacted, {targets})
+            SELECT {_EPOCH_FROM_TEXT} AS ts, {compacted}, {pivot}
+            FROM sensor_log_v1
+            GROUP BY ts
+            """,
+            names,
+        )
+
+    def _seed_watermarks(self, cur: sqlite3.Cursor) -> None:
+        """Sett vannmerker fra kompakterte rader (eldre skjema hadde ingen).
+
+        Uten vannmerke tolkes hele perioden som rådata, og graf-pyramiden
+        og toppbevarende nedsampling ville ignorert de kompakterte radene.
+        Vannmerket for et nivå settes like etter siste bøtte som allerede
+        er kompaktert til nivået eller grovere.
+        """
+        sizes = {level: bucket_seconds for level, bucket_seconds, _ in _COMPACTION_LEVELS}
+        for level in sizes:
+            ends = " ".join(
+                f"WHEN {other} THEN {size}" for other, size in sizes.items() if other >= level
+            )
+            cur.execute(
+                f"""
+                INSERT OR IGNORE INTO compaction_state (level, watermark)
+                SELECT ?, MAX(timestamp + CASE compacted {ends} END)
+                FROM sensor_cycles
+                WHERE compacted >= ?
+                HAVING COUNT(*) > 0
+                """,
+                (level, level),
+            )
+
+    def _seed_table_stats(self, cur: sqlite3.Cursor) -> None:
+        """Sett radtellerne til faktisk antall; triggerne holder dem à jour."""
+        for table in _COUNTED_TABLES:
+            cur.execute(
+                f"INSERT OR REPLACE INTO table_stats (name, row_count) "
+                f"SELECT '{table}', COUNT(*) FROM {table}"
+            )
 
     def log_weather(
         self,
@@ -69,13 +522,13 @@ class Store:
         wind_speed: float | None = None,
         timestamp: datetime | None = None,
     ) -> None:
-        ts = (timestamp or datetime.now(timezone.utc)).isoformat()
         self._conn.execute(
             "INSERT INTO weather_log (timestamp, temperature, precipitation, humidity, wind_speed) "
             "VALUES (?, ?, ?, ?, ?)",
-            (ts, temperature, precipitation, humidity, wind_speed),
+            (_epoch(timestamp), temperature, precipitation, humidity, wind_speed),
         )
         self._conn.commit()
+        self._write_version += 1
 
     def log_sensor(
         self,
@@ -84,12 +537,112 @@ class Store:
         *,
         timestamp: datetime | None = None,
     ) -> None:
-        ts = (timestamp or datetime.now(timezone.utc)).isoformat()
-        self._conn.execute(
-            "INSERT INTO sensor_log (timestamp, sensor_id, value) VALUES (?, ?, ?)",
-            (ts, sensor_id, value),
+        self.log_sensors({sensor_id: value}, timestamp=timestamp)
+
+    def log_sensors(
+        self,
+        values: dict[str, float | None],
+        *,
+        timestamp: datetime | None = None,
+    ) -> None:
+        """Logg en hel pollesyklus med felles tidsstempel.
+
+        Verdier som er None hoppes over. Syklusen legges i skrivebufferen og
+        skrives med én ``executemany`` når bufferen er full eller
+        flush-intervallet er passert.
+        """
+        cycle = {name: value for name, value in values.items() if value is not None}
+        if cycle:
+            self._sensor_buffer.setdefault(_epoch(timestamp), {}).update(cycle)
+        if self._should_flush():
+            self.flush()
+
+    def _should_flush(self) -> bool:
+        if not self._flush_max_rows and not self._flush_interval:
+            return True
+        if self._flush_max_rows and len(self._sensor_buffer) >= self._flush_max_rows:
+            return True
+        return bool(self._flush_interval) and (
+            time.monotonic() - self._last_flush >= self._flush_interval
         )
-        self._conn.commit()
+
+    def flush(self) -> None:
+        """Skriv bufrede sensorsykluser i én transaksjon."""
+        self._last_flush = time.monotonic()
+        if not self._sensor_buffer:
+            return
+        cycles, self._sensor_buffer = self._sensor_buffer, {}
+        names = {name for values in cycles.values() for name in values}
+        try:
+            if not names <= self._sensor_keys.keys():
+                with self._conn:
+                    keys = self._ensure_sensors(names)
+                self._sensor_keys = keys
+            with self._conn:
+                self._upsert_cycles(list(cycles.items()), compacted=0)
+                self._update_rollups(cycles)
+        except sqlite3.Error:
+            # Behold syklusene slik at neste flush kan prøve igjen
+            for ts, values in cycles.items():
+                self._sensor_buffer.setdefault(ts, {}).update(values)
+            raise
+        self._pyramid.add(sorted(cycles.items()), int(time.time()))
+        self._write_version += 1
+
+    @property
+    def write_version(self) -> int:
+        """Teller som økes etter hver commit som endrer lesbare data.
+
+        Brukes som vannmerke for svarcacher: samme verdi betyr at ingen
+        spørring kan ha fått nye rader siden sist.
+        """
+        return self._write_version
+
+    def _upsert_cycles(
+        self, cycles: list[tuple[int, dict[str, float | None]]], compacted: int
+    ) -> None:
+        """Sett inn sykluser; eksisterende rad med samme tidsstempel flettes."""
+        names = list(self._sensor_keys)
+        columns = [_column(key) for key in self._sensor_keys.values()]
+        placeholders = ", ".join("?" for _ in columns)
+        updates = ", ".join(f"{col} = COALESCE(excluded.{col}, {col})" for col in columns)
+        self._conn.executemany(
+            f"""
+            INSERT INTO sensor_cycles (timestamp, compacted, {", ".join(columns)})
+            VALUES (?, ?, {placeholders})
+            ON CONFLICT(timestamp) DO UPDATE SET {updates}
+            """,
+            [
+                (ts, compacted, *(values.get(name) for name in names))
+                for ts, values in cycles
+            ],
+        )
+
+    def _update_rollups(self, cycles: dict[int, dict[str, float]]) -> None:
+        """Oppdater min/maks/sum/antall for hver oppløsning med nye målinger."""
+        self._conn.executemany(
+            """
+            INSERT INTO sensor_rollups
+                (resolution, bucket, sensor, min_value, max_value, total, count)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT (resolution, bucket, sensor) DO UPDATE SET
+                min_value = MIN(min_value, excluded.min_value),
+                max_value = MAX(max_value, excluded.max_value),
+                total     = total + excluded.total,
+                count     = count + 1
+            """,
+            [
+                (resolution, ts - ts % resolution, self._sensor_keys[name], value, value, value)
+                for ts, values in cycles.items()
+                for name, value in values.items()
+                for resolution, _retention in _ROLLUPS
+            ],
+        )
+
+    @property
+    def pending_rows(self) -> int:
+        """Antall pollesykluser som venter i skrivebufferen."""
+        return len(self._sensor_buffer)
 
     def log_event(
         self,
@@ -98,178 +651,716 @@ class Store:
         *,
         timestamp: datetime | None = None,
     ) -> None:
-        ts = (timestamp or datetime.now(timezone.utc)).isoformat()
         self._conn.execute(
             "INSERT INTO system_events (timestamp, event_type, message) VALUES (?, ?, ?)",
-            (ts, event_type, message),
+            (_epoch(timestamp), event_type, message),
         )
         self._conn.commit()
+        self._write_version += 1
 
     def compact_sensor_data(self) -> None:
-        """Rullerende kompaktering av sensordata.
+        """Rullerende, inkrementell kompaktering av sensordata.
 
         Retensjonspolicy:
           0–1t:   full oppløsning (compacted=0)
           1t–24t: 5-min snitt     (compacted=1)
           24t–7d: 30-min snitt    (compacted=2)
-          >7d:    slett
+          >7d:    arkiver (hvis ``archive_dir``) og slett
+
+        Aggregatene i ``sensor_rollups`` påvirkes ikke av kompakteringen og
+        har egen retensjon per oppløsning (se ``_ROLLUPS``).
+
+        Hvert nivå har et vannmerke i ``compaction_state``; bare bøtter
+        mellom vannmerket og grensen for nivået behandles, i avgrensede
+        biter. Kostnaden per kjøring er dermed konstant.
         """
-        now = datetime.now(timezone.utc)
-        cur = self._conn.cursor()
+        self.flush()
+        now = int(time.time())
 
-        # Slett data eldre enn 7 dager
-        ts_7d = (now - timedelta(days=7)).isoformat()
-        cur.execute("DELETE FROM sensor_log WHERE timestamp < ?", (ts_7d,))
+        if self._archive is not None:
+            self._archive_expired(now - _RETENTION_SECONDS)
 
-        # Komprimer 24t–7d til 30-min bøtter (level 2)
-        ts_24h = (now - timedelta(hours=24)).isoformat()
-        self._compact_range(cur, ts_7d, ts_24h, bucket_minutes=30, level=2)
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM sensor_cycles WHERE timestamp < ?",
+                (now - _RETENTION_SECONDS,),
+            )
+            for resolution, retention in _ROLLUPS:
+                if retention is not None:
+                    self._conn.execute(
+                        "DELETE FROM sensor_rollups WHERE resolution = ? AND bucket < ?",
+                        (resolution, now - retention),
+                    )
 
-        # Komprimer 1t–24t til 5-min bøtter (level 1)
-        ts_1h = (now - timedelta(hours=1)).isoformat()
-        self._compact_range(cur, ts_24h, ts_1h, bucket_minutes=5, level=1)
+        try:
+            for level, bucket_seconds, min_age in _COMPACTION_LEVELS:
+                self._compact_level(
+                    level, bucket_seconds, now - min_age, now - _RETENTION_SECONDS
+                )
+        finally:
+            self._write_version += 1
 
-        self._conn.commit()
+    def _archive_expired(self, cutoff: int) -> None:
+        """Skriv sykluser eldre enn ``cutoff`` til arkivet før de slettes."""
+        names = list(self._sensor_keys)
+        columns = ", ".join(_column(key) for key in self._sensor_keys.values())
+        rows = self._conn.execute(
+            f"SELECT timestamp, {columns} FROM sensor_cycles WHERE timestamp < ? ORDER BY timestamp",
+            (cutoff,),
+        ).fetchall()
+        if rows:
+            self._archive.append([(row[0], dict(zip(names, row[1:]))) for row in rows])
+
+    def _compact_level(
+        self, level: int, bucket_seconds: int, cutoff: int, retention_start: int
+    ) -> None:
+        """Komprimer bøtter fra vannmerket opp til ``cutoff`` for ett nivå."""
+        eligible_to = cutoff - cutoff % bucket_seconds
+        row = self._conn.execute(
+            "SELECT watermark FROM compaction_state WHERE level = ?", (level,)
+        ).fetchone()
+        if row is not None:
+            start = row[0]
+        else:
+            first = self._conn.execute(
+                "SELECT timestamp FROM sensor_cycles WHERE compacted < ? "
+                "ORDER BY timestamp LIMIT 1",
+                (level,),
+            ).fetchone()
+            start = first[0] if first is not None else eligible_to
+        # Ingen vits i å gå gjennom vinduer som retensjonen allerede har tømt
+        start = max(start, retention_start)
+        start -= start % bucket_seconds
+
+        chunk_seconds = bucket_seconds * _COMPACTION_CHUNK_BUCKETS
+        for _ in range(_COMPACTION_MAX_CHUNKS):
+            if start >= eligible_to:
+                break
+            end = min(start + chunk_seconds, eligible_to)
+            with self._conn:
+                self._compact_range(start, end, bucket_seconds, level)
+                self._set_watermark(level, end)
+            start = end
+        if row is None:
+            # Første kjøring: lagre utgangspunktet selv om ingenting ble gjort
+            with self._conn:
+                self._set_watermark(level, start)
+
+    def _set_watermark(self, level: int, watermark: int) -> None:
+        self._conn.execute(
+            "INSERT INTO compaction_state (level, watermark) VALUES (?, ?) "
+            "ON CONFLICT(level) DO UPDATE SET watermark = excluded.watermark",
+            (level, watermark),
+        )
 
     def _compact_range(
         self,
-        cur: sqlite3.Cursor,
-        ts_from: str,
-        ts_to: str,
-        bucket_minutes: int,
+        ts_from: int,
+        ts_to: int,
+        bucket_seconds: int,
         level: int,
     ) -> None:
         """Komprimer rå-data i et tidsvindu til gjennomsnittsverdier per bøtte."""
-        bucket_expr = (
-            "strftime('%Y-%m-%dT%H:', timestamp) || "
-            f"printf('%02d', (CAST(strftime('%M', timestamp) AS INTEGER) / {bucket_minutes}) * {bucket_minutes})"
-        )
+        names = list(self._sensor_keys)
+        averages = ", ".join(f"AVG({_column(key)})" for key in self._sensor_keys.values())
 
-        # Sett inn gjennomsnitt per bøtte
-        cur.execute(f"""
-            INSERT INTO sensor_log (timestamp, sensor_id, value, compacted)
-            SELECT {bucket_expr} || ':00Z',
-                   sensor_id,
-                   AVG(value),
-                   ?
-            FROM sensor_log
+        # Beregn gjennomsnitt per bøtte før originalene slettes, siden
+        # bøttens tidsstempel kan kollidere med en rå-rad i samme vindu
+        buckets = self._conn.execute(f"""
+            SELECT (timestamp / {bucket_seconds}) * {bucket_seconds} AS bucket, {averages}
+            FROM sensor_cycles
             WHERE timestamp >= ? AND timestamp < ?
               AND compacted < ?
-            GROUP BY {bucket_expr}, sensor_id
-            HAVING COUNT(*) > 0
-        """, (level, ts_from, ts_to, level))
+            GROUP BY bucket
+        """, (ts_from, ts_to, level)).fetchall()
 
-        # Slett originalene som ble kompaktert
-        cur.execute("""
-            DELETE FROM sensor_log
+        self._conn.execute("""
+            DELETE FROM sensor_cycles
             WHERE timestamp >= ? AND timestamp < ?
               AND compacted < ?
         """, (ts_from, ts_to, level))
 
-    def get_weather_log(self, limit: int = 100) -> list[dict]:
-        rows = self._conn.execute(
-            "SELECT * FROM weather_log ORDER BY id DESC LIMIT ?", (limit,)
-        ).fetchall()
-        return [dict(row) for row in rows]
+        self._upsert_cycles(
+            [(row[0], dict(zip(names, row[1:]))) for row in buckets],
+            compacted=level,
+        )
+
+    def _page(
+        self,
+        table: str,
+        limit: int,
+        *,
+        before_id: int | None,
+        since: datetime | None,
+        until: datetime | None,
+        filters: dict[str, object] | None = None,
+    ) -> list[dict]:
+        """Hent rader nyeste først med keyset-paginering på ``id``.
+
+        ``before_id`` er markøren fra forrige side (minste ``id`` som ble
+        returnert), så hver side koster det samme uansett hvor langt bak i
+        loggen man blar. ``since``/``until`` avgrenser tidsrommet
+        (``until`` eksklusiv).
+        """
+        clauses: list[str] = []
+        params: list[object] = []
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(_epoch(since))
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(_epoch(until))
+        for column, value in (filters or {}).items():
+            clauses.append(f"{column} = ?")
+            params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._reader() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM {table} {where} ORDER BY id DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [{**dict(row), "timestamp": _iso(row["timestamp"])} for row in rows]
+
+    def get_weather_log(
+        self,
+        limit: int = 100,
+        *,
+        before_id: int | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[dict]:
+        return self._page(
+            "weather_log", limit, before_id=before_id, since=since, until=until
+        )
 
     def get_sensor_log(
         self, sensor_id: str | None = None, limit: int = 100
     ) -> list[dict]:
-        if sensor_id:
-            rows = self._conn.execute(
-                "SELECT * FROM sensor_log WHERE sensor_id = ? ORDER BY id DESC LIMIT ?",
-                (sensor_id, limit),
-            ).fetchall()
-        else:
-            rows = self._conn.execute(
-                "SELECT * FROM sensor_log ORDER BY id DESC LIMIT ?",
+        """Hent enkeltavlesninger (nyeste først), pakket ut fra syklustabellen."""
+        if sensor_id is not None and sensor_id not in self._sensor_keys:
+            return []
+        names = [sensor_id] if sensor_id else list(self._sensor_keys)
+        columns = [_column(self._sensor_keys[name]) for name in names]
+        not_empty = " OR ".join(f"{col} IS NOT NULL" for col in columns)
+        with self._reader() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT timestamp, compacted, {", ".join(columns)}
+                FROM sensor_cycles
+                WHERE {not_empty}
+                ORDER BY timestamp DESC LIMIT ?
+                """,
                 (limit,),
             ).fetchall()
-        return [dict(row) for row in rows]
 
-    def get_events(self, limit: int = 100) -> list[dict]:
-        rows = self._conn.execute(
-            "SELECT * FROM system_events ORDER BY id DESC LIMIT ?",
-            (limit,),
-        ).fetchall()
-        return [dict(row) for row in rows]
+        readings: list[dict] = []
+        for row in rows:
+            timestamp = _iso(row[0])
+            for name, value in zip(names, row[2:]):
+                if value is None:
+                    continue
+                readings.append({
+                    "timestamp": timestamp,
+                    "sensor_id": name,
+                    "value": value,
+                    "compacted": row[1],
+                })
+        return readings[:limit]
 
-    def get_sensor_history(self, hours: int = 24, limit: int = 0) -> list[dict]:
-        """Hent sensordata pivotert per tidsstempel for de siste N timer.
+    def get_events(
+        self,
+        limit: int = 100,
+        *,
+        before_id: int | None = None,
+        event_type: str | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[dict]:
+        """Hent hendelser nyeste først, filtrert på type og/eller tidsrom."""
+        return self._page(
+            "system_events",
+            limit,
+            before_id=before_id,
+            since=since,
+            until=until,
+            filters={"event_type": event_type} if event_type else None,
+        )
+
+    def get_sensor_history(
+        self, hours: int = 24, limit: int = 0, method: str = "avg"
+    ) -> list[dict]:
+        """Hent sensordata per syklus for de siste N timer, én dict per rad.
+
+        ``method`` velger nedsampling når ``limit`` > 0: ``avg`` (snitt per
+        tidsbøtte), ``lttb`` eller ``minmax``. De to siste gir nøyaktig
+        ``limit`` punkter per sensor med bevarte topper og bunner; hver
+        sensor får sine egne tidspunkter, så rader kan ha None for sensorer
+        som ikke ble valgt der.
 
-        Når limit > 0 og antall datapunkter overstiger limit, brukes
-        tidsbøtte-gruppering for nedsampling.
+        ``minmax`` for dashboardets zoomnivåer (``pyramid.LEVELS``) leses
+        fra graf-pyramiden i minnet, med min/maks per klokkejustert bøtte.
+        Der deler alle sensorer tidspunktene, så det blir omtrent ``limit``
+        rader totalt (opptil to mer), ikke per sensor.
         """
-        since = (
-            datetime.now(timezone.utc)
-            - timedelta(hours=hours)
-        ).isoformat()
-
-        if limit > 0:
-            count = self._conn.execute(
-                "SELECT COUNT(DISTINCT timestamp) FROM sensor_log WHERE timestamp >= ?",
+        return [
+            {"timestamp": _iso_z(ts), **values}
+            for ts, values in self._history_cycles(hours, limit, method)
+        ]
+
+    def get_sensor_history_columns(
+        self, hours: int = 24, limit: int = 0, method: str = "avg"
+    ) -> dict:
+        """Som ``get_sensor_history``, men kolonnevis.
+
+        Returnerer ``{"timestamps": [epoch...], "sensors": {navn: [verdi...]}}``
+        der alle listene er like lange og manglende verdier er None.
+        """
+        names = list(self._sensor_keys)
+        cycles = self._history_cycles(hours, limit, method)
+        return {
+            "timestamps": [ts for ts, _ in cycles],
+            "sensors": {name: [values.get(name) for _, values in cycles] for name in names},
+        }
+
+    def _history_cycles(
+        self, hours: int, limit: int, method: str = "avg"
+    ) -> list[tuple[int, dict[str, float | None]]]:
+        """Velg datakilde for historikken og returner (epoch, verdier) per punkt.
+
+        Når limit > 0 og antall sykluser overstiger limit (eller perioden
+        går lenger tilbake enn rådataene), nedsamples det til tidsbøtter.
+        Bøttene bygges fra det groveste aggregatet med oppløsning innenfor
+        bøttebredden og gir høyst ``limit`` punkter; er bøttene for små for
+        aggregatene, brukes rådataene.
+        """
+        if method != "avg":
+            if method not in DOWNSAMPLERS:
+                raise ValueError(f"Ukjent nedsamplingsmetode: {method}")
+            if method == "minmax" and self._pyramid.covers(hours, limit):
+                # Dashboardets zoomnivåer ligger ferdig i minnet
+                return self._pyramid.series(
+                    hours, limit, list(self._sensor_keys), int(time.time())
+                )
+            if limit <= 0:
+                return self._history_cycles(hours, 0)
+            with self._reader() as conn:
+                cycles = self._envelope_cycles(conn, int(time.time()) - hours * 3600)
+            return self._downsample_cycles(cycles, limit, method)
+
+        now = int(time.time())
+        since = now - hours * 3600
+        names = list(self._sensor_keys)
+        columns = ", ".join(_column(key) for key in self._sensor_keys.values())
+
+        with self._reader() as conn:
+            beyond_raw = since < now - _RETENTION_SECONDS
+            archived = beyond_raw and self._archive is not None
+            if limit > 0:
+                bucket_seconds = max(1, int(hours * 3600 / limit))
+                if beyond_raw or self._count_cycles(conn, since) > limit:
+                    resolution = _pick_rollup(
+                        bucket_seconds, since, now, fallback=beyond_raw and not archived
+                    )
+                    if resolution is not None:
+                        return self._get_sensor_history_rollup(
+                            conn, since, bucket_seconds, resolution, limit
+                        )
+                    if archived:
+                        return self._get_sensor_history_archived(conn, since, bucket_seconds)
+                    return self._get_sensor_history_bucketed(conn, since, bucket_seconds)
+            if archived:
+                return self._get_sensor_history_archived(conn, since, None)
+
+            rows = conn.execute(
+                f"""
+                SELECT timestamp, {columns}
+                FROM sensor_cycles
+                WHERE timestamp >= ?
+                ORDER BY timestamp ASC
+                """,
                 (since,),
-            ).fetchone()[0]
-            if count > limit:
-                bucket_seconds = int(hours * 3600 / limit)
-                return self._get_sensor_history_bucketed(since, bucket_seconds)
+            ).fetchall()
+        return [(row[0], dict(zip(names, row[1:]))) for row in rows]
 
-        rows = self._conn.execute(
-            """
-            SELECT strftime('%Y-%m-%dT%H:%M:%SZ', MIN(timestamp)) AS timestamp,
-                   MAX(CASE WHEN sensor_id = 'loop_inlet'  THEN value END) AS loop_inlet,
-                   MAX(CASE WHEN sensor_id = 'loop_outlet' THEN value END) AS loop_outlet,
-                   MAX(CASE WHEN sensor_id = 'hp_inlet'    THEN value END) AS hp_inlet,
-                   MAX(CASE WHEN sensor_id = 'hp_outlet'   THEN value END) AS hp_outlet,
-                   MAX(CASE WHEN sensor_id = 'tank'        THEN value END) AS tank
-            FROM sensor_log
-            WHERE timestamp >= ?
-            GROUP BY strftime('%Y-%m-%dT%H:%M:%S', timestamp)
-            ORDER BY timestamp ASC
-            """,
-            (since,),
+    def _envelope_cycles(
+        self, conn: sqlite3.Connection, since: int
+    ) -> list[tuple[int, dict[str, float]]]:
+        """Sykluser for toppbevarende nedsampling (bare sensorer med verdi).
+
+        Kompakterte sykluser er snitt og har mistet korte fall og topper.
+        Bak kompakteringens vannmerke brukes derfor ``min_value`` og
+        ``max_value`` fra det fineste aggregatet som dekker perioden: minimum
+        i starten av bøtten og maksimum midt i. Nyere data leses rått.
+        """
+        row = conn.execute("SELECT watermark FROM compaction_state WHERE level = 1").fetchone()
+        raw_from = max(since, row[0]) if row is not None else since
+        points: dict[int, dict[str, float]] = {}
+
+        if raw_from > since:
+            resolution = _pick_rollup(1, since, int(time.time()), fallback=True)
+            names_by_key = {key: name for name, key in self._sensor_keys.items()}
+            rows = conn.execute(
+                "SELECT bucket, sensor, min_value, max_value FROM sensor_rollups "
+                "WHERE resolution = ? AND bucket >= ? AND bucket < ?",
+                (resolution, since, raw_from),
+            ).fetchall()
+            for bucket, key, lo, hi in rows:
+                name = names_by_key[key]
+                points.setdefault(bucket, {})[name] = lo
+                if hi != lo:
+                    points.setdefault(bucket + resolution // 2, {})[name] = hi
+
+        names = list(self._sensor_keys)
+        columns = ", ".join(_column(key) for key in self._sensor_keys.values())
+        rows = conn.execute(
+            f"SELECT timestamp, {columns} FROM sensor_cycles "
+            "WHERE timestamp >= ? AND compacted = 0",
+            (raw_from,),
         ).fetchall()
-        return [dict(row) for row in rows]
+        for row in rows:
+            values = points.setdefault(row[0], {})
+            values.update((n, v) for n, v in zip(names, row[1:]) if v is not None)
+        return sorted(points.items())
+
+    def _downsample_cycles(
+        self, cycles: list[tuple[int, dict[str, float | None]]], limit: int, method: str
+    ) -> list[tuple[int, dict[str, float | None]]]:
+        """Nedsample hver sensor for seg og flett tidspunktene sammen."""
+        reduce = DOWNSAMPLERS[method]
+        names = list(self._sensor_keys)
+        merged: dict[int, dict[str, float | None]] = {}
+        for name in names:
+            series = [(ts, values[name]) for ts, values in cycles if values.get(name) is not None]
+            for ts, value in reduce(series, limit):
+                merged.setdefault(ts, dict.fromkeys(names))[name] = value
+        return sorted(merged.items())
 
-    def _get_sensor_history_bucketed(self, since: str, bucket_seconds: int) -> list[dict]:
+    @staticmethod
+    def _count_cycles(conn: sqlite3.Connection, since: int) -> int:
+        return conn.execute(
+            "SELECT COUNT(*) FROM sensor_cycles WHERE timestamp >= ?",
+            (since,),
+        ).fetchone()[0]
+
+    def _get_sensor_history_bucketed(
+        self, conn: sqlite3.Connection, since: int, bucket_seconds: int
+    ) -> list[tuple[int, dict[str, float | None]]]:
         """Nedsampling med tidsbøtter for store tidsperioder."""
-        bucket_expr = (
-            f"(CAST(strftime('%s', timestamp) AS INTEGER) / {bucket_seconds}) * {bucket_seconds}"
-        )
-        rows = self._conn.execute(
+        names = list(self._sensor_keys)
+        averages = ", ".join(f"AVG({_column(key)})" for key in self._sensor_keys.values())
+        rows = conn.execute(
             f"""
-            SELECT strftime('%Y-%m-%dT%H:%M:%SZ', {bucket_expr}, 'unixepoch') AS timestamp,
-                   AVG(CASE WHEN sensor_id = 'loop_inlet'  THEN value END) AS loop_inlet,
-                   AVG(CASE WHEN sensor_id = 'loop_outlet' THEN value END) AS loop_outlet,
-                   AVG(CASE WHEN sensor_id = 'hp_inlet'    THEN value END) AS hp_inlet,
-                   AVG(CASE WHEN sensor_id = 'hp_outlet'   THEN value END) AS hp_outlet,
-                   AVG(CASE WHEN sensor_id = 'tank'        THEN value END) AS tank
-            FROM sensor_log
+            SELECT (timestamp / {bucket_seconds}) * {bucket_seconds} AS bucket, {averages}
+            FROM sensor_cycles
             WHERE timestamp >= ?
-            GROUP BY {bucket_expr}
-            ORDER BY 1 ASC
+            GROUP BY bucket
+            ORDER BY bucket ASC
             """,
             (since,),
         ).fetchall()
-        return [dict(row) for row in rows]
+        return [(row[0], dict(zip(names, row[1:]))) for row in rows]
+
+    def _get_sensor_history_archived(
+        self, conn: sqlite3.Connection, since: int, bucket_seconds: int | None
+    ) -> list[tuple[int, dict[str, float | None]]]:
+        """Slå sammen arkivet med levende sykluser, valgfritt med snitt per bøtte."""
+        names = list(self._sensor_keys)
+        columns = ", ".join(_column(key) for key in self._sensor_keys.values())
+        live = [
+            (row[0], dict(zip(names, row[1:])))
+            for row in conn.execute(
+                f"SELECT timestamp, {columns} FROM sensor_cycles "
+                "WHERE timestamp >= ? ORDER BY timestamp ASC",
+                (since,),
+            ).fetchall()
+        ]
+        until = live[0][0] if live else int(time.time())
+        cycles = self._archive.read(since, until) + live
+
+        if bucket_seconds is None:
+            return [(ts, {**dict.fromkeys(names), **values}) for ts, values in cycles]
+
+        sums: dict[int, dict[str, list[float]]] = {}
+        for ts, values in cycles:
+            bucket = sums.setdefault(ts - ts % bucket_seconds, {})
+            for name, value in values.items():
+                if value is not None:
+                    acc = bucket.setdefault(name, [0.0, 0])
+                    acc[0] += value
+                    acc[1] += 1
+        return [
+            (
+                bucket,
+                {
+                    **dict.fromkeys(names),
+                    **{name: total / count for name, (total, count) in values.items()},
+                },
+            )
+            for bucket, values in sorted(sums.items())
+        ]
+
+    def _get_sensor_history_rollup(
+        self,
+        conn: sqlite3.Connection,
+        since: int,
+        bucket_seconds: int,
+        resolution: int,
+        limit: int,
+    ) -> list[tuple[int, dict[str, float | None]]]:
+        """Nedsampling fra aggregattabellen (vektet snitt per bøtte)."""
+        # Bøttebredden rundes opp til et multiplum av aggregatets oppløsning,
+        # slik at perioden gir høyst limit bøtter (pluss en påbegynt først)
+        width = -(-bucket_seconds // resolution) * resolution
+        rows = conn.execute(
+            f"""
+            SELECT (bucket / {width}) * {width} AS b, sensor, SUM(total) / SUM(count)
+            FROM sensor_rollups
+            WHERE resolution = ? AND bucket >= ?
+            GROUP BY b, sensor
+            ORDER BY b ASC
+            """,
+            (resolution, since),
+        ).fetchall()
+        return self._pivot_rollup_rows(rows)[-limit:]
+
+    def _pivot_rollup_rows(
+        self, rows: list[sqlite3.Row]
+    ) -> list[tuple[int, dict[str, float | None]]]:
+        names_by_key = {key: name for name, key in self._sensor_keys.items()}
+        empty = dict.fromkeys(self._sensor_keys)
+        result: list[tuple[int, dict[str, float | None]]] = []
+        current: dict | None = None
+        current_bucket = None
+        for bucket, key, value in rows:
+            if bucket != current_bucket:
+                current = dict(empty)
+                result.append((bucket, current))
+                current_bucket = bucket
+            current[names_by_key[key]] = value
+        return result
+
+    def get_sensor_rollups(
+        self,
+        resolution: int,
+        hours: int = 24,
+        sensor_id: str | None = None,
+    ) -> list[dict]:
+        """Hent min/maks/snitt/antall per bøtte fra aggregattabellen."""
+        if resolution not in dict(_ROLLUPS):
+            raise ValueError(f"Ukjent oppløsning: {resolution}")
+        if sensor_id is not None and sensor_id not in self._sensor_keys:
+            return []
+        since = int(time.time()) - hours * 3600
+        sql = (
+            "SELECT bucket, sensor, min_value, max_value, total / count, count "
+            "FROM sensor_rollups WHERE resolution = ? AND bucket >= ?"
+        )
+        params: list = [resolution, since]
+        if sensor_id is not None:
+            sql += " AND sensor = ?"
+            params.append(self._sensor_keys[sensor_id])
+        with self._reader() as conn:
+            rows = conn.execute(sql + " ORDER BY bucket ASC, sensor ASC", params).fetchall()
+        names_by_key = {key: name for name, key in self._sensor_keys.items()}
+        return [
+            {
+                "timestamp": _iso_z(row[0]),
+                "sensor_id": names_by_key[row[1]],
+                "min": row[2],
+                "max": row[3],
+                "avg": row[4],
+                "count": row[5],
+            }
+            for row in rows
+        ]
 
     def get_heating_periods(self, hours: int = 24) -> list[dict]:
         """Hent VP av/på-hendelser for de siste N timer."""
-        since = (
-            datetime.now(timezone.utc)
-            - timedelta(hours=hours)
-        ).isoformat()
-        rows = self._conn.execute(
+        since = int(time.time()) - hours * 3600
+        with self._reader() as conn:
+            rows = conn.execute(
+                """
+                SELECT timestamp, event_type
+                FROM system_events
+                WHERE event_type IN ('heating_on', 'heating_off', 'manual_on', 'manual_off')
+                  AND timestamp >= ?
+                ORDER BY timestamp ASC
+                """,
+                (since,),
+            ).fetchall()
+        return [{"timestamp": _iso(row[0]), "event_type": row[1]} for row in rows]
+
+    def save_forecast_cache(
+        self,
+        location: str,
+        body: bytes,
+        *,
+        expires: datetime | None,
+        last_modified: str | None,
+        fetched_at: datetime | None = None,
+    ) -> None:
+        """Lagre siste rå prognose fra met.no for en posisjon (erstatter forrige)."""
+        self._conn.execute(
             """
-            SELECT timestamp, event_type
-            FROM system_events
-            WHERE event_type IN ('heating_on', 'heating_off', 'manual_on', 'manual_off')
-              AND timestamp >= ?
-            ORDER BY timestamp ASC
+            INSERT OR REPLACE INTO forecast_cache
+                (location, fetched_at, expires, last_modified, body)
+            VALUES (?, ?, ?, ?, ?)
             """,
-            (since,),
-        ).fetchall()
-        return [dict(row) for row in rows]
+            (
+                location,
+                _epoch(fetched_at),
+                _epoch(expires) if expires else None,
+                last_modified,
+                body,
+            ),
+        )
+        self._conn.commit()
+
+    def touch_forecast_cache(
+        self, location: str, *, expires: datetime | None, fetched_at: datetime | None = None
+    ) -> bool:
+        """Oppdater bare ``expires``/``fetched_at`` etter ``304 Not Modified``.
+
+        Prognosen selv er uendret, så den store ``body``-blobben skrives ikke
+        på nytt. Returnerer False hvis posisjonen ikke har noen lagret prognose.
+        """
+        cur = self._conn.execute(
+            "UPDATE forecast_cache SET expires = ?, fetched_at = ? WHERE location = ?",
+            (_epoch(expires) if expires else None, _epoch(fetched_at), location),
+        )
+        self._conn.commit()
+        return cur.rowcount > 0
+
+    def load_forecast_cache(self, location: str) -> dict | None:
+        """Hent lagret prognose: ``body``, ``expires``, ``last_modified``, ``fetched_at``."""
+        with self._reader() as conn:
+            row = conn.execute(
+                "SELECT fetched_at, expires, last_modified, body FROM forecast_cache "
+                "WHERE location = ?",
+                (location,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "fetched_at": datetime.fromtimestamp(row["fetched_at"], timezone.utc),
+            "expires": (
+                datetime.fromtimestamp(row["expires"], timezone.utc) if row["expires"] else None
+            ),
+            "last_modified": row["last_modified"],
+            "body": bytes(row["body"]),
+        }
+
+    def save_forecast_issuance(
+        self,
+        location: str,
+        issued_at: datetime,
+        timeseries: list[dict],
+        *,
+        fetched_at: datetime | None = None,
+    ) -> bool:
+        """Arkiver én utgave av prognosen. Returnerer False hvis den finnes fra før.
+
+        ``timeseries`` er dicts med ``time`` og verdiene i ``FORECAST_FIELDS``.
+        Utgaven lagres som kolonner: ``offset`` (int32, sekunder fra første
+        tidspunkt) og én float32-kolonne per felt, komprimert til én BLOB.
+        """
+        if not timeseries:
+            return False
+        times = [_epoch(entry["time"]) for entry in timeseries]
+        columns = {"offset": array("i", (ts - times[0] for ts in times))}
+        for name in FORECAST_FIELDS:
+            columns[name] = array(
+                "f",
+                (
+                    math.nan if entry.get(name) is None else entry[name]
+                    for entry in timeseries
+                ),
+            )
+        cur = self._conn.execute(
+            """
+            INSERT OR IGNORE INTO forecast_issuances
+                (location, issued_at, fetched_at, valid_from, valid_until, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                location,
+                _epoch(issued_at),
+                _epoch(fetched_at),
+                times[0],
+                times[-1],
+                encode_npz(columns),
+            ),
+        )
+        self._conn.commit()
+        return cur.rowcount > 0
+
+    def get_forecast_at(self, location: str, moment: datetime) -> dict | None:
+        """Prognosen som var gjeldende på ``moment``: siste utgave hentet før da.
+
+        Utvalget går på ``fetched_at``, ikke ``issued_at``, slik at svaret er
+        prognosen kontrollsyklusen faktisk hadde — ikke en som met.no hadde
+        publisert, men som ennå ikke var hentet.
+
+        Gir ``issued_at``, ``fetched_at`` og ``timeseries`` i samme form som
+        ``/api/weather`` (manglende verdier er None), eller None uten treff.
+        """
+        with self._reader() as conn:
+            row = conn.execute(
+                """
+                SELECT issued_at, fetched_at, valid_from, data FROM forecast_issuances
+                WHERE location = ? AND fetched_at <= ?
+                ORDER BY fetched_at DESC
+                LIMIT 1
+                """,
+                (location, _epoch(moment)),
+            ).fetchone()
+        if row is None:
+            return None
+        columns = decode_npz(bytes(row["data"]))
+        timeseries = []
+        for i, offset in enumerate(columns["offset"]):
+            entry = {"time": _iso(row["valid_from"] + offset)}
+            for name in FORECAST_FIELDS:
+                value = columns[name][i]
+                entry[name] = None if math.isnan(value) else round(value, 2)
+            timeseries.append(entry)
+        return {
+            "issued_at": _iso(row["issued_at"]),
+            "fetched_at": _iso(row["fetched_at"]),
+            "timeseries": timeseries,
+        }
+
+    def stats(self) -> dict:
+        """Databasestatistikk uten tabellskann.
+
+        Radantall kommer fra tellerne i ``table_stats``; størrelse fra
+        sideantallet (pluss WAL-filen for fil-databaser).
+        """
+        with self._reader() as conn:
+            counts = dict(conn.execute("SELECT name, row_count FROM table_stats").fetchall())
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        wal_bytes = 0
+        if self._wal:
+            wal_path = Path(self._path + "-wal")
+            wal_bytes = wal_path.stat().st_size if wal_path.exists() else 0
+
+        return {
+            "size_bytes": page_count * page_size + wal_bytes,
+            "free_bytes": free_pages * page_size,
+            "wal_bytes": wal_bytes,
+            "tables": {table: counts.get(table, 0) for table in _COUNTED_TABLES},
+            "pending_rows": self.pending_rows,
+        }
 
     def close(self) -> None:
+        self.flush()
+        if self._readers is not None:
+            while not self._readers.empty():
+                self._readers.get_nowait().close()
         self._conn.close()
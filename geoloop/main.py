@@ -1,24 +1,31 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import logging
 from datetime import datetime, timezone
 from typing import TYPE_CHECKING
 
 import uvicorn
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED, JobEvent
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from geoloop.config import load_config
 from geoloop.controller.stub import StubController
+from geoloop.db.async_store import AsyncStore
 from geoloop.db.store import Store
 from geoloop.engine.ice_risk import evaluate
 from geoloop.engine.models import HeatingDecision, IceRiskLevel, SensorReadings
-from geoloop import notify
+from geoloop import broadcast, metrics, notify
+from geoloop.sensors.acquire import DEFAULT_TIMEOUT_SECONDS, acquire
+from geoloop.sensors.snapshot import SensorSnapshot
 from geoloop.sensors.stub import StubSensor
 from geoloop.weather.met_client import MetClient
 from geoloop.web.app import app, configure, get_manual_override, get_thresholds
 
 if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
     from geoloop.config import AppConfig
     from geoloop.controller.base import HeatingController
     from geoloop.sensors.base import TemperatureSensor
@@ -26,6 +33,26 @@ if TYPE_CHECKING:
 logger = logging.getLogger("geoloop")
 
 
+def _timed_job(job: str):
+    """Mål varigheten av en planlagt jobb under navnet ``job``."""
+    def decorator(func: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> None:
+            with metrics.JOB_SECONDS.time(job=job):
+                await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _on_job_event(event: JobEvent) -> None:
+    """Registrer forsinkelse og tapte kjøringer fra scheduleren."""
+    if event.code == EVENT_JOB_SUBMITTED:
+        late = datetime.now(timezone.utc) - max(event.scheduled_run_times)
+        metrics.JOB_LATENESS_SECONDS.observe(max(late.total_seconds(), 0.0), job=event.job_id)
+    elif event.code == EVENT_JOB_MISSED:
+        metrics.JOB_MISSED.inc(job=event.job_id)
+
+
 def _create_sensors(cfg: AppConfig) -> dict[str, TemperatureSensor]:
     """Opprett sensorer basert på config. Faller tilbake til stubs."""
     sensors: dict[str, TemperatureSensor] = {}
@@ -89,13 +116,14 @@ def _create_controller(cfg: AppConfig) -> HeatingController:
         return StubController()
 
 
-async def _read_all_sensors(
-    sensors: dict[str, TemperatureSensor],
-) -> SensorReadings:
-    """Les alle sensorer og returner SensorReadings."""
-    values: dict[str, float | None] = {}
-    for name, sensor in sensors.items():
-        values[name] = await sensor.read()
+def _sensor_timeouts(cfg: AppConfig) -> dict[str, float]:
+    """Tidsfrist per sensor fra config (standard for sensorer uten egen verdi)."""
+    if cfg.sensors is None:
+        return {}
+    return {name: s.timeout_seconds for name, s in cfg.sensors.items()}
+
+
+def _to_readings(values: dict[str, float | None]) -> SensorReadings:
     return SensorReadings(
         loop_inlet=values.get("loop_inlet"),
         loop_outlet=values.get("loop_outlet"),
@@ -105,37 +133,75 @@ async def _read_all_sensors(
     )
 
 
+async def _read_all_sensors(
+    sensors: dict[str, TemperatureSensor],
+    timeout: float | dict[str, float] = DEFAULT_TIMEOUT_SECONDS,
+) -> SensorReadings:
+    """Les alle sensorer samtidig og returner SensorReadings."""
+    return _to_readings(await acquire(sensors, timeout))
+
+
+@_timed_job("sensor_poll")
 async def _sensor_poll(
-    store: Store,
+    store: AsyncStore,
     sensors: dict[str, TemperatureSensor],
+    snapshot: SensorSnapshot | None = None,
+    timeout: float | dict[str, float] = DEFAULT_TIMEOUT_SECONDS,
 ) -> None:
-    """Les alle sensorer og logg til database (kjøres hvert minutt)."""
+    """Les alle sensorer, oppdater snapshotet og logg til database (hvert minutt).
+
+    Dette er den eneste faste avlesningen; kontrollsyklusen gjenbruker
+    resultatet via snapshotet.
+    """
     try:
         cycle_ts = datetime.now(timezone.utc)
-        for name, sensor in sensors.items():
-            value = await sensor.read()
-            if value is not None:
-                store.log_sensor(name, value, timestamp=cycle_ts)
+        values = await acquire(sensors, timeout)
+        if snapshot is None:
+            snapshot = SensorSnapshot()
+        snapshot.update(values, cycle_ts)
+        await store.log_sensors(values, timestamp=cycle_ts)
+        # Dashboardet viser siste gyldige verdi og merker utdaterte sensorer
+        broadcast.publish("sensors", {
+            "timestamp": cycle_ts.isoformat(timespec="seconds"),
+            "sensors": snapshot.values(),
+            "stale_sensors": snapshot.stale_sensors(cycle_ts),
+        })
     except Exception:
         logger.exception("Feil i sensorpolling")
+        metrics.JOB_FAILURES.inc(job="sensor_poll")
+
+
+@_timed_job("forecast_prefetch")
+async def _prefetch_forecast(met_client: MetClient, lat: float, lon: float) -> None:
+    """Hent ny værprognose i bakgrunnen like før den gamle utløper."""
+    try:
+        await met_client.refresh_if_due(lat, lon)
+    except Exception:
+        logger.warning("Forhåndshenting av værprognose feilet", exc_info=True)
+        metrics.JOB_FAILURES.inc(job="forecast_prefetch")
 
 
-def _run_compaction(store: Store) -> None:
+@_timed_job("compaction")
+async def _run_compaction(store: AsyncStore) -> None:
     """Kjør rullerende kompaktering av sensordata."""
     try:
-        store.compact_sensor_data()
+        await store.compact_sensor_data()
         logger.info("Kompaktering av sensordata fullført")
     except Exception:
         logger.exception("Feil i kompaktering")
+        metrics.JOB_FAILURES.inc(job="compaction")
 
 
+@_timed_job("control_loop")
 async def _control_loop(
     met_client: MetClient,
-    store: Store,
+    store: AsyncStore,
     controller: HeatingController,
     sensors: dict[str, TemperatureSensor],
     lat: float,
     lon: float,
+    snapshot: SensorSnapshot | None = None,
+    timeout: float | dict[str, float] = DEFAULT_TIMEOUT_SECONDS,
 ) -> None:
     """Kontrollsyklus: les sensorer → hent vær → evaluer → handle → logg."""
     try:
@@ -148,13 +214,32 @@ async def _control_loop(
             )
             return
 
-        # Les sensorer for evaluering (logging gjøres av _sensor_poll)
-        readings = await _read_all_sensors(sensors)
+        # Gjenbruk siste sensorpolling; les bare selv hvis den er for gammel
+        if snapshot is not None and snapshot.fresh():
+            readings = _to_readings(snapshot.fresh_values())
+        else:
+            readings = await _read_all_sensors(sensors, timeout)
 
         # Hent værdata
         forecast = await met_client.fetch_forecast(lat, lon)
+        if not forecast.usable:
+            # Prognosen dekker for det meste fortiden; behold releene som de er
+            logger.warning(
+                "Kontrollsyklus: værprognosen utløp %s — hopper over evaluering",
+                forecast.expires.isoformat(timespec="seconds"),
+            )
+            await store.log_event("error", "Værprognosen er for gammel til å styre varmen")
+            return
+        if forecast.stale:
+            logger.info("Kontrollsyklus: bruker utløpt værprognose mens ny hentes")
         c = forecast.current
-        store.log_weather(
+        broadcast.publish("weather", {
+            "air_temperature": c.air_temperature,
+            "precipitation_amount": c.precipitation_amount,
+            "relative_humidity": c.relative_humidity,
+            "wind_speed": c.wind_speed,
+        })
+        await store.log_weather(
             temperature=c.air_temperature,
             precipitation=c.precipitation_amount,
             humidity=c.relative_humidity,
@@ -179,7 +264,8 @@ async def _control_loop(
         # Handle beslutning
         if result.decision == HeatingDecision.TURN_ON and not currently_on:
             await controller.turn_on()
-            store.log_event("heating_on", result.reason)
+            broadcast.publish("heating", {"on": True, "mode": "auto"})
+            await store.log_event("heating_on", result.reason)
             if result.risk_level == IceRiskLevel.HIGH:
                 await notify.send(
                     "Isfare — varme PÅ",
@@ -189,7 +275,8 @@ async def _control_loop(
                 )
         elif result.decision == HeatingDecision.TURN_OFF and currently_on:
             await controller.turn_off()
-            store.log_event("heating_off", result.reason)
+            broadcast.publish("heating", {"on": False, "mode": "auto"})
+            await store.log_event("heating_off", result.reason)
 
         logger.info(
             "Kontrollsyklus: %s (risiko=%s, beslutning=%s)",
@@ -200,7 +287,8 @@ async def _control_loop(
 
     except Exception:
         logger.exception("Feil i kontrollsyklus")
-        store.log_event("error", "Feil i kontrollsyklus")
+        metrics.JOB_FAILURES.inc(job="control_loop")
+        await store.log_event("error", "Feil i kontrollsyklus")
 
 
 async def main() -> None:
@@ -210,10 +298,20 @@ async def main() -> None:
     )
 
     cfg = load_config()
-    store = Store(cfg.database.path)
-    met_client = MetClient(cfg.weather.user_agent)
+    store = AsyncStore(Store(
+        cfg.database.path,
+        flush_interval=cfg.database.flush_interval_seconds,
+        flush_max_rows=cfg.database.flush_max_rows,
+        wal=cfg.database.wal,
+        read_pool_size=cfg.database.read_pool_size,
+        archive_dir=cfg.database.archive_dir,
+    ))
+    met_client = MetClient(cfg.weather.user_agent, cache=store)
+    await met_client.restore(cfg.location.lat, cfg.location.lon)
     sensors = _create_sensors(cfg)
     controller = _create_controller(cfg)
+    snapshot = SensorSnapshot()
+    timeouts = _sensor_timeouts(cfg)
 
     configure(
         met_client=met_client,
@@ -223,35 +321,52 @@ async def main() -> None:
         sensors=sensors,
         controller=controller,
         config=cfg,
+        snapshot=snapshot,
+        sensor_timeouts=timeouts,
     )
 
-    store.log_event("startup", "GeoLoop startet")
+    await store.log_event("startup", "GeoLoop startet")
 
     scheduler = AsyncIOScheduler()
+    scheduler.add_listener(_on_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
     scheduler.add_job(
         _sensor_poll,
         "interval",
         minutes=1,
-        args=[store, sensors],
+        id="sensor_poll",
+        args=[store, sensors, snapshot, timeouts],
     )
     scheduler.add_job(
         _control_loop,
         "interval",
         minutes=10,
-        args=[met_client, store, controller, sensors, cfg.location.lat, cfg.location.lon],
+        id="control_loop",
+        args=[
+            met_client, store, controller, sensors, cfg.location.lat, cfg.location.lon, snapshot,
+            timeouts,
+        ],
+    )
+    scheduler.add_job(
+        _prefetch_forecast,
+        "interval",
+        minutes=1,
+        id="forecast_prefetch",
+        args=[met_client, cfg.location.lat, cfg.location.lon],
     )
     scheduler.add_job(
         _run_compaction,
         "interval",
         hours=1,
+        id="compaction",
         args=[store],
     )
     scheduler.start()
 
     # Kjør sensorpolling og kontrollsyklus umiddelbart ved oppstart
-    await _sensor_poll(store, sensors)
+    await _sensor_poll(store, sensors, snapshot, timeouts)
     await _control_loop(
-        met_client, store, controller, sensors, cfg.location.lat, cfg.location.lon
+        met_client, store, controller, sensors, cfg.location.lat, cfg.location.lon, snapshot,
+        timeouts,
     )
 
     server = uvicorn.Server(
@@ -269,7 +384,8 @@ async def main() -> None:
         scheduler.shutdown()
         if hasattr(controller, "close"):
             controller.close()
-        store.close()
+        await met_client.close()
+        await store.close()
 
 
 def run() -> None:
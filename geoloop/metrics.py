@@ -0,0 +1,227 @@
+"""Enkle prosessinterne målinger i Prometheus-tekstformat.
+
+Tellere og histogrammer registreres én gang på modulnivå og oppdateres fra
+event-loopen og databasetrådene. Hver observasjon koster et binærsøk og en
+låst addisjon, så målingene kan stå på permanent på Pi-en. ``render`` gir
+innholdet til ``/metrics``.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+# Sekunder; dekker alt fra SQLite-oppslag (ms) til met.no-kall (s)
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_registry: dict[str, Counter | Histogram] = {}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        if name in _registry:
+            raise ValueError(f"Måling {name} er allerede registrert")
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if labels.keys() != set(self.labels):
+            raise ValueError(f"{self.name} forventer etikettene {self.labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotont økende teller."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            *self._header(),
+            *(
+                f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in values
+            ),
+        ]
+
+
+class _Series:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.total = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """Histogram med faste bøttegrenser (kumulativt ved utskrift)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets) + 1)
+            series.counts[index] += 1
+            series.total += value
+            series.count += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Mål varigheten av en blokk (også når den kaster unntak)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return series.count if series else 0
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        with self._lock:
+            snapshot = [
+                (key, list(s.counts), s.total, s.count) for key, s in sorted(self._series.items())
+            ]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    """Alle registrerte målinger i Prometheus' tekstformat (versjon 0.0.4)."""
+    lines: list[str] = []
+    for metric in _registry.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """Nullstill alle verdier (registreringene beholdes). Brukes i tester."""
+    for metric in _registry.values():
+        with metric._lock:
+            if isinstance(metric, Counter):
+                metric._values.clear()
+            else:
+                metric._series.clear()
+
+
+# --- Målingene GeoLoop eksporterer ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "geoloop_http_request_duration_seconds",
+    "Behandlingstid per rute og statuskode.",
+    ("method", "route", "status"),
+)
+JOB_SECONDS = Histogram(
+    "geoloop_job_duration_seconds",
+    "Varighet av planlagte jobber.",
+    ("job",),
+)
+JOB_LATENESS_SECONDS = Histogram(
+    "geoloop_job_lateness_seconds",
+    "Forsinkelse fra planlagt tidspunkt til jobben startet.",
+    ("job",),
+)
+JOB_FAILURES = Counter(
+    "geoloop_job_failures_total",
+    "Planlagte jobber som feilet.",
+    ("job",),
+)
+JOB_MISSED = Counter(
+    "geoloop_job_missed_total",
+    "Planlagte kjøringer som ble hoppet over fordi de kom for sent.",
+    ("job",),
+)
+SENSOR_READ_SECONDS = Histogram(
+    "geoloop_sensor_read_duration_seconds",
+    "Varighet av én sensoravlesning.",
+    ("sensor",),
+)
+SENSOR_READ_FAILURES = Counter(
+    "geoloop_sensor_read_failures_total",
+    "Sensoravlesninger som feilet eller gikk ut på tid.",
+    ("sensor", "reason"),
+)
+MET_FETCH_SECONDS = Histogram(
+    "geoloop_met_fetch_duration_seconds",
+    "Varighet av HTTP-kall mot api.met.no.",
+)
+MET_CACHE_REQUESTS = Counter(
+    "geoloop_met_cache_requests_total",
+    "Forespørsler etter prognose: fersk (hit), utløpt (stale), ventet på "
+    "nedlasting (miss), delt med pågående henting (shared) eller utilgjengelig.",
+    ("result",),
+)
+DB_QUERY_SECONDS = Histogram(
+    "geoloop_db_query_duration_seconds",
+    "Tid brukt i SQLite per Store-operasjon (uten køtid).",
+    ("operation",),
+)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from geoloop import metrics
+
+if TYPE_CHECKING:
+    from geoloop.sensors.base import TemperatureSensor
+
+logger = logging.getLogger(__name__)
+
+# DS18B20 bruker ~750 ms per konvertering ved 12-bit oppløsning
+DEFAULT_TIMEOUT_SECONDS = 2.0
+
+
+async def _read_with_deadline(
+    name: str, sensor: TemperatureSensor, timeout: float
+) -> float | None:
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(sensor.read(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Sensor %s svarte ikke innen %.1f s", name, timeout)
+        metrics.SENSOR_READ_FAILURES.inc(sensor=name, reason="timeout")
+    except Exception:
+        logger.exception("Feil ved lesing av sensor %s", name)
+        metrics.SENSOR_READ_FAILURES.inc(sensor=name, reason="error")
+    finally:
+        metrics.SENSOR_READ_SECONDS.observe(time.perf_counter() - start, sensor=name)
+    return None
+
+
+async def acquire(
+    sensors: dict[str, TemperatureSensor],
+    timeout: float | dict[str, float] = DEFAULT_TIMEOUT_SECONDS,
+) -> dict[str, float | None]:
+    """Les alle sensorer samtidig, hver med egen tidsfrist.
+
+    En sensor som feiler eller ikke svarer i tide gir None uten å påvirke
+    de andre, så total tid begrenses av den tregeste sensoren (maks
+    tidsfristen) i stedet for summen. ``timeout`` kan være felles eller
+    angis per sensornavn.
+    """
+    names = list(sensors)
+    values = await asyncio.gather(*(
+        _read_with_deadline(
+            name,
+            sensors[name],
+            timeout.get(name, DEFAULT_TIMEOUT_SECONDS) if isinstance(timeout, dict) else timeout,
+        )
+        for name in names
+    ))
+    return dict(zip(names, values))
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+# Sensorpollingen går hvert minutt; tre tapte sykluser regnes som utdatert
+STALE_AFTER_SECONDS = 180.0
+
+
+@dataclass(frozen=True)
+class Reading:
+    """Siste gyldige avlesning for én sensor."""
+
+    value: float
+    timestamp: datetime
+
+
+class SensorSnapshot:
+    """Siste avlesning per sensor, holdt i minnet for hele prosessen.
+
+    Oppdateres av sensorpollingen; API-et leser herfra i stedet for å
+    starte en ny 1-Wire-konvertering per forespørsel. En mislykket
+    avlesning (None) overskriver ikke forrige verdi, slik at en sensor som
+    faller ut blir synlig som utdatert.
+    """
+
+    def __init__(self, stale_after: float = STALE_AFTER_SECONDS) -> None:
+        self._stale_after = stale_after
+        self._readings: dict[str, Reading] = {}
+        self._names: list[str] = []
+        self._updated_at: datetime | None = None
+
+    @property
+    def empty(self) -> bool:
+        return self._updated_at is None
+
+    @property
+    def updated_at(self) -> datetime | None:
+        """Tidspunkt for siste oppdatering (uansett om alle sensorer svarte)."""
+        return self._updated_at
+
+    def update(
+        self, values: dict[str, float | None], timestamp: datetime | None = None
+    ) -> None:
+        timestamp = timestamp or datetime.now(timezone.utc)
+        for name, value in values.items():
+            if name not in self._names:
+                self._names.append(name)
+            if value is not None:
+                self._readings[name] = Reading(value, timestamp)
+        self._updated_at = timestamp
+
+    def get(self, name: str) -> Reading | None:
+        return self._readings.get(name)
+
+    def values(self) -> dict[str, float | None]:
+        """Siste verdi per sensor (None hvis sensoren aldri har svart)."""
+        return {
+            name: reading.value if (reading := self._readings.get(name)) else None
+            for name in self._names
+        }
+
+    def fresh_values(self, now: datetime | None = None) -> dict[str, float | None]:
+        """Som ``values``, men None for sensorer som er utdatert."""
+        stale = set(self.stale_sensors(now))
+        return {name: None if name in stale else value for name, value in self.values().items()}
+
+    def age_seconds(self, now: datetime | None = None) -> float | None:
+        """Alder på siste oppdatering i sekunder."""
+        if self._updated_at is None:
+            return None
+        now = now or datetime.now(timezone.utc)
+        return (now - self._updated_at).total_seconds()
+
+    def fresh(self, now: datetime | None = None) -> bool:
+        """True hvis snapshotet er oppdatert innenfor ``stale_after``."""
+        age = self.age_seconds(now)
+        return age is not None and age <= self._stale_after
+
+    def stale_sensors(self, now: datetime | None = None) -> list[str]:
+        """Sensorer uten gyldig avlesning innenfor ``stale_after``."""
+        now = now or datetime.now(timezone.utc)
+        return [
+            name
+            for name in self._names
+            if (reading := self._readings.get(name)) is None
+            or (now - reading.timestamp).total_seconds() > self._stale_after
+        ]
+
+    def describe(self, now: datetime | None = None) -> dict:
+        """Metadata for API-svar: tidspunkt, alder og utdaterte sensorer."""
+        now = now or datetime.now(timezone.utc)
+        age = self.age_seconds(now)
+        stale_sensors = self.stale_sensors(now)
+        return {
+            "updated_at": self._updated_at.isoformat() if self._updated_at else None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": age is None or age > self._stale_after or bool(stale_sensors),
+            "stale_sensors": stale_sensors,
+        }
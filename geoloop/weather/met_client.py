@@ -1,11 +1,42 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from datetime import datetime, timezone
+import asyncio
+import importlib.util
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
 from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING
 
 import httpx
 
+from geoloop import metrics
+
+# httpx trenger den valgfrie avhengigheten h2 for HTTP/2
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+if TYPE_CHECKING:
+    from geoloop.db.async_store import AsyncStore
+
+logger = logging.getLogger(__name__)
+
+# met.no svarer normalt på under et sekund; gi opp før kontrollsyklusen henger
+_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+_LIMITS = httpx.Limits(max_connections=2, max_keepalive_connections=1, keepalive_expiry=120.0)
+
+# Bakgrunnshentingen starter så lenge før Expires
+PREFETCH_MARGIN = timedelta(minutes=2)
+
+# En utløpt prognose brukes høyst så lenge etter Expires; deretter dekker
+# timeseries[:24] for mye av fortiden til å styre varmen
+MAX_STALENESS = timedelta(hours=3)
+
+# Ventetid før nytt forsøk etter feil mot met.no (dobles opp til maks)
+RETRY_BACKOFF_MIN = timedelta(seconds=30)
+RETRY_BACKOFF_MAX = timedelta(minutes=15)
+
 _FORECAST_URL = (
     "https://api.met.no/weatherapi/locationforecast/2.0/compact"
 )
@@ -24,6 +55,22 @@ class WeatherSnapshot:
 class WeatherForecast:
     current: WeatherSnapshot
     timeseries: list[WeatherSnapshot] = field(default_factory=list)
+    expires: datetime | None = None
+    # Når met.no utstedte prognosen (``meta.updated_at``)
+    issued_at: datetime | None = None
+
+    @property
+    def stale(self) -> bool:
+        """True når ``Expires`` er passert og en ny prognose er underveis."""
+        return self.expires is not None and datetime.now(timezone.utc) >= self.expires
+
+    @property
+    def usable(self) -> bool:
+        """False når prognosen er utløpt for mer enn ``MAX_STALENESS`` siden."""
+        return (
+            self.expires is None
+            or datetime.now(timezone.utc) < self.expires + MAX_STALENESS
+        )
 
 
 def _parse_timeseries_entry(entry: dict) -> WeatherSnapshot:
@@ -44,45 +91,281 @@ def _parse_timeseries_entry(entry: dict) -> WeatherSnapshot:
     )
 
 
+def _parse_forecast(data: dict) -> WeatherForecast:
+    snapshots = [_parse_timeseries_entry(e) for e in data["properties"]["timeseries"]]
+    updated_at = data["properties"].get("meta", {}).get("updated_at")
+    return WeatherForecast(
+        current=snapshots[0],
+        timeseries=snapshots[1:],
+        issued_at=datetime.fromisoformat(updated_at) if updated_at else None,
+    )
+
+
+def _location_key(lat: float, lon: float) -> str:
+    # met.no avrunder selv til 4 desimaler
+    return f"{lat:.4f},{lon:.4f}"
+
+
 class MetClient:
-    """Asynkron klient for api.met.no locationforecast."""
+    """Asynkron klient for api.met.no locationforecast.
+
+    Én langlivet ``httpx.AsyncClient`` gjenbrukes mellom kall (keep-alive,
+    og HTTP/2 hvis ``h2`` er installert). Etter første nedlasting sendes
+    ``If-Modified-Since``; ``304 Not Modified`` forlenger bare ``Expires``
+    for prognosen vi allerede har, slik met.no ber om i vilkårene.
 
-    def __init__(self, user_agent: str) -> None:
+    Prognosen serveres etter stale-while-revalidate: en utløpt prognose
+    returneres straks (``stale`` er True) mens en ny hentes i bakgrunnen,
+    og ``refresh_if_due`` henter på forhånd like før ``Expires``. Bare når
+    det ikke finnes noen prognose i det hele tatt, venter kalleren på
+    met.no. En prognose utløpt for mer enn ``MAX_STALENESS`` siden er ikke
+    ``usable``; kontrollsyklusen styrer ikke etter den. Samtidige hentinger
+    for samme posisjon deler én forespørsel (single-flight), og etter en
+    feil venter nye forsøk med økende backoff.
+
+    Med ``cache`` lagres hver nedlastet prognose (rå JSON pluss
+    ``Expires``/``Last-Modified``) i databasen, slik at ``restore`` kan
+    gjenopprette den etter omstart uten et nytt kall mot met.no. Hver ny
+    utgave (etter ``meta.updated_at``) arkiveres i tillegg kompakt, og
+    ``forecast_at`` gir prognosen som gjaldt på et tidligere tidspunkt.
+    """
+
+    def __init__(self, user_agent: str, cache: AsyncStore | None = None) -> None:
         self._user_agent = user_agent
+        self._cache = cache
+        self._client: httpx.AsyncClient | None = None
         self._expires: datetime | None = None
+        self._last_modified: str | None = None
+        self._last_body: bytes | None = None
         self._last_forecast: WeatherForecast | None = None
+        self._inflight: dict[str, asyncio.Task[WeatherForecast]] = {}
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": self._user_agent},
+                timeout=_TIMEOUT,
+                limits=_LIMITS,
+                http2=_HTTP2,
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """Avbryt pågående hentinger og lukk den delte HTTP-klienten."""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def restore(self, lat: float, lon: float) -> bool:
+        """Last sist lagrede prognose fra cachen. Returnerer True ved treff.
+
+        Prognosen serveres av ``fetch_forecast`` med en gang, også om den er
+        utløpt; da revalideres den med ``If-Modified-Since`` i bakgrunnen.
+        En prognose utløpt for mer enn ``MAX_STALENESS`` siden lastes ikke.
+        """
+        if self._cache is None:
+            return False
+        try:
+            cached = await self._cache.load_forecast_cache(_location_key(lat, lon))
+            if cached is None:
+                return False
+            forecast = _parse_forecast(json.loads(cached["body"]))
+        except Exception:
+            logger.warning("Kunne ikke gjenopprette lagret værprognose", exc_info=True)
+            return False
+
+        forecast.expires = cached["expires"]
+        if not forecast.usable:
+            logger.info(
+                "Lagret værprognose utløp %s — for gammel, henter ny",
+                forecast.expires.isoformat(timespec="seconds"),
+            )
+            return False
+        self._last_forecast = forecast
+        self._last_body = cached["body"]
+        self._expires = cached["expires"]
+        self._last_modified = cached["last_modified"]
+        logger.info(
+            "Værprognose gjenopprettet fra cache (hentet %s, utløper %s)",
+            cached["fetched_at"].isoformat(timespec="seconds"),
+            self._expires.isoformat(timespec="seconds") if self._expires else "ukjent",
+        )
+        return True
 
     async def fetch_forecast(
-        self, lat: float, lon: float
+        self, lat: float, lon: float, *, wait: bool = True
     ) -> WeatherForecast:
-        """Hent værprognose. Bruker cache dersom Expires-header ikke er utløpt."""
-        now = datetime.now(timezone.utc)
-        if (
-            self._expires is not None
-            and now < self._expires
-            and self._last_forecast is not None
-        ):
-            return self._last_forecast
+        """Siste prognose, uten å vente på nettet når vi har en.
+
+        Er den utløpt, startes en revalidering i bakgrunnen og den gamle
+        returneres (``stale``, og uten ``usable`` når den er for gammel til å
+        styre etter). Uten noen prognose ventes det på met.no; under backoff
+        etter en feil kastes ``RuntimeError`` uten nytt kall. Med
+        ``wait=False`` (HTTP-handlere) startes hentingen i bakgrunnen og
+        ``RuntimeError`` kastes straks i stedet for å vente.
+        """
+        forecast = self._last_forecast
+        if forecast is None:
+            if self._backing_off():
+                metrics.MET_CACHE_REQUESTS.inc(result="unavailable")
+                raise RuntimeError(
+                    f"Værprognose utilgjengelig; nytt forsøk om "
+                    f"{self._retry_at - time.monotonic():.0f} s"
+                )
+            if not wait:
+                metrics.MET_CACHE_REQUESTS.inc(result="unavailable")
+                self._refresh_task(lat, lon)
+                raise RuntimeError("Værprognose ikke hentet ennå")
+            shared = _location_key(lat, lon) in self._inflight
+            metrics.MET_CACHE_REQUESTS.inc(result="shared" if shared else "miss")
+            return await asyncio.shield(self._refresh_task(lat, lon))
+        if self._due(timedelta(0)):
+            metrics.MET_CACHE_REQUESTS.inc(result="stale")
+            if not self._backing_off():
+                self._refresh_task(lat, lon)
+        else:
+            metrics.MET_CACHE_REQUESTS.inc(result="hit")
+        return forecast
+
+    async def refresh(self, lat: float, lon: float) -> WeatherForecast:
+        """Hent (eller revalider) prognosen nå og vent på resultatet."""
+        return await asyncio.shield(self._refresh_task(lat, lon))
+
+    async def refresh_if_due(
+        self, lat: float, lon: float, margin: timedelta = PREFETCH_MARGIN
+    ) -> bool:
+        """Hent på forhånd når prognosen utløper innen ``margin``.
+
+        Kalles jevnlig fra scheduleren. Returnerer True hvis en henting ble
+        gjort (eller det ble ventet på en som allerede pågikk). Under backoff
+        etter en feil hoppes det over.
+        """
+        if self._last_forecast is not None and not self._due(margin):
+            return False
+        if self._backing_off():
+            return False
+        await self.refresh(lat, lon)
+        return True
+
+    async def forecast_at(self, lat: float, lon: float, moment: datetime) -> dict | None:
+        """Arkivert prognose som var gjeldende på ``moment``, eller None."""
+        if self._cache is None:
+            return None
+        return await self._cache.get_forecast_at(_location_key(lat, lon), moment)
+
+    def _due(self, margin: timedelta) -> bool:
+        return self._expires is None or datetime.now(timezone.utc) + margin >= self._expires
+
+    def _backing_off(self) -> bool:
+        return time.monotonic() < self._retry_at
+
+    def _refresh_task(self, lat: float, lon: float) -> asyncio.Task[WeatherForecast]:
+        """Pågående henting for posisjonen, eller en ny."""
+        key = _location_key(lat, lon)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download(lat, lon))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return task
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
+    def _finish(self, key: str, task: asyncio.Task[WeatherForecast]) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Bakgrunnshentinger har ingen kaller; logg feilen her
+            exc = task.exception()
+            if exc is not None:
+                logger.warning("Henting av værprognose feilet: %s", exc)
+
+    async def _download(self, lat: float, lon: float) -> WeatherForecast:
+        """Én delt henting per posisjon; feil gir økende backoff."""
+        try:
+            forecast = await self._request(lat, lon)
+        except Exception:
+            self._failures += 1
+            delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_MIN * 2 ** (self._failures - 1))
+            self._retry_at = time.monotonic() + delay.total_seconds()
+            raise
+        self._failures = 0
+        self._retry_at = 0.0
+        return forecast
+
+    async def _request(self, lat: float, lon: float) -> WeatherForecast:
+        """Selve HTTP-kallet mot met.no."""
+        headers = {}
+        if self._last_forecast is not None and self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+        with metrics.MET_FETCH_SECONDS.time():
+            resp = await self._http().get(
                 _FORECAST_URL,
                 params={"lat": lat, "lon": lon},
-                headers={"User-Agent": self._user_agent},
+                headers=headers,
             )
+        if resp.status_code != 304 or self._last_forecast is None:
             resp.raise_for_status()
 
         expires_header = resp.headers.get("Expires")
         if expires_header:
             self._expires = parsedate_to_datetime(expires_header)
 
-        data = resp.json()
-        timeseries = data["properties"]["timeseries"]
+        if resp.status_code == 304:
+            logger.debug("Værprognose uendret (304), gyldig til %s", self._expires)
+            self._last_forecast.expires = self._expires
+            await self._touch(lat, lon)
+            return self._last_forecast
 
-        snapshots = [_parse_timeseries_entry(e) for e in timeseries]
-        forecast = WeatherForecast(
-            current=snapshots[0],
-            timeseries=snapshots[1:],
-        )
+        self._last_modified = resp.headers.get("Last-Modified")
+        forecast = _parse_forecast(resp.json())
+        forecast.expires = self._expires
         self._last_forecast = forecast
-        return forecast
+        self._last_body = resp.content
+        await self._save(lat, lon)
+        await self._archive(lat, lon, forecast)
+        return self._last_forecast
+
+    async def _save(self, lat: float, lon: float) -> None:
+        """Skriv prognosen til cachen. Feil logges; prognosen er uansett i minnet."""
+        if self._cache is None or self._last_body is None:
+            return
+        try:
+            await self._cache.save_forecast_cache(
+                _location_key(lat, lon),
+                self._last_body,
+                expires=self._expires,
+                last_modified=self._last_modified,
+            )
+        except Exception:
+            logger.warning("Kunne ikke lagre værprognose i cache", exc_info=True)
+
+    async def _touch(self, lat: float, lon: float) -> None:
+        """Forleng lagret prognose etter 304 uten å skrive hele JSON-en på nytt."""
+        if self._cache is None:
+            return
+        try:
+            if not await self._cache.touch_forecast_cache(
+                _location_key(lat, lon), expires=self._expires
+            ):
+                await self._save(lat, lon)
+        except Exception:
+            logger.warning("Kunne ikke oppdatere værprognose i cache", exc_info=True)
+
+    async def _archive(self, lat: float, lon: float, forecast: WeatherForecast) -> None:
+        """Legg utgaven i prognosearkivet (duplikater ignoreres). Feil logges."""
+        if self._cache is None:
+            return
+        issued_at = forecast.issued_at
+        if issued_at is None and self._last_modified:
+            issued_at = parsedate_to_datetime(self._last_modified)
+        try:
+            await self._cache.save_forecast_issuance(
+                _location_key(lat, lon),
+                issued_at or datetime.now(timezone.utc),
+                [asdict(s) for s in (forecast.current, *forecast.timeseries)],
+            )
+        except Exception:
+            logger.warning("Kunne ikke arkivere værprognose", exc_info=True)
@@ -1,27 +1,42 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
+import json
 import logging
+import math
 import os
 import secrets
 import socket
+import sys
 import time
-from collections import defaultdict
+from array import array
+from datetime import datetime, timezone
+from collections import OrderedDict, defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import (
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.middleware.gzip import GZipMiddleware
 
 if TYPE_CHECKING:
     from geoloop.config import AppConfig
     from geoloop.controller.base import HeatingController
-    from geoloop.db.store import Store
+    from geoloop.db.async_store import AsyncStore
     from geoloop.sensors.base import TemperatureSensor
     from geoloop.weather.met_client import MetClient, WeatherForecast
 
-from geoloop import notify
+from geoloop import broadcast, metrics, notify
+from geoloop.sensors.acquire import acquire
+from geoloop.sensors.snapshot import SensorSnapshot
+from geoloop.web.assets import AssetBundle
 
 logger = logging.getLogger(__name__)
 
@@ -41,8 +56,31 @@ _RATE_LIMIT_WINDOW = 300  # sekunder
 # CSRF tokens per session
 _csrf_tokens: dict[str, str] = {}
 
+# Bygges én gang ved import: hash-ede filnavn og gzip/brotli-varianter
+_assets = AssetBundle(_STATIC_DIR)
+
+# JSON under denne grensen er ikke verdt å komprimere
+_GZIP_MIN_SIZE = 500
+
+
+class _ApiGZipMiddleware:
+    """GZip for API-svar. SSE-strømmen slippes gjennom urørt (må ikke bufres),
+    og statiske filer er allerede forhåndskomprimert."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=_GZIP_MIN_SIZE)
+
+    async def __call__(self, scope, receive, send) -> None:
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        if path.startswith("/api/") and path != "/api/stream":
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
 app = FastAPI(title="GeoLoop", version="0.1.0")
-app.mount("/static", StaticFiles(directory=_STATIC_DIR), name="static")
+app.add_middleware(_ApiGZipMiddleware)
 
 
 def _get_client_ip(request: Request) -> str:
@@ -81,8 +119,8 @@ async def auth_middleware(request: Request, call_next):
     if path in ("/login", "/api/login") or path.startswith("/static/"):
         return await call_next(request)
 
-    # /api/status tillates uten auth (brukes av healthcheck)
-    if path == "/api/status":
+    # /api/status og /metrics tillates uten auth (healthcheck og Prometheus)
+    if path in ("/api/status", "/metrics"):
         return await call_next(request)
 
     token = request.cookies.get(_AUTH_COOKIE)
@@ -98,13 +136,55 @@ async def auth_middleware(request: Request, call_next):
 
     return await call_next(request)
 
+
+class _MetricsMiddleware:
+    """Mål behandlingstid per rute. Ytterst, så også avviste forespørsler telles.
+
+    Etiketten er rutemalen (``/static/{name}``), ikke selve stien, så antall
+    tidsserier holder seg lite. SSE-strømmen måles ikke (varer så lenge
+    klienten er tilkoblet).
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/api/stream":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            metrics.HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route or "unmatched",
+                status=str(status),
+            )
+
+
+app.add_middleware(_MetricsMiddleware)
+
 _met_client: MetClient | None = None
-_store: Store | None = None
+_store: AsyncStore | None = None
 _lat: float = 0.0
 _lon: float = 0.0
 _sensors: dict[str, TemperatureSensor] = {}
+_sensor_timeouts: dict[str, float] = {}
 _controller: HeatingController | None = None
 _config: AppConfig | None = None
+_snapshot = SensorSnapshot()
 
 # Manuell overstyring: "on", "off", eller None (auto)
 _manual_override: str | None = None
@@ -120,22 +200,30 @@ _thresholds: dict[str, float] = {
 
 def configure(
     met_client: MetClient,
-    store: Store,
+    store: AsyncStore,
     lat: float,
     lon: float,
     sensors: dict[str, TemperatureSensor] | None = None,
     controller: HeatingController | None = None,
     config: AppConfig | None = None,
+    snapshot: SensorSnapshot | None = None,
+    sensor_timeouts: dict[str, float] | None = None,
 ) -> None:
     """Sett opp delte avhengigheter for ruter."""
     global _met_client, _store, _lat, _lon, _sensors, _controller, _config, _thresholds
+    global _cache_salt, _snapshot, _sensor_timeouts
     _met_client = met_client
     _store = store
+    # Skrivevannmerket starter på 0 for hver Store; ny salt gjør gamle ETag-er ugyldige
+    _cache_salt = secrets.token_hex(8)
+    _response_cache.clear()
     _lat = lat
     _lon = lon
     _sensors = sensors or {}
+    _sensor_timeouts = sensor_timeouts or {}
     _controller = controller
     _config = config
+    _snapshot = snapshot or SensorSnapshot()
 
     if config and config.thresholds:
         t = config.thresholds
@@ -146,9 +234,9 @@ def configure(
 
 
 @app.get("/login")
-async def login_page() -> FileResponse:
+async def login_page(request: Request) -> Response:
     """Server login-side."""
-    return FileResponse(_STATIC_DIR / "login.html")
+    return _assets.response("login.html", request)
 
 
 @app.post("/api/login")
@@ -182,16 +270,22 @@ async def login(request: Request):
     return JSONResponse({"error": "Feil passord"}, status_code=401)
 
 
+@app.get("/static/{name}")
+async def static_file(name: str, request: Request) -> Response:
+    """Statiske filer; hash-ede navn caches som immutable."""
+    return _assets.response(name, request)
+
+
 @app.get("/")
-async def index() -> FileResponse:
+async def index(request: Request) -> Response:
     """Server dashboard."""
-    return FileResponse(_STATIC_DIR / "index.html")
+    return _assets.response("index.html", request)
 
 
 @app.get("/info")
-async def info_page() -> FileResponse:
+async def info_page(request: Request) -> Response:
     """Server informasjonsside."""
-    return FileResponse(_STATIC_DIR / "info.html")
+    return _assets.response("info.html", request)
 
 
 _HOST_IP = os.environ.get("HOST_IP", "")
@@ -243,20 +337,34 @@ async def system_info() -> dict:
 
     # Database stats
     if _store:
+        stats = await _store.stats()
+        tables = stats["tables"]
         info["database"] = {
-            "sensor_readings": len(_store.get_sensor_log(limit=999999)),
-            "weather_readings": len(_store.get_weather_log(limit=999999)),
-            "events": len(_store.get_events(limit=999999)),
+            "sensor_readings": tables["sensor_cycles"],
+            "weather_readings": tables["weather_log"],
+            "events": tables["system_events"],
+            "rollups": tables["sensor_rollups"],
+            "size_bytes": stats["size_bytes"],
         }
 
     return info
 
 
+@app.get("/metrics")
+async def metrics_endpoint() -> Response:
+    """Målinger i Prometheus' tekstformat."""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/api/status")
 async def status() -> dict:
     weather: WeatherForecast | None = None
     if _met_client:
-        weather = await _met_client.fetch_forecast(_lat, _lon)
+        try:
+            weather = await _met_client.fetch_forecast(_lat, _lon, wait=False)
+        except Exception:
+            # Helsesjekken skal ikke feile fordi met.no er nede
+            logger.warning("Værprognose utilgjengelig", exc_info=True)
 
     current = None
     if weather:
@@ -275,14 +383,13 @@ async def status() -> dict:
             "mode": "auto" if _manual_override is None else _manual_override,
         }
 
-    sensor_data = {}
-    for name, sensor in _sensors.items():
-        sensor_data[name] = await sensor.read()
-
+    await _ensure_snapshot()
     return {
         "weather": current,
+        "weather_stale": weather.stale if weather else None,
         "heating": heating,
-        "sensors": sensor_data,
+        "sensors": _snapshot.values(),
+        "sensor_snapshot": _snapshot.describe(),
         "thresholds": dict(_thresholds),
     }
 
@@ -292,10 +399,16 @@ async def weather() -> dict:
     if not _met_client:
         return {"error": "Værklient ikke konfigurert"}
 
-    forecast = await _met_client.fetch_forecast(_lat, _lon)
+    try:
+        forecast = await _met_client.fetch_forecast(_lat, _lon, wait=False)
+    except Exception:
+        logger.warning("Værprognose utilgjengelig", exc_info=True)
+        return {"error": "Værprognose utilgjengelig"}
     current = forecast.current
 
     return {
+        "stale": forecast.stale,
+        "expires": forecast.expires.isoformat() if forecast.expires else None,
         "current": {
             "time": current.time.isoformat(),
             "air_temperature": current.air_temperature,
@@ -316,13 +429,58 @@ async def weather() -> dict:
     }
 
 
+@app.get("/api/weather/archive")
+async def weather_archive(at: datetime | None = None) -> dict:
+    """Prognosen som var gjeldende på ``at`` (ISO-8601, standard nå).
+
+    Brukes til å sammenligne prognose mot faktisk målt vær i etterkant.
+    """
+    if not _met_client:
+        return {"error": "Værklient ikke konfigurert"}
+    archived = await _met_client.forecast_at(
+        _lat, _lon, _utc(at) or datetime.now(timezone.utc)
+    )
+    if archived is None:
+        return {"error": "Ingen arkivert prognose for tidspunktet"}
+    return archived
+
+
 @app.get("/api/sensors")
 async def sensors() -> dict:
-    """Les alle sensorer."""
-    data = {}
-    for name, sensor in _sensors.items():
-        data[name] = await sensor.read()
-    return {"sensors": data}
+    """Siste avlesning av alle sensorer, med alder og utdaterte sensorer."""
+    await _ensure_snapshot()
+    return {"sensors": _snapshot.values(), **_snapshot.describe()}
+
+
+async def _ensure_snapshot() -> None:
+    """Fyll snapshotet ved kald start, før første sensorpolling har kjørt."""
+    if not _snapshot.empty or not _sensors:
+        return
+    _snapshot.update(await acquire(_sensors, _sensor_timeouts))
+
+
+# Kommentarlinje som holder SSE-tilkoblingen åpen gjennom proxyer (Cloudflare)
+_STREAM_KEEPALIVE_SECONDS = 15
+
+
+@app.get("/api/stream")
+async def stream() -> StreamingResponse:
+    """Live-strøm (SSE) med sensoravlesninger, varmestatus, grenser og hendelser."""
+
+    async def events() -> AsyncIterator[bytes]:
+        async with broadcast.subscribe() as queue:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), _STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/api/heating/on")
@@ -335,9 +493,10 @@ async def heating_on() -> dict:
     _manual_override = "on"
     await _controller.turn_on()
     if _store:
-        _store.log_event("manual_on", "Manuell overstyring: varme PÅ (vedvarende)")
+        await _store.log_event("manual_on", "Manuell overstyring: varme PÅ (vedvarende)")
     logger.info("Manuell overstyring: varme PÅ (vedvarende)")
     await notify.send("Modus endret: PÅ", "Manuell overstyring: varme slått PÅ", tags="fire")
+    broadcast.publish("heating", {"on": True, "mode": "on"})
     return {"heating": {"on": True, "mode": "on"}}
 
 
@@ -351,9 +510,10 @@ async def heating_off() -> dict:
     _manual_override = "off"
     await _controller.turn_off()
     if _store:
-        _store.log_event("manual_off", "Manuell overstyring: varme AV (vedvarende)")
+        await _store.log_event("manual_off", "Manuell overstyring: varme AV (vedvarende)")
     logger.info("Manuell overstyring: varme AV (vedvarende)")
     await notify.send("Modus endret: AV", "Manuell overstyring: varme slått AV", tags="snowflake")
+    broadcast.publish("heating", {"on": False, "mode": "off"})
     return {"heating": {"on": False, "mode": "off"}}
 
 
@@ -366,9 +526,10 @@ async def heating_auto() -> dict:
     if _controller:
         on = await _controller.is_on()
     if _store:
-        _store.log_event("auto_mode", "Tilbake til automatisk styring")
+        await _store.log_event("auto_mode", "Tilbake til automatisk styring")
     logger.info("Tilbake til automatisk styring")
     await notify.send("Modus endret: AUTO", "Tilbake til automatisk styring", tags="robot_face")
+    broadcast.publish("heating", {"on": on, "mode": "auto"})
     return {"heating": {"on": on, "mode": "auto"}}
 
 
@@ -405,7 +566,7 @@ async def set_thresholds_api(request: Request) -> dict:
         return {"error": "critical_temp_min må være lavere enn critical_temp_max"}
 
     if _store:
-        _store.log_event("thresholds_changed", f"Nye grenser: {_thresholds}")
+        await _store.log_event("thresholds_changed", f"Nye grenser: {_thresholds}")
     logger.info("Temperaturgrenser oppdatert: %s", _thresholds)
     await notify.send(
         "Temperaturgrenser endret",
@@ -413,33 +574,218 @@ async def set_thresholds_api(request: Request) -> dict:
         f"Kritisk: {_thresholds['critical_temp_min']}°C til {_thresholds['critical_temp_max']}°C",
         tags="thermometer",
     )
+    broadcast.publish("thresholds", dict(_thresholds))
     return dict(_thresholds)
 
 
+# Svarformater for /api/history
+_HISTORY_FORMATS = ("rows", "columns", "f32", "ndjson")
+_DOWNSAMPLE_METHODS = ("avg", "lttb", "minmax")
+_NDJSON_CHUNK = 500  # punkter per linje
+
+
+def _pack_f32(columns: dict) -> bytes:
+    """Pakk kolonnene som little-endian binær.
+
+    ``uint32`` epoch-tidsstempler etterfulgt av én ``float32``-blokk per
+    sensor (i rekkefølgen fra ``X-Sensors``), der NaN er manglende verdi.
+    """
+    blocks = [array("I", columns["timestamps"])]
+    for values in columns["sensors"].values():
+        blocks.append(array("f", (math.nan if v is None else v for v in values)))
+    if sys.byteorder == "big":
+        for block in blocks:
+            block.byteswap()
+    return b"".join(block.tobytes() for block in blocks)
+
+
+def _ndjson_lines(columns: dict, header: dict) -> Iterator[bytes]:
+    """Første linje er metadata, deretter kolonnebiter på ``_NDJSON_CHUNK`` punkter."""
+    yield json.dumps({**header, "sensors": list(columns["sensors"])}).encode() + b"\n"
+    timestamps = columns["timestamps"]
+    for start in range(0, len(timestamps), _NDJSON_CHUNK):
+        end = start + _NDJSON_CHUNK
+        chunk = {
+            "timestamps": timestamps[start:end],
+            "sensors": {name: values[start:end] for name, values in columns["sensors"].items()},
+        }
+        yield json.dumps(chunk).encode() + b"\n"
+
+
+# Svarcache for /api/history og /api/log, nøklet på parametre + skrivevannmerke
+_RESPONSE_CACHE_SIZE = 32
+_response_cache: OrderedDict[str, tuple[bytes, str, dict[str, str]]] = OrderedDict()
+_cache_salt = secrets.token_hex(8)
+
+
+def _etag(key: tuple) -> str:
+    digest = hashlib.sha256(repr((_cache_salt, key)).encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+async def _cached_response(
+    request: Request, key: tuple, build: Callable[[], Awaitable[Response]]
+) -> Response:
+    """Svar fra cache, eller 304 hvis klienten allerede har denne versjonen.
+
+    ``key`` inneholder databasens skrivevannmerke, så ETag-en endres først
+    når nye rader er skrevet. Strømmede svar caches ikke, men får ETag.
+    """
+    etag = _etag(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    entry = _response_cache.get(etag)
+    if entry is None:
+        response = await build()
+        if isinstance(response, StreamingResponse):
+            response.headers.update(headers)
+            return response
+        extra = {k: v for k, v in response.headers.items() if k.startswith("x-")}
+        entry = (response.body, response.media_type, extra)
+        _response_cache[etag] = entry
+        while len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    else:
+        _response_cache.move_to_end(etag)
+
+    body, media_type, extra = entry
+    return Response(body, media_type=media_type, headers={**extra, **headers})
+
+
 @app.get("/api/history")
-async def history(hours: int = 24, limit: int = 0) -> dict:
-    """Sensorhistorikk og VP-perioder for tidsserie-graf."""
+async def history(
+    request: Request,
+    hours: int = 24,
+    limit: int = 0,
+    format: str = "rows",
+    downsample: str = "avg",
+):
+    """Sensorhistorikk og VP-perioder for tidsserie-graf.
+
+    ``downsample`` (``avg``, ``lttb`` eller ``minmax``) velger hvordan
+    serien reduseres til ``limit`` punkter.
+
+    ``format``:
+      rows    — én dict per punkt (standard)
+      columns — ``timestamps`` (epoch) + én verdiliste per sensor
+      f32     — kolonnene pakket binært, se ``_pack_f32`` (uten VP-perioder)
+      ndjson  — kolonnene strømmet i biter, én JSON-linje per bit
+    """
     if not _store:
         return {"error": "Database ikke konfigurert"}
+    if format not in _HISTORY_FORMATS:
+        return {"error": f"Ukjent format: {format}"}
+    if downsample not in _DOWNSAMPLE_METHODS:
+        return {"error": f"Ukjent nedsampling: {downsample}"}
 
     heating_on = False
     if _controller:
         heating_on = await _controller.is_on()
 
-    return {
-        "sensors": _store.get_sensor_history(hours=hours, limit=limit),
-        "heating_periods": _store.get_heating_periods(hours=hours),
+    key = ("history", hours, limit, format, downsample, heating_on, _store.write_version)
+    return await _cached_response(
+        request, key, lambda: _build_history(hours, limit, format, downsample, heating_on)
+    )
+
+
+async def _build_history(
+    hours: int, limit: int, format: str, downsample: str, heating_on: bool
+) -> Response:
+    if format == "rows":
+        return JSONResponse({
+            "sensors": await _store.get_sensor_history(
+                hours=hours, limit=limit, method=downsample
+            ),
+            "heating_periods": await _store.get_heating_periods(hours=hours),
+            "heating_on": heating_on,
+        })
+
+    columns = await _store.get_sensor_history_columns(
+        hours=hours, limit=limit, method=downsample
+    )
+    if format == "f32":
+        return Response(
+            _pack_f32(columns),
+            media_type="application/octet-stream",
+            headers={
+                "X-Sensors": ",".join(columns["sensors"]),
+                "X-Points": str(len(columns["timestamps"])),
+                "X-Heating-On": "1" if heating_on else "0",
+            },
+        )
+
+    header = {
+        "heating_periods": await _store.get_heating_periods(hours=hours),
         "heating_on": heating_on,
     }
+    if format == "ndjson":
+        return StreamingResponse(
+            _ndjson_lines(columns, header), media_type="application/x-ndjson"
+        )
+    return JSONResponse({**columns, **header})
+
+
+def _utc(value: datetime | None) -> datetime | None:
+    """Tolk tidspunkt uten tidssone som UTC."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _next_cursor(rows: list[dict], limit: int) -> int | None:
+    """``before_id`` for neste side, eller None når det ikke er flere rader."""
+    return rows[-1]["id"] if rows and len(rows) >= limit else None
 
 
 @app.get("/api/log")
-async def log(limit: int = 50) -> dict:
+async def log(
+    request: Request,
+    limit: int = 50,
+    before_id: int | None = None,
+    weather_before_id: int | None = None,
+    event_type: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    """Siste logg-rader, nyeste først.
+
+    Hendelser blas bakover med ``before_id`` og værloggen med
+    ``weather_before_id``; verdiene hentes fra ``next_before_id`` i forrige
+    svar. ``event_type`` filtrerer hendelser, og ``since``/``until``
+    (ISO-8601) avgrenser vær og hendelser i tid.
+    """
     if not _store:
         return {"error": "Database ikke konfigurert"}
+    since, until = _utc(since), _utc(until)
 
-    return {
-        "weather": _store.get_weather_log(limit=limit),
-        "sensors": _store.get_sensor_log(limit=limit),
-        "events": _store.get_events(limit=limit),
-    }
+    async def build() -> Response:
+        weather = await _store.get_weather_log(
+            limit=limit, before_id=weather_before_id, since=since, until=until
+        )
+        events = await _store.get_events(
+            limit=limit, before_id=before_id, event_type=event_type, since=since, until=until
+        )
+        return JSONResponse({
+            "weather": weather,
+            "sensors": await _store.get_sensor_log(limit=limit),
+            "events": events,
+            "next_before_id": {
+                "weather": _next_cursor(weather, limit),
+                "events": _next_cursor(events, limit),
+            },
+        })
+
+    key = (
+        "log", limit, before_id, weather_before_id, event_type, since, until,
+        _store.write_version,
+    )
+    return await _cached_response(request, key, build)
@@ -0,0 +1,142 @@
+"""Komprimerte statiske filer med innholdsbaserte filnavn.
+
+Ved oppstart leses ``static/`` inn én gang: hver fil får et navn med hash
+av innholdet (``app.3f2a9c1b0d.js``), en gzip-variant og — hvis
+``brotli`` er installert — en brotli-variant. HTML-sidene skrives om til å
+peke på de hash-ede navnene, slik at nettleseren kan cache JS/CSS for
+alltid og likevel får nye versjoner straks innholdet endres.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # valgfri avhengighet
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_COMPRESSIBLE = {".html", ".js", ".css", ".svg", ".json", ".txt"}
+_HASH_LENGTH = 10
+# /static/navn.ext med valgfri ?v=N (gammel cache-busting) i HTML
+_STATIC_REF = re.compile(r"/static/([\w.-]+?)(\?v=\w+)?(?=[\"'])")
+
+
+@dataclass(frozen=True)
+class Asset:
+    name: str
+    hashed_name: str
+    media_type: str
+    etag: str
+    body: bytes
+    gzip: bytes | None = None
+    br: bytes | None = None
+
+
+def _hashed_name(name: str, digest: str) -> str:
+    stem, dot, suffix = name.rpartition(".")
+    return f"{stem}.{digest}.{suffix}" if dot else f"{name}.{digest}"
+
+
+def _build(name: str, body: bytes, media_type: str) -> Asset:
+    digest = hashlib.sha256(body).hexdigest()[:_HASH_LENGTH]
+    compressible = Path(name).suffix in _COMPRESSIBLE
+    gz = gzip.compress(body, compresslevel=9, mtime=0) if compressible else None
+    br = brotli.compress(body, quality=11) if compressible and brotli else None
+    return Asset(
+        name=name,
+        hashed_name=_hashed_name(name, digest),
+        media_type=media_type,
+        etag=f'"{digest}"',
+        body=body,
+        gzip=gz if gz and len(gz) < len(body) else None,
+        br=br if br and len(br) < len(body) else None,
+    )
+
+
+def _media_type(name: str) -> str:
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type in ("application/javascript",):
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+class AssetBundle:
+    """Alle filer i en katalog, fingerprintet og forhåndskomprimert i minnet."""
+
+    def __init__(self, directory: Path) -> None:
+        self._assets: dict[str, Asset] = {}
+        self._by_hashed: dict[str, Asset] = {}
+        pages: dict[str, bytes] = {}
+
+        for path in sorted(p for p in directory.iterdir() if p.is_file()):
+            body = path.read_bytes()
+            if path.suffix == ".html":
+                pages[path.name] = body
+                continue
+            self._add(_build(path.name, body, _media_type(path.name)))
+
+        # HTML skrives om etter at alle andre filer har fått hash-navn
+        for name, body in pages.items():
+            self._add(_build(name, self._rewrite(body.decode()).encode(), _media_type(name)))
+
+        logger.info(
+            "Statiske filer klare: %d filer (brotli %s)",
+            len(self._assets),
+            "på" if brotli else "av",
+        )
+
+    def _add(self, asset: Asset) -> None:
+        self._assets[asset.name] = asset
+        self._by_hashed[asset.hashed_name] = asset
+
+    def _rewrite(self, html: str) -> str:
+        def replace(match: re.Match) -> str:
+            asset = self._assets.get(match.group(1))
+            return f"/static/{asset.hashed_name}" if asset else match.group(0)
+
+        return _STATIC_REF.sub(replace, html)
+
+    def url(self, name: str) -> str:
+        """Fingerprintet URL for en fil (``/static/app.<hash>.js``)."""
+        return f"/static/{self._assets[name].hashed_name}"
+
+    def response(self, name: str, request: Request) -> Response:
+        """Svar med beste tilgjengelige koding.
+
+        Hash-ede navn caches som ``immutable``; vanlige navn og HTML
+        revalideres med ETag.
+        """
+        asset = self._by_hashed.get(name)
+        cache_control = IMMUTABLE
+        if asset is None or asset.name.endswith(".html"):
+            asset = asset or self._assets.get(name)
+            cache_control = REVALIDATE
+        if asset is None:
+            return Response("Ikke funnet", status_code=404, media_type="text/plain")
+
+        headers = {"Cache-Control": cache_control, "ETag": asset.etag, "Vary": "Accept-Encoding"}
+        if asset.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        accepted = request.headers.get("accept-encoding", "")
+        body = asset.body
+        if asset.br is not None and "br" in accepted:
+            body, headers["Content-Encoding"] = asset.br, "br"
+        elif asset.gzip is not None and "gzip" in accepted:
+            body, headers["Content-Encoding"] = asset.gzip, "gzip"
+        return Response(body, media_type=asset.media_type, headers=headers)
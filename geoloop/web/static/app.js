@@ -39,16 +39,29 @@
         modeEl.textContent = labels[mode] || "";
     }
 
+    function renderHeating(heating) {
+        var el = document.getElementById("heating-status");
+        var on = heating.on;
+        el.className = "status-indicator " + (on ? "status-on" : "status-off");
+        el.querySelector(".label").textContent = on ? "PÅ" : "AV";
+        updateModeButtons(heating.mode || "auto");
+    }
+
+    function renderWeather(w) {
+        setText("w-temp", fmt(w.air_temperature, "\u00b0C"));
+        setText("w-precip", fmt(w.precipitation_amount, " mm"));
+        setText("w-humidity", fmt(w.relative_humidity, "%"));
+        setText("w-wind", fmt(w.wind_speed, " m/s"));
+    }
+
+    function markUpdated() {
+        document.getElementById("last-update").textContent =
+            "Oppdatert " + new Date().toLocaleTimeString("nb-NO");
+    }
+
     function updateStatus() {
         fetchJSON("/api/status").then(function (data) {
-            // Heating
-            var el = document.getElementById("heating-status");
-            if (data.heating) {
-                var on = data.heating.on;
-                el.className = "status-indicator " + (on ? "status-on" : "status-off");
-                el.querySelector(".label").textContent = on ? "PÅ" : "AV";
-                updateModeButtons(data.heating.mode || "auto");
-            }
+            if (data.heating) renderHeating(data.heating);
 
             // Thresholds
             if (data.thresholds) {
@@ -56,22 +69,12 @@
                 syncThresholdSliders(data.thresholds);
             }
 
-            // Weather
-            if (data.weather) {
-                var w = data.weather;
-                setText("w-temp", fmt(w.air_temperature, "\u00b0C"));
-                setText("w-precip", fmt(w.precipitation_amount, " mm"));
-                setText("w-humidity", fmt(w.relative_humidity, "%"));
-                setText("w-wind", fmt(w.wind_speed, " m/s"));
-            }
-
-            // Sensors
+            if (data.weather) renderWeather(data.weather);
             if (data.sensors) {
-                renderSensors(data.sensors);
+                renderSensors(data.sensors, (data.sensor_snapshot || {}).stale_sensors);
             }
 
-            document.getElementById("last-update").textContent =
-                "Oppdatert " + new Date().toLocaleTimeString("nb-NO");
+            markUpdated();
         }).catch(function () {
             document.getElementById("last-update").textContent = "Feil ved oppdatering";
         });
@@ -112,13 +115,15 @@
         tank: "Tank"
     };
 
-    function renderSensors(sensors) {
+    function renderSensors(sensors, staleSensors) {
+        staleSensors = staleSensors || [];
         var grid = document.getElementById("sensor-grid");
         grid.textContent = "";
         var hasKeys = false;
         for (var key in sensors) {
             hasKeys = true;
             var label = SENSOR_LABELS[key] || key;
+            if (staleSensors.indexOf(key) !== -1) label += " (utdatert)";
             var val = sensors[key];
             var div = document.createElement("div");
             div.className = "stat";
@@ -286,13 +291,14 @@
 
     function updateHistory() {
         var cfg = PERIOD_CFG[historyHours] || PERIOD_CFG[24];
-        var url = "/api/history?hours=" + historyHours + "&limit=" + cfg.limit;
+        var url = "/api/history?hours=" + historyHours + "&limit=" + cfg.limit + "&format=columns&downsample=minmax";
         fetchJSON(url).then(function (data) {
-            drawHistoryChart(data.sensors || [], data.heating_periods || [], !!data.heating_on);
+            drawHistoryChart(data.timestamps || [], data.sensors || {}, data.heating_periods || [], !!data.heating_on);
         }).catch(function () { /* ignore */ });
     }
 
-    function drawHistoryChart(rows, heatingPeriods, heatingOn) {
+    // timestamps: epoch-sekunder; series: { sensornavn: [verdi|null, ...] } med samme lengde
+    function drawHistoryChart(timestamps, series, heatingPeriods, heatingOn) {
         var canvas = document.getElementById("history-chart");
         if (!canvas) return;
         var ctx = canvas.getContext("2d");
@@ -309,7 +315,7 @@
 
         ctx.clearRect(0, 0, W, H);
 
-        if (!rows.length) {
+        if (!timestamps.length) {
             ctx.fillStyle = "#8a8a9a";
             ctx.font = "13px sans-serif";
             ctx.textAlign = "center";
@@ -324,9 +330,9 @@
         // Samle alle verdier for skalering
         var allVals = [];
         for (var k = 0; k < H_KEYS.length; k++) {
-            for (var i = 0; i < rows.length; i++) {
-                var v = rows[i][H_KEYS[k]];
-                if (v != null) allVals.push(v);
+            var col = series[H_KEYS[k]] || [];
+            for (var i = 0; i < col.length; i++) {
+                if (col[i] != null) allVals.push(col[i]);
             }
         }
         if (!allVals.length) return;
@@ -334,7 +340,7 @@
         var vMin = Math.floor(Math.min.apply(null, allVals) - 2);
         var vMax = Math.ceil(Math.max.apply(null, allVals)  + 2);
 
-        var times = rows.map(function (r) { return new Date(r.timestamp).getTime(); });
+        var times = timestamps.map(function (t) { return t * 1000; });
         var tMin  = times[0];
         var tMax  = times[times.length - 1];
         if (tMin >= tMax) tMax = tMin + 600000;
@@ -416,8 +422,9 @@
             ctx.lineWidth = 2;
             var started = false;
             var lx, ly, lv;
-            for (var i = 0; i < rows.length; i++) {
-                var v = rows[i][key];
+            var values = series[key] || [];
+            for (var i = 0; i < values.length; i++) {
+                var v = values[i];
                 if (v == null) continue;
                 var x = xP(times[i]), y = yP(v);
                 if (!started) { ctx.moveTo(x, y); started = true; }
@@ -562,13 +569,54 @@
         updateLog();
     }
 
+    // -- Live-strøm (SSE) --
+    // Serveren pusher endringer; full polling brukes bare uten EventSource.
+
+    function onStream(handler) {
+        return function (e) {
+            try { handler(JSON.parse(e.data)); } catch (err) { /* ignore */ }
+        };
+    }
+
+    function startStream() {
+        var source = new EventSource("/api/stream");
+        var lost = false;
+        source.addEventListener("sensors", onStream(function (data) {
+            renderSensors(data.sensors, data.stale_sensors);
+            markUpdated();
+            updateHistory();
+        }));
+        source.addEventListener("heating", onStream(renderHeating));
+        source.addEventListener("thresholds", onStream(function (data) {
+            currentThresholds = data;
+            syncThresholdSliders(data);
+        }));
+        source.addEventListener("weather", onStream(function (data) {
+            renderWeather(data);
+            updateForecast();
+        }));
+        source.addEventListener("event", onStream(updateLog));
+        source.onerror = function () {
+            lost = true;
+            document.getElementById("last-update").textContent = "Frakoblet — kobler til på nytt";
+        };
+        source.onopen = function () {
+            // Hent full tilstand etter gjenoppkobling i tilfelle vi gikk glipp av noe
+            if (lost) { lost = false; poll(); }
+        };
+    }
+
     // History chart needs the canvas to be painted before offsetWidth is valid
     updateStatus();
     updateForecast();
     updateLog();
     updateSystemInfo();
     setTimeout(updateHistory, 100);
-    pollTimer = setInterval(poll, POLL_INTERVAL);
+    if (window.EventSource) {
+        startStream();
+    } else {
+        pollTimer = setInterval(poll, POLL_INTERVAL);
+    }
 
     // Redraw history chart on resize
     window.addEventListener("resize", updateHistory);
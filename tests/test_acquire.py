@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from geoloop import metrics
+from geoloop.sensors.acquire import acquire
+from geoloop.sensors.stub import StubSensor
+
+
+class SlowSensor:
+    def __init__(self, sensor_id: str, delay: float, value: float = 10.0) -> None:
+        self.sensor_id = sensor_id
+        self.delay = delay
+        self.value = value
+
+    async def read(self) -> float | None:
+        await asyncio.sleep(self.delay)
+        return self.value
+
+
+class BrokenSensor:
+    sensor_id = "broken"
+
+    async def read(self) -> float | None:
+        raise OSError("1-Wire-bussen svarer ikke")
+
+
+class TestAcquire:
+    async def test_should_read_sensors_concurrently(self):
+        sensors = {f"s{i}": SlowSensor(f"s{i}", 0.1) for i in range(5)}
+        started = time.perf_counter()
+        values = await acquire(sensors, timeout=1.0)
+        assert time.perf_counter() - started < 0.3
+        assert values == {f"s{i}": 10.0 for i in range(5)}
+
+    async def test_should_return_partial_results_on_timeout(self):
+        sensors = {"fast": StubSensor("fast", 1.0), "slow": SlowSensor("slow", 5.0)}
+        started = time.perf_counter()
+        values = await acquire(sensors, timeout=0.05)
+        assert time.perf_counter() - started < 1.0
+        assert values == {"fast": 1.0, "slow": None}
+
+    async def test_should_isolate_failing_sensor(self):
+        values = await acquire({"ok": StubSensor("ok", 2.0), "broken": BrokenSensor()})
+        assert values == {"ok": 2.0, "broken": None}
+
+    async def test_should_use_per_sensor_timeouts(self):
+        sensors = {"a": SlowSensor("a", 0.1), "b": SlowSensor("b", 0.1)}
+        values = await acquire(sensors, timeout={"a": 1.0, "b": 0.01})
+        assert values == {"a": 10.0, "b": None}
+
+    async def test_should_preserve_sensor_order(self):
+        sensors = {"z": SlowSensor("z", 0.02), "a": SlowSensor("a", 0.0)}
+        assert list(await acquire(sensors)) == ["z", "a"]
+
+    async def test_should_record_latency_and_failures(self):
+        before = metrics.SENSOR_READ_FAILURES.value(sensor="broken", reason="error")
+        count = metrics.SENSOR_READ_SECONDS.count(sensor="broken")
+        await acquire({"broken": BrokenSensor()}, timeout=1.0)
+        assert metrics.SENSOR_READ_FAILURES.value(sensor="broken", reason="error") == before + 1
+        assert metrics.SENSOR_READ_SECONDS.count(sensor="broken") == count + 1
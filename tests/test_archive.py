@@ -0,0 +1,112 @@
+import math
+from array import array
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from geoloop.db.archive import SensorArchive
+from geoloop.db.columnar import decode_npz, encode_npz, read_npz, write_npz
+from geoloop.db.store import Store
+
+
+def _ts(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+class TestColumnar:
+    def test_should_roundtrip_columns(self, tmp_path):
+        path = tmp_path / "cols.npz"
+        write_npz(path, {"timestamp": array("q", [1, 2, 3]), "tank": array("f", [1.5, math.nan, 3.0])})
+        columns = read_npz(path)
+        assert list(columns["timestamp"]) == [1, 2, 3]
+        assert columns["tank"][0] == 1.5
+        assert math.isnan(columns["tank"][1])
+
+    def test_should_roundtrip_columns_in_memory(self):
+        data = encode_npz({"offset": array("i", [0, 3600]), "wind": array("f", [1.0, math.nan])})
+        columns = decode_npz(data)
+        assert list(columns["offset"]) == [0, 3600]
+        assert math.isnan(columns["wind"][1])
+
+    def test_should_reject_unsupported_typecode(self, tmp_path):
+        with pytest.raises(ValueError):
+            write_npz(tmp_path / "bad.npz", {"x": array("u", "abc")})
+
+    def test_should_be_readable_by_numpy(self, tmp_path):
+        np = pytest.importorskip("numpy")
+        path = tmp_path / "cols.npz"
+        write_npz(path, {"timestamp": array("q", [10, 20]), "tank": array("f", [1.0, 2.0])})
+        with np.load(path) as data:
+            assert data["timestamp"].tolist() == [10, 20]
+            assert data["tank"].dtype == np.float32
+
+
+class TestSensorArchive:
+    def test_should_partition_by_month(self, tmp_path):
+        archive = SensorArchive(tmp_path)
+        archive.append([
+            (_ts(2025, 1, 31, 23, 30), {"tank": 40.0}),
+            (_ts(2025, 2, 1, 0, 0), {"tank": 41.0}),
+        ])
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "sensors-2025-01.npz", "sensors-2025-02.npz",
+        ]
+
+    def test_should_merge_into_existing_month(self, tmp_path):
+        archive = SensorArchive(tmp_path)
+        archive.append([(_ts(2025, 1, 10), {"tank": 40.0})])
+        archive.append([(_ts(2025, 1, 11), {"loop_inlet": 2.0}), (_ts(2025, 1, 10), {"tank": 42.0})])
+        cycles = archive.read(_ts(2025, 1, 1), _ts(2025, 2, 1))
+        assert cycles == [(_ts(2025, 1, 10), {"tank": 42.0}), (_ts(2025, 1, 11), {"loop_inlet": 2.0})]
+
+    def test_should_read_only_requested_range(self, tmp_path):
+        archive = SensorArchive(tmp_path)
+        archive.append([(_ts(2025, 1, d), {"tank": float(d)}) for d in range(1, 11)])
+        cycles = archive.read(_ts(2025, 1, 3), _ts(2025, 1, 5))
+        assert [values["tank"] for _, values in cycles] == [3.0, 4.0]
+
+
+class TestStoreArchive:
+    def setup_method(self):
+        self.now = datetime.now(timezone.utc)
+
+    def _cycle(self, store, days_ago, **values):
+        ts = (self.now - timedelta(days=days_ago)).replace(minute=0, second=0, microsecond=0)
+        store.log_sensors(values, timestamp=ts)
+
+    def test_should_archive_cycles_before_retention_delete(self, tmp_path):
+        store = Store(":memory:", archive_dir=tmp_path)
+        self._cycle(store, 10, tank=40.0)
+        self._cycle(store, 1, tank=45.0)
+        store.compact_sensor_data()
+        archived = SensorArchive(tmp_path).read(0, int(self.now.timestamp()))
+        assert [values for _, values in archived] == [{"tank": 40.0}]
+        store.close()
+
+    def test_should_merge_archive_and_live_rows_in_history(self, tmp_path):
+        store = Store(":memory:", archive_dir=tmp_path)
+        self._cycle(store, 20, tank=40.0)
+        self._cycle(store, 2, tank=45.0)
+        store.compact_sensor_data()
+        rows = store.get_sensor_history(hours=30 * 24, limit=0)
+        assert [row["tank"] for row in rows] == [40.0, 45.0]
+        assert rows[0]["loop_inlet"] is None
+        store.close()
+
+    def test_should_average_archived_rows_per_bucket(self, tmp_path):
+        store = Store(":memory:", archive_dir=tmp_path)
+        archive = SensorArchive(tmp_path)
+        start = int(self.now.timestamp()) - 20 * 86400
+        start -= start % 86400
+        archive.append([(start, {"tank": 40.0}), (start + 600, {"tank": 42.0})])
+        # 40 døgn med 2000 punkter er finere enn noe aggregat som dekker perioden
+        rows = store.get_sensor_history(hours=40 * 24, limit=2000)
+        assert rows[0]["tank"] == pytest.approx(41.0)
+        store.close()
+
+    def test_should_not_write_archive_without_directory(self, tmp_path):
+        store = Store(":memory:")
+        self._cycle(store, 10, tank=40.0)
+        store.compact_sensor_data()
+        assert list(tmp_path.iterdir()) == []
+        store.close()
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import gzip
+
+import pytest
+from starlette.requests import Request
+
+from geoloop.web.assets import IMMUTABLE, REVALIDATE, AssetBundle
+
+_JS = b"function hello() { return 'hei'; }\n" * 50
+
+
+def _request(**headers: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    (tmp_path / "app.js").write_bytes(_JS)
+    (tmp_path / "logo.svg").write_text("<svg></svg>")
+    (tmp_path / "index.html").write_text(
+        '<script src="/static/app.js?v=9"></script>'
+        '<img src="/static/logo.svg"><a href="/static/missing.css">'
+    )
+    return AssetBundle(tmp_path)
+
+
+class TestAssetBundle:
+    def test_should_fingerprint_by_content(self, bundle):
+        url = bundle.url("app.js")
+        assert url.startswith("/static/app.") and url.endswith(".js")
+        assert url != "/static/app.js"
+
+    def test_should_rewrite_html_references(self, bundle):
+        body = bundle.response("index.html", _request()).body.decode()
+        assert f'src="{bundle.url("app.js")}"' in body
+        assert f'src="{bundle.url("logo.svg")}"' in body
+        assert "?v=9" not in body
+        assert '"/static/missing.css"' in body
+
+    def test_should_serve_hashed_name_as_immutable(self, bundle):
+        resp = bundle.response(bundle.url("app.js").removeprefix("/static/"), _request())
+        assert resp.headers["cache-control"] == IMMUTABLE
+        assert resp.body == _JS
+
+    def test_should_revalidate_plain_name_and_html(self, bundle):
+        assert bundle.response("app.js", _request()).headers["cache-control"] == REVALIDATE
+        assert bundle.response("index.html", _request()).headers["cache-control"] == REVALIDATE
+
+    def test_should_serve_gzip_when_accepted(self, bundle):
+        resp = bundle.response("app.js", _request(accept_encoding="gzip, deflate"))
+        assert resp.headers["content-encoding"] == "gzip"
+        assert resp.headers["vary"] == "Accept-Encoding"
+        assert gzip.decompress(resp.body) == _JS
+        assert len(resp.body) < len(_JS)
+
+    def test_should_serve_identity_without_accept_encoding(self, bundle):
+        resp = bundle.response("app.js", _request())
+        assert "content-encoding" not in resp.headers
+        assert resp.body == _JS
+
+    def test_should_skip_compression_when_it_does_not_help(self, bundle):
+        resp = bundle.response("logo.svg", _request(accept_encoding="gzip"))
+        assert "content-encoding" not in resp.headers
+
+    def test_should_return_304_for_matching_etag(self, bundle):
+        etag = bundle.response("app.js", _request()).headers["etag"]
+        resp = bundle.response("app.js", _request(if_none_match=etag))
+        assert resp.status_code == 304
+
+    def test_should_return_404_for_unknown_file(self, bundle):
+        assert bundle.response("nope.js", _request()).status_code == 404
+
+    def test_should_prefer_brotli_when_available(self, tmp_path):
+        brotli = pytest.importorskip("brotli")
+        (tmp_path / "app.js").write_bytes(_JS)
+        resp = AssetBundle(tmp_path).response("app.js", _request(accept_encoding="gzip, br"))
+        assert resp.headers["content-encoding"] == "br"
+        assert brotli.decompress(resp.body) == _JS
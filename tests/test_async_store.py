@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+import pytest
+
+from geoloop import broadcast
+from geoloop.db.async_store import AsyncStore
+from geoloop.db.store import Store
+
+
+@pytest.fixture
+async def memory_store():
+    store = AsyncStore(Store(":memory:"))
+    yield store
+    await store.close()
+
+
+@pytest.fixture
+async def file_store(tmp_path):
+    store = AsyncStore(Store(tmp_path / "geoloop.db", read_pool_size=2))
+    yield store
+    await store.close()
+
+
+class TestAsyncStore:
+    async def test_should_write_and_read_back(self, memory_store):
+        await memory_store.log_sensors({"tank": 42.0, "loop_inlet": 1.5})
+        await memory_store.log_event("startup", "test")
+        rows = await memory_store.get_sensor_log()
+        assert {row["sensor_id"] for row in rows} == {"tank", "loop_inlet"}
+        events = await memory_store.get_events()
+        assert events[0]["event_type"] == "startup"
+
+    async def test_should_run_writes_on_writer_thread(self, memory_store, monkeypatch):
+        threads = []
+        original = memory_store.store.log_event
+
+        def spy(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(memory_store.store, "log_event", spy)
+        await memory_store.log_event("startup")
+        assert threads == ["geoloop-db-writer"]
+
+    async def test_should_read_from_pool_threads_for_file_database(self, file_store, monkeypatch):
+        threads = []
+        original = file_store.store.get_events
+
+        def spy(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(file_store.store, "get_events", spy)
+        await file_store.log_event("startup")
+        assert len(await file_store.get_events()) == 1
+        assert threads[0].startswith("geoloop-db-reader")
+
+    async def test_should_keep_event_loop_responsive_during_slow_write(self, memory_store, monkeypatch):
+        release = threading.Event()
+        monkeypatch.setattr(memory_store.store, "compact_sensor_data", release.wait)
+        compaction = asyncio.create_task(memory_store.compact_sensor_data())
+        # Event-loopen kjører videre mens skrivetråden er opptatt
+        await asyncio.sleep(0.01)
+        assert not compaction.done()
+        release.set()
+        await compaction
+
+    async def test_should_propagate_exceptions(self, memory_store):
+        with pytest.raises(ValueError):
+            await memory_store.get_sensor_rollups(resolution=42)
+
+    async def test_should_see_new_sensor_from_concurrent_readers(self, file_store):
+        await file_store.log_sensors({"ny_sensor": 3.0})
+        rows = await file_store.get_sensor_history(hours=1)
+        assert rows[-1]["ny_sensor"] == 3.0
+
+    async def test_should_flush_buffer_and_reject_use_after_close(self, tmp_path):
+        path = tmp_path / "geoloop.db"
+        store = AsyncStore(Store(path, flush_interval=3600, flush_max_rows=100))
+        await store.log_sensors({"tank": 40.0})
+        await store.close()
+        with pytest.raises(RuntimeError):
+            await store.log_event("startup")
+        reopened = Store(path)
+        assert len(reopened.get_sensor_log()) == 1
+        reopened.close()
+
+
+class TestLiveEvents:
+    async def test_should_publish_events(self, memory_store):
+        async with broadcast.subscribe() as queue:
+            await memory_store.log_event("heating_on", "test")
+            message = queue.get_nowait().decode()
+        assert message.startswith("event: event")
@@ -0,0 +1,44 @@
+import json
+from datetime import datetime, timezone
+
+from geoloop.db.bench import DASHBOARD_QUERIES, generate, main, run
+from geoloop.db.store import Store
+
+
+class TestGenerate:
+    def test_should_fill_all_tables(self):
+        store = Store(":memory:")
+        cycles = generate(store, days=0.5, sensors=7)
+        stats = store.stats()["tables"]
+        assert cycles == 720
+        assert stats["sensor_cycles"] == 720
+        assert stats["weather_log"] == 72
+        assert "extra_1" in store.get_sensor_history(hours=24)[-1]
+        store.close()
+
+    def test_should_be_deterministic_for_seed(self):
+        first, second = Store(":memory:"), Store(":memory:")
+        end = datetime.now(timezone.utc)
+        for store in (first, second):
+            generate(store, days=0.1, seed=7, end=end)
+        values = [
+            [row["value"] for row in store.get_sensor_log(sensor_id="tank", limit=10)]
+            for store in (first, second)
+        ]
+        assert values[0] == values[1]
+
+
+class TestRun:
+    def test_should_report_all_measurements(self, tmp_path):
+        results = run(days=1, insert_readings=50, iterations=3, directory=tmp_path)
+        assert results["insert"]["buffered"]["readings"] == 50
+        assert results["compaction"]["first_seconds"] >= 0
+        assert [(h["hours"], h["limit"]) for h in results["history"]] == list(DASHBOARD_QUERIES)
+        assert all(h["p50_ms"] <= h["p99_ms"] for h in results["history"])
+        assert [h["rows"] > 0 for h in results["history_minmax"]] == [True] * 4
+
+    def test_should_write_json_output(self, tmp_path):
+        output = tmp_path / "bench.json"
+        main(["--days", "0.2", "--insert-readings", "20", "--iterations", "2",
+              "--dir", str(tmp_path), "--output", str(output)])
+        assert json.loads(output.read_text())["dataset"]["cycles"] == 288
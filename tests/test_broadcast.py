@@ -0,0 +1,31 @@
+import json
+
+from geoloop import broadcast
+
+
+def _decode(message: bytes) -> tuple[str, dict]:
+    event_line, data_line = message.decode().strip().split("\n")
+    return event_line.removeprefix("event: "), json.loads(data_line.removeprefix("data: "))
+
+
+class TestBroadcast:
+    async def test_should_fan_out_to_all_subscribers(self):
+        async with broadcast.subscribe() as a, broadcast.subscribe() as b:
+            broadcast.publish("heating", {"on": True})
+            assert _decode(a.get_nowait()) == ("heating", {"on": True})
+            assert _decode(b.get_nowait()) == ("heating", {"on": True})
+
+    async def test_should_unsubscribe_on_exit(self):
+        async with broadcast.subscribe():
+            assert broadcast.subscriber_count() == 1
+        assert broadcast.subscriber_count() == 0
+
+    async def test_should_drop_oldest_when_client_is_slow(self, monkeypatch):
+        monkeypatch.setattr(broadcast, "_QUEUE_SIZE", 2)
+        async with broadcast.subscribe() as queue:
+            for i in range(3):
+                broadcast.publish("sensors", {"i": i})
+            assert [_decode(queue.get_nowait())[1]["i"] for _ in range(2)] == [1, 2]
+
+    def test_should_ignore_publish_without_subscribers(self):
+        broadcast.publish("sensors", {"tank": 40.0})
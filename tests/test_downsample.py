@@ -0,0 +1,58 @@
+import pytest
+
+from geoloop.db.downsample import lttb, minmax
+
+
+def _series(n, dip_at=None):
+    points = [(i * 60, 5.0 + (i % 7) * 0.01) for i in range(n)]
+    if dip_at is not None:
+        points[dip_at] = (dip_at * 60, -2.0)
+    return points
+
+
+class TestLttb:
+    def test_should_return_exactly_threshold_points(self):
+        assert len(lttb(_series(1000), 120)) == 120
+
+    def test_should_keep_first_and_last(self):
+        result = lttb(_series(500), 50)
+        assert result[0] == (0, 5.0)
+        assert result[-1][0] == 499 * 60
+
+    def test_should_keep_short_dip(self):
+        result = lttb(_series(1440, dip_at=777), 70)
+        assert min(value for _, value in result) == -2.0
+
+    def test_should_return_all_when_series_is_short(self):
+        points = _series(10)
+        assert lttb(points, 120) == points
+
+    def test_should_keep_time_order(self):
+        timestamps = [ts for ts, _ in lttb(_series(1000, dip_at=3), 100)]
+        assert timestamps == sorted(timestamps)
+
+
+class TestMinMax:
+    @pytest.mark.parametrize("threshold", [70, 71, 120])
+    def test_should_return_exactly_threshold_points(self, threshold):
+        assert len(minmax(_series(1000), threshold)) == threshold
+
+    def test_should_keep_minimum_and_maximum(self):
+        points = _series(1440, dip_at=100)
+        points[900] = (900 * 60, 30.0)
+        values = [value for _, value in minmax(points, 70)]
+        assert min(values) == -2.0
+        assert max(values) == 30.0
+
+    def test_should_return_exact_count_for_flat_series(self):
+        points = [(i, 1.0) for i in range(300)]
+        result = minmax(points, 120)
+        assert len(result) == 120
+        assert len({ts for ts, _ in result}) == 120
+
+    def test_should_handle_threshold_of_one(self):
+        assert minmax(_series(100), 1) == [(0, 5.0)]
+
+    def test_should_keep_time_order(self):
+        timestamps = [ts for ts, _ in minmax(_series(999, dip_at=500), 77)]
+        assert timestamps == sorted(timestamps)
@@ -1,14 +1,30 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import json
+from datetime import datetime, timedelta, timezone
 from unittest.mock import AsyncMock, patch
 
 import pytest
-
+from apscheduler.events import (
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+    JobExecutionEvent,
+    JobSubmissionEvent,
+)
+
+from geoloop import broadcast, metrics
 from geoloop.controller.stub import StubController
+from geoloop.db.async_store import AsyncStore
 from geoloop.db.store import Store
 from geoloop.engine.models import HeatingDecision
-from geoloop.main import _control_loop, _read_all_sensors, _sensor_poll
+from geoloop.main import (
+    _control_loop,
+    _on_job_event,
+    _prefetch_forecast,
+    _read_all_sensors,
+    _sensor_poll,
+)
+from geoloop.sensors.snapshot import SensorSnapshot
 from geoloop.sensors.stub import StubSensor
 from geoloop.weather.met_client import MetClient, WeatherForecast, WeatherSnapshot
 
@@ -47,8 +63,10 @@ def controller():
 
 
 @pytest.fixture
-def store():
-    return Store(":memory:")
+async def store():
+    store = AsyncStore(Store(":memory:"))
+    yield store
+    await store.close()
 
 
 class TestReadAllSensors:
@@ -65,7 +83,7 @@ class TestControlLoop:
         with patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, return_value=_cold_forecast()):
             await _control_loop(met_client, store, controller, sensors, 59.91, 10.75)
         assert await controller.is_on() is True
-        events = store.get_events()
+        events = await store.get_events()
         assert any(e["event_type"] == "heating_on" for e in events)
 
     async def test_should_turn_off_when_no_risk(self, sensors, controller, store):
@@ -75,7 +93,7 @@ class TestControlLoop:
         with patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, return_value=_warm_forecast()):
             await _control_loop(met_client, store, controller, sensors, 59.91, 10.75)
         assert await controller.is_on() is False
-        events = store.get_events()
+        events = await store.get_events()
         assert any(e["event_type"] == "heating_off" for e in events)
 
     async def test_should_not_toggle_when_already_correct(self, sensors, controller, store):
@@ -84,25 +102,121 @@ class TestControlLoop:
         with patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, return_value=_warm_forecast()):
             await _control_loop(met_client, store, controller, sensors, 59.91, 10.75)
         assert await controller.is_on() is False
-        events = store.get_events()
+        events = await store.get_events()
         assert not any(e["event_type"] in ("heating_on", "heating_off") for e in events)
 
     async def test_should_log_weather_data(self, sensors, controller, store):
         met_client = MetClient("test/1.0")
         with patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, return_value=_warm_forecast()):
             await _control_loop(met_client, store, controller, sensors, 59.91, 10.75)
-        weather_log = store.get_weather_log()
+        weather_log = await store.get_weather_log()
         assert len(weather_log) == 1
         assert weather_log[0]["temperature"] == pytest.approx(15.0)
 
     async def test_should_log_sensor_data(self, sensors, controller, store):
         await _sensor_poll(store, sensors)
-        sensor_log = store.get_sensor_log()
+        sensor_log = await store.get_sensor_log()
         assert len(sensor_log) >= 2
 
+    async def test_should_update_snapshot_from_sensor_poll(self, sensors, store):
+        snapshot = SensorSnapshot()
+        await _sensor_poll(store, sensors, snapshot)
+        assert snapshot.values() == {"loop_inlet": 25.0, "loop_outlet": 22.0}
+
+    async def test_should_publish_last_valid_values_and_stale_sensors(self, sensors, store):
+        snapshot = SensorSnapshot(stale_after=0)
+        await _sensor_poll(store, sensors, snapshot)
+        sensors["loop_inlet"].read = AsyncMock(return_value=None)
+        async with broadcast.subscribe() as queue:
+            await _sensor_poll(store, sensors, snapshot)
+            message = queue.get_nowait().decode()
+        assert message.startswith("event: sensors")
+        data = json.loads(message.split("data: ", 1)[1])
+        assert data["sensors"] == {"loop_inlet": 25.0, "loop_outlet": 22.0}
+        assert data["stale_sensors"] == ["loop_inlet"]
+
+    async def test_should_reuse_snapshot_instead_of_reading_sensors(self, sensors, controller, store):
+        snapshot = SensorSnapshot()
+        await _sensor_poll(store, sensors, snapshot)
+        for sensor in sensors.values():
+            sensor.read = AsyncMock(side_effect=AssertionError("skal ikke leses på nytt"))
+        met_client = MetClient("test/1.0")
+        with patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, return_value=_warm_forecast()):
+            await _control_loop(met_client, store, controller, sensors, 59.91, 10.75, snapshot)
+        events = await store.get_events()
+        assert not any(e["event_type"] == "error" for e in events)
+
+    async def test_should_use_configured_timeouts_without_snapshot(
+        self, sensors, controller, store
+    ):
+        met_client = MetClient("test/1.0")
+        timeouts = {"loop_inlet": 5.0, "loop_outlet": 0.5}
+        with (
+            patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, return_value=_warm_forecast()),
+            patch("geoloop.main.acquire", new_callable=AsyncMock, return_value={}) as acquire,
+        ):
+            await _control_loop(
+                met_client, store, controller, sensors, 59.91, 10.75, None, timeouts
+            )
+        assert acquire.call_args.args[1] == timeouts
+
+    async def test_should_not_act_on_forecast_beyond_max_staleness(
+        self, sensors, controller, store
+    ):
+        met_client = MetClient("test/1.0")
+        forecast = _cold_forecast()
+        forecast.expires = datetime.now(timezone.utc) - timedelta(days=1)
+        with patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, return_value=forecast):
+            await _control_loop(met_client, store, controller, sensors, 59.91, 10.75)
+        assert await controller.is_on() is False
+        events = await store.get_events()
+        assert [e["event_type"] for e in events] == ["error"]
+        assert await store.get_weather_log() == []
+
+    async def test_should_act_on_recently_expired_forecast(self, sensors, controller, store):
+        met_client = MetClient("test/1.0")
+        forecast = _cold_forecast()
+        forecast.expires = datetime.now(timezone.utc) - timedelta(minutes=5)
+        with patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, return_value=forecast):
+            await _control_loop(met_client, store, controller, sensors, 59.91, 10.75)
+        assert await controller.is_on() is True
+
     async def test_should_handle_errors_gracefully(self, sensors, controller, store):
         met_client = MetClient("test/1.0")
         with patch.object(met_client, "fetch_forecast", new_callable=AsyncMock, side_effect=Exception("API feil")):
             await _control_loop(met_client, store, controller, sensors, 59.91, 10.75)
-        events = store.get_events()
+        events = await store.get_events()
         assert any(e["event_type"] == "error" for e in events)
+
+
+class TestJobMetrics:
+    async def test_should_time_sensor_poll(self, store):
+        count = metrics.JOB_SECONDS.count(job="sensor_poll")
+        await _sensor_poll(store, {"tank": StubSensor("tank", 40.0)})
+        assert metrics.JOB_SECONDS.count(job="sensor_poll") == count + 1
+
+    def test_should_record_lateness_and_missed_runs(self):
+        late = metrics.JOB_LATENESS_SECONDS.count(job="control_loop")
+        missed = metrics.JOB_MISSED.value(job="control_loop")
+        scheduled = datetime.now(timezone.utc) - timedelta(seconds=2)
+        _on_job_event(JobSubmissionEvent(EVENT_JOB_SUBMITTED, "control_loop", "default", [scheduled]))
+        _on_job_event(JobExecutionEvent(EVENT_JOB_MISSED, "control_loop", "default", scheduled))
+        assert metrics.JOB_LATENESS_SECONDS.count(job="control_loop") == late + 1
+        assert metrics.JOB_MISSED.value(job="control_loop") == missed + 1
+
+
+class TestForecastPrefetch:
+    async def test_should_refresh_forecast_when_due(self):
+        met_client = MetClient("test/1.0")
+        with patch.object(met_client, "refresh_if_due", new_callable=AsyncMock) as refresh:
+            await _prefetch_forecast(met_client, 59.91, 10.75)
+        refresh.assert_awaited_once_with(59.91, 10.75)
+
+    async def test_should_count_failed_prefetch(self):
+        met_client = MetClient("test/1.0")
+        failures = metrics.JOB_FAILURES.value(job="forecast_prefetch")
+        with patch.object(
+            met_client, "refresh_if_due", new_callable=AsyncMock, side_effect=Exception("nede")
+        ):
+            await _prefetch_forecast(met_client, 59.91, 10.75)
+        assert metrics.JOB_FAILURES.value(job="forecast_prefetch") == failures + 1
@@ -1,9 +1,14 @@
+import asyncio
 import json
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 
 import httpx
 import pytest
 
+from geoloop import metrics
+from geoloop.db.async_store import AsyncStore
+from geoloop.db.store import Store
 from geoloop.weather.met_client import MetClient, _parse_timeseries_entry
 
 SAMPLE_ENTRY = {
@@ -43,6 +48,43 @@ SAMPLE_RESPONSE = {
 }
 
 
+FAR_FUTURE = "Wed, 31 Dec 2099 23:59:59 GMT"
+LAST_MODIFIED = "Wed, 15 Jan 2025 11:00:00 GMT"
+
+
+def _http_date(offset: timedelta) -> str:
+    """HTTP-dato relativt til nå (for ``Expires``)."""
+    return (datetime.now(timezone.utc) + offset).strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+
+def _mock_met(monkeypatch, responses: list[dict]) -> list[dict]:
+    """Erstatter met.no med svarene i ``responses``; det siste gjentas.
+
+    Hvert svar kan angi ``status`` (200), ``expires`` (langt fram),
+    ``last_modified`` og ``delay`` i sekunder. Returnerer forespørslene
+    som klient og headere.
+    """
+    requests: list[dict] = []
+
+    async def mock_get(self, url, **kwargs):
+        requests.append({"client": self, "headers": kwargs.get("headers", {})})
+        response = responses[min(len(requests), len(responses)) - 1]
+        await asyncio.sleep(response.get("delay", 0))
+        status = response.get("status", 200)
+        headers = {"Expires": response.get("expires", FAR_FUTURE)}
+        if "last_modified" in response:
+            headers["Last-Modified"] = response["last_modified"]
+        return httpx.Response(
+            status,
+            json=SAMPLE_RESPONSE if status == 200 else None,
+            headers=headers,
+            request=httpx.Request("GET", url),
+        )
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", mock_get)
+    return requests
+
+
 class TestParseTimeseriesEntry:
     def test_should_parse_temperature_when_present(self):
         snap = _parse_timeseries_entry(SAMPLE_ENTRY)
@@ -76,15 +118,7 @@ class TestParseTimeseriesEntry:
 class TestMetClient:
     @pytest.mark.asyncio
     async def test_should_return_forecast_when_api_responds(self, monkeypatch):
-        async def mock_get(self, url, **kwargs):
-            return httpx.Response(
-                200,
-                json=SAMPLE_RESPONSE,
-                headers={"Expires": "Wed, 15 Jan 2025 12:30:00 GMT"},
-                request=httpx.Request("GET", url),
-            )
-
-        monkeypatch.setattr(httpx.AsyncClient, "get", mock_get)
+        _mock_met(monkeypatch, [{"expires": "Wed, 15 Jan 2025 12:30:00 GMT"}])
         client = MetClient(user_agent="test/1.0")
         forecast = await client.fetch_forecast(59.91, 10.75)
 
@@ -93,22 +127,321 @@ class TestMetClient:
 
     @pytest.mark.asyncio
     async def test_should_use_cache_when_not_expired(self, monkeypatch):
-        call_count = 0
+        requests = _mock_met(monkeypatch, [{}])
+        client = MetClient(user_agent="test/1.0")
+
+        await client.fetch_forecast(59.91, 10.75)
+        await client.fetch_forecast(59.91, 10.75)
+
+        assert len(requests) == 1
+
+
+class TestPersistentCache:
+    @pytest.fixture
+    async def store(self):
+        store = AsyncStore(Store(":memory:"))
+        yield store
+        await store.close()
+
+    async def test_should_restore_forecast_after_restart(self, monkeypatch, store):
+        requests = _mock_met(monkeypatch, [{"last_modified": LAST_MODIFIED}])
+        await MetClient("test/1.0", cache=store).fetch_forecast(59.91, 10.75)
+
+        restarted = MetClient("test/1.0", cache=store)
+        assert await restarted.restore(59.91, 10.75)
+        forecast = await restarted.fetch_forecast(59.91, 10.75)
+        assert forecast.current.air_temperature == -2.5
+        assert len(requests) == 1
+
+    async def test_should_refetch_when_restored_forecast_expired(self, monkeypatch, store):
+        requests = _mock_met(
+            monkeypatch,
+            [{"expires": _http_date(-timedelta(minutes=10)), "last_modified": LAST_MODIFIED}],
+        )
+        await MetClient("test/1.0", cache=store).fetch_forecast(59.91, 10.75)
+
+        restarted = MetClient("test/1.0", cache=store)
+        assert await restarted.restore(59.91, 10.75)
+        stale = await restarted.fetch_forecast(59.91, 10.75)
+        assert stale.stale
+        await restarted.refresh(59.91, 10.75)
+        assert len(requests) == 2
+
+    async def test_should_not_restore_forecast_expired_beyond_max_staleness(
+        self, monkeypatch, store
+    ):
+        requests = _mock_met(
+            monkeypatch,
+            [{"expires": "Wed, 15 Jan 2025 12:30:00 GMT", "last_modified": LAST_MODIFIED}],
+        )
+        await MetClient("test/1.0", cache=store).refresh(59.91, 10.75)
+
+        restarted = MetClient("test/1.0", cache=store)
+        assert not await restarted.restore(59.91, 10.75)
+        forecast = await restarted.fetch_forecast(59.91, 10.75)
+        assert len(requests) == 2
+        assert not forecast.usable
+
+    async def test_should_return_false_without_cached_forecast(self, store):
+        assert not await MetClient("test/1.0", cache=store).restore(59.91, 10.75)
+        assert not await MetClient("test/1.0").restore(59.91, 10.75)
+
+    async def test_should_archive_issuance_by_last_modified(self, monkeypatch, store):
+        _mock_met(
+            monkeypatch,
+            [{"expires": "Wed, 15 Jan 2025 12:30:00 GMT", "last_modified": LAST_MODIFIED}],
+        )
+        client = MetClient("test/1.0", cache=store)
+        started = datetime.now(timezone.utc).replace(microsecond=0)
+        await client.refresh(59.91, 10.75)
+        await client.refresh(59.91, 10.75)
+
+        issued = datetime(2025, 1, 15, 11, 0, tzinfo=timezone.utc)
+        archived = await client.forecast_at(59.91, 10.75, datetime.now(timezone.utc))
+        assert archived["issued_at"] == issued.isoformat()
+        assert [e["air_temperature"] for e in archived["timeseries"]] == [-2.5, -1.0]
+        before = started - timedelta(seconds=1)
+        assert await client.forecast_at(59.91, 10.75, before) is None
+        count = store.store._conn.execute("SELECT count(*) FROM forecast_issuances")
+        assert count.fetchone()[0] == 1
+
+    async def test_should_prefer_meta_updated_at_as_issuance_time(self, monkeypatch, store):
+        body = {
+            "properties": {
+                "meta": {"updated_at": "2025-01-15T10:45:12Z"},
+                "timeseries": SAMPLE_RESPONSE["properties"]["timeseries"],
+            }
+        }
 
         async def mock_get(self, url, **kwargs):
-            nonlocal call_count
-            call_count += 1
-            return httpx.Response(
-                200,
-                json=SAMPLE_RESPONSE,
-                headers={"Expires": "Wed, 31 Dec 2099 23:59:59 GMT"},
-                request=httpx.Request("GET", url),
-            )
+            return httpx.Response(200, json=body, request=httpx.Request("GET", url))
 
         monkeypatch.setattr(httpx.AsyncClient, "get", mock_get)
-        client = MetClient(user_agent="test/1.0")
+        client = MetClient("test/1.0", cache=store)
+        forecast = await client.refresh(59.91, 10.75)
+        assert forecast.issued_at == datetime(2025, 1, 15, 10, 45, 12, tzinfo=timezone.utc)
+        archived = await client.forecast_at(59.91, 10.75, datetime.now(timezone.utc))
+        assert archived["issued_at"] == "2025-01-15T10:45:12+00:00"
+
+    async def test_should_ignore_corrupt_cache_entry(self, store):
+        await store.save_forecast_cache("59.9100,10.7500", b"{", expires=None, last_modified=None)
+        assert not await MetClient("test/1.0", cache=store).restore(59.91, 10.75)
 
+
+class TestConditionalRequests:
+    async def test_should_reuse_pooled_client(self, monkeypatch):
+        requests = _mock_met(monkeypatch, [{"expires": "Wed, 15 Jan 2025 12:30:00 GMT", "last_modified": LAST_MODIFIED}, {}])
+        client = MetClient("test/1.0")
         await client.fetch_forecast(59.91, 10.75)
+        await client.refresh(59.91, 10.75)
+        assert requests[0]["client"] is requests[1]["client"]
+        assert requests[0]["client"].headers["User-Agent"] == "test/1.0"
+        await client.close()
+        assert requests[0]["client"].is_closed
+
+    async def test_should_send_if_modified_since_after_first_fetch(self, monkeypatch):
+        requests = _mock_met(monkeypatch, [{"expires": "Wed, 15 Jan 2025 12:30:00 GMT", "last_modified": LAST_MODIFIED}, {"status": 304}])
+        client = MetClient("test/1.0")
+        first = await client.fetch_forecast(59.91, 10.75)
+        assert "If-Modified-Since" not in requests[0]["headers"]
+
+        second = await client.refresh(59.91, 10.75)
+        assert requests[1]["headers"]["If-Modified-Since"] == LAST_MODIFIED
+        assert second is first
+        await client.close()
+
+    async def test_should_extend_expiry_on_not_modified(self, monkeypatch):
+        requests = _mock_met(monkeypatch, [{"expires": "Wed, 15 Jan 2025 12:30:00 GMT", "last_modified": LAST_MODIFIED}, {"status": 304}])
+        client = MetClient("test/1.0")
+        forecast = await client.fetch_forecast(59.91, 10.75)
+        assert forecast.stale
+        await client.refresh(59.91, 10.75)
+        assert not forecast.stale
+        await client.fetch_forecast(59.91, 10.75)
+        assert len(requests) == 2
+        await client.close()
+
+    async def test_should_only_touch_cache_row_on_not_modified(self, monkeypatch):
+        _mock_met(monkeypatch, [{"expires": "Wed, 15 Jan 2025 12:30:00 GMT", "last_modified": LAST_MODIFIED}, {"status": 304}])
+        store = AsyncStore(Store(":memory:"))
+        client = MetClient("test/1.0", cache=store)
         await client.fetch_forecast(59.91, 10.75)
 
-        assert call_count == 1
+        saved = []
+        original = store.save_forecast_cache
+
+        async def spy(*args, **kwargs):
+            saved.append(args)
+            await original(*args, **kwargs)
+
+        monkeypatch.setattr(store, "save_forecast_cache", spy)
+        await client.refresh(59.91, 10.75)
+        assert saved == []
+        cached = await store.load_forecast_cache("59.9100,10.7500")
+        assert cached["expires"] == datetime(2099, 12, 31, 23, 59, 59, tzinfo=timezone.utc)
+        assert json.loads(cached["body"]) == SAMPLE_RESPONSE
+        await client.close()
+        await store.close()
+
+    async def test_should_raise_on_not_modified_without_previous_forecast(self, monkeypatch):
+        _mock_met(monkeypatch, [{"status": 304}])
+        client = MetClient("test/1.0")
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.fetch_forecast(59.91, 10.75)
+        await client.close()
+
+
+class TestSingleFlight:
+    async def test_should_share_one_fetch_between_concurrent_callers(self, monkeypatch):
+        requests = _mock_met(monkeypatch, [{"delay": 0.05}])
+        client = MetClient("test/1.0")
+        results = await asyncio.gather(*(client.fetch_forecast(59.91, 10.75) for _ in range(5)))
+        assert len(requests) == 1
+        assert all(result is results[0] for result in results)
+        await client.close()
+
+    async def test_should_propagate_error_to_all_callers_and_retry_later(self, monkeypatch):
+        requests = _mock_met(monkeypatch, [{"status": 503, "delay": 0.05}])
+        client = MetClient("test/1.0")
+        results = await asyncio.gather(
+            *(client.fetch_forecast(59.91, 10.75) for _ in range(3)), return_exceptions=True
+        )
+        assert len(requests) == 1
+        assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+
+        # Under backoff går det ikke nye kall mot met.no
+        with pytest.raises(RuntimeError):
+            await client.fetch_forecast(59.91, 10.75)
+        assert not await client.refresh_if_due(59.91, 10.75)
+        assert len(requests) == 1
+
+        client._retry_at = 0.0
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.fetch_forecast(59.91, 10.75)
+        assert len(requests) == 2
+        await client.close()
+
+    async def test_should_double_backoff_after_repeated_failures(self, monkeypatch):
+        _mock_met(monkeypatch, [{"status": 503}])
+        client = MetClient("test/1.0")
+        delays = []
+        for _ in range(8):
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.refresh(59.91, 10.75)
+            delays.append(round(client._retry_at - time.monotonic()))
+        assert delays[:3] == [30, 60, 120]
+        assert delays[-1] == 900
+        await client.close()
+
+    async def test_should_not_cancel_shared_fetch_when_one_caller_cancels(self, monkeypatch):
+        requests = _mock_met(monkeypatch, [{"delay": 0.1}])
+        client = MetClient("test/1.0")
+        impatient = asyncio.create_task(client.fetch_forecast(59.91, 10.75))
+        patient = asyncio.create_task(client.fetch_forecast(59.91, 10.75))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        forecast = await patient
+        assert forecast.current.air_temperature == -2.5
+        assert len(requests) == 1
+        await client.close()
+
+
+class TestStaleWhileRevalidate:
+    async def test_should_return_stale_forecast_without_waiting(self, monkeypatch):
+        requests = _mock_met(
+            monkeypatch,
+            [{"expires": _http_date(-timedelta(minutes=5)), "delay": 0.2}, {"delay": 0.2}],
+        )
+        client = MetClient("test/1.0")
+        first = await client.refresh(59.91, 10.75)
+
+        started = time.perf_counter()
+        served = await client.fetch_forecast(59.91, 10.75)
+        assert time.perf_counter() - started < 0.1
+        assert served is first
+        assert served.stale
+
+        fresh = await client.refresh(59.91, 10.75)
+        assert len(requests) == 2
+        assert fresh is not first
+        assert not fresh.stale
+        await client.close()
+
+    async def test_should_prefetch_shortly_before_expiry(self, monkeypatch):
+        soon = (datetime.now(timezone.utc) + timedelta(seconds=60)).strftime(
+            "%a, %d %b %Y %H:%M:%S GMT"
+        )
+        requests = _mock_met(monkeypatch, [{"expires": soon}, {}])
+        client = MetClient("test/1.0")
+        assert await client.refresh_if_due(59.91, 10.75)
+        assert await client.refresh_if_due(59.91, 10.75, margin=timedelta(minutes=2))
+        assert not await client.refresh_if_due(59.91, 10.75)
+        assert len(requests) == 2
+        await client.close()
+
+    async def test_should_keep_serving_stale_forecast_when_refresh_fails(self, monkeypatch):
+        _mock_met(monkeypatch, [{"expires": _http_date(-timedelta(minutes=5))}])
+        client = MetClient("test/1.0")
+        first = await client.refresh(59.91, 10.75)
+
+        calls: list[int] = []
+
+        async def failing_get(self, url, **kwargs):
+            calls.append(1)
+            raise httpx.ConnectError("nede")
+
+        monkeypatch.setattr(httpx.AsyncClient, "get", failing_get)
+        assert await client.fetch_forecast(59.91, 10.75) is first
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        for _ in range(3):
+            assert await client.fetch_forecast(59.91, 10.75) is first
+        await asyncio.sleep(0)
+        assert calls == [1]
+        await client.close()
+
+    async def test_should_serve_forecast_beyond_max_staleness_without_waiting(
+        self, monkeypatch
+    ):
+        requests = _mock_met(
+            monkeypatch,
+            [{"expires": _http_date(-timedelta(hours=4)), "delay": 0.2}, {"delay": 0.2}],
+        )
+        client = MetClient("test/1.0")
+        old = await client.refresh(59.91, 10.75)
+
+        started = time.perf_counter()
+        served = await client.fetch_forecast(59.91, 10.75)
+        assert time.perf_counter() - started < 0.1
+        assert served is old
+        assert served.stale and not served.usable
+
+        fresh = await client.refresh(59.91, 10.75)
+        assert fresh.usable
+        assert len(requests) == 2
+        await client.close()
+
+    async def test_should_not_wait_without_forecast_when_asked(self, monkeypatch):
+        requests = _mock_met(monkeypatch, [{"delay": 0.2}])
+        client = MetClient("test/1.0")
+        with pytest.raises(RuntimeError):
+            await client.fetch_forecast(59.91, 10.75, wait=False)
+        forecast = await client.fetch_forecast(59.91, 10.75)
+        assert forecast.usable
+        assert len(requests) == 1
+        await client.close()
+
+    async def test_should_count_each_request_once(self, monkeypatch):
+        _mock_met(monkeypatch, [{"expires": _http_date(-timedelta(minutes=5))}, {}])
+        metrics.reset()
+        client = MetClient("test/1.0")
+        await client.fetch_forecast(59.91, 10.75)
+        await client.fetch_forecast(59.91, 10.75)
+        await client.refresh_if_due(59.91, 10.75)
+        await client.fetch_forecast(59.91, 10.75)
+        counts = {
+            result: metrics.MET_CACHE_REQUESTS.value(result=result)
+            for result in ("hit", "stale", "miss", "shared")
+        }
+        assert counts == {"hit": 1, "stale": 1, "miss": 1, "shared": 0}
+        await client.close()
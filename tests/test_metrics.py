@@ -0,0 +1,71 @@
+import pytest
+
+from geoloop import metrics
+from geoloop.metrics import Counter, Histogram
+
+
+@pytest.fixture
+def registry():
+    before = dict(metrics._registry)
+    yield
+    metrics._registry.clear()
+    metrics._registry.update(before)
+
+
+class TestHistogram:
+    def test_should_render_cumulative_buckets(self, registry):
+        h = Histogram("test_seconds", "Test.", ("op",), buckets=(0.1, 1.0))
+        h.observe(0.05, op="a")
+        h.observe(0.5, op="a")
+        h.observe(5.0, op="a")
+        lines = h.render()
+        assert 'test_seconds_bucket{op="a",le="0.1"} 1' in lines
+        assert 'test_seconds_bucket{op="a",le="1"} 2' in lines
+        assert 'test_seconds_bucket{op="a",le="+Inf"} 3' in lines
+        assert 'test_seconds_sum{op="a"} 5.55' in lines
+        assert 'test_seconds_count{op="a"} 3' in lines
+        assert lines[:2] == ["# HELP test_seconds Test.", "# TYPE test_seconds histogram"]
+
+    def test_should_count_boundary_value_in_its_bucket(self, registry):
+        h = Histogram("test_boundary", "Test.", buckets=(1.0,))
+        h.observe(1.0)
+        assert "test_boundary_bucket{le=\"1\"} 1" in h.render()
+
+    def test_should_time_block_even_when_it_raises(self, registry):
+        h = Histogram("test_timed", "Test.", ("job",))
+        with pytest.raises(RuntimeError), h.time(job="x"):
+            raise RuntimeError
+        assert h.count(job="x") == 1
+
+    def test_should_reject_wrong_labels(self, registry):
+        h = Histogram("test_labels", "Test.", ("route",))
+        with pytest.raises(ValueError):
+            h.observe(1.0, path="/")
+
+
+class TestCounter:
+    def test_should_accumulate_per_label_set(self, registry):
+        c = Counter("test_total", "Test.", ("result",))
+        c.inc(result="hit")
+        c.inc(result="hit")
+        c.inc(result="miss")
+        assert c.value(result="hit") == 2
+        assert 'test_total{result="miss"} 1' in c.render()
+
+    def test_should_escape_label_values(self, registry):
+        c = Counter("test_escape", "Test.", ("path",))
+        c.inc(path='a"b\\c')
+        assert 'test_escape{path="a\\"b\\\\c"} 1' in c.render()
+
+
+class TestRegistry:
+    def test_should_reject_duplicate_names(self, registry):
+        Counter("test_dup", "Test.")
+        with pytest.raises(ValueError):
+            Counter("test_dup", "Test.")
+
+    def test_should_render_all_registered_metrics(self, registry):
+        text = metrics.render()
+        assert "# TYPE geoloop_http_request_duration_seconds histogram" in text
+        assert "# TYPE geoloop_met_cache_requests_total counter" in text
+        assert text.endswith("\n")
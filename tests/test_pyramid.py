@@ -0,0 +1,72 @@
+from geoloop.db.pyramid import HistoryPyramid
+
+NOW = 1_700_000_000
+NAMES = ["loop_outlet", "tank"]
+
+
+def _minutes(count: int, value=lambda i: 5.0):
+    return [(NOW - 60 * i, {"loop_outlet": value(i), "tank": 40.0}) for i in range(count)]
+
+
+class TestHistoryPyramid:
+    def test_should_cover_only_configured_levels(self):
+        pyramid = HistoryPyramid(((1, 120), (24, 120)))
+        assert pyramid.covers(24, 120)
+        assert not pyramid.covers(24, 100)
+        assert pyramid.span == 24 * 3600
+
+    def test_should_return_raw_points_when_sparser_than_buckets(self):
+        pyramid = HistoryPyramid(((1, 120),))
+        pyramid.add(_minutes(30), NOW)
+        series = pyramid.series(1, 120, NAMES, NOW)
+        assert [ts for ts, _ in series] == sorted(NOW - 60 * i for i in range(30))
+        assert all(values["tank"] == 40.0 for _, values in series)
+
+    def test_should_keep_dip_and_peak_in_envelope(self):
+        pyramid = HistoryPyramid(((24, 120),))
+        spikes = {100: -3.0, 700: 12.0}
+        pyramid.add(_minutes(1440, lambda i: spikes.get(i, 5.0)), NOW)
+        outlet = [v["loop_outlet"] for _, v in pyramid.series(24, 120, NAMES, NOW)]
+        outlet = [v for v in outlet if v is not None]
+        assert min(outlet) == -3.0
+        assert max(outlet) == 12.0
+        assert len(outlet) <= 122
+
+    def test_should_match_incremental_and_bulk_insert(self):
+        cycles = _minutes(600, lambda i: (i * 7) % 11)
+        bulk = HistoryPyramid(((6, 120),))
+        bulk.add(cycles, NOW)
+        incremental = HistoryPyramid(((6, 120),))
+        for cycle in reversed(cycles):
+            incremental.add([cycle], cycle[0])
+        assert incremental.series(6, 120, NAMES, NOW) == bulk.series(6, 120, NAMES, NOW)
+
+    def test_should_drop_points_outside_window(self):
+        pyramid = HistoryPyramid(((1, 120),))
+        pyramid.add(_minutes(120), NOW)
+        series = pyramid.series(1, 120, NAMES, NOW)
+        assert min(ts for ts, _ in series) >= NOW - 3600
+
+    def test_should_evict_old_buckets(self):
+        pyramid = HistoryPyramid(((1, 120),))
+        pyramid.add(_minutes(60), NOW)
+        pyramid.add([(NOW + 7200, {"tank": 41.0})], NOW + 7200)
+        assert pyramid.series(1, 120, NAMES, NOW + 7200) == [
+            (NOW + 7200, {"loop_outlet": None, "tank": 41.0})
+        ]
+        assert len(pyramid._levels[(1, 120)].buckets) == 1
+
+    def test_should_share_timestamps_between_sensors(self):
+        pyramid = HistoryPyramid(((24, 120),))
+        cycles = [
+            (NOW - 60 * i, {"a": float(i % 13), "b": float(i % 7), "c": float(i % 5)})
+            for i in range(1440)
+        ]
+        pyramid.add(cycles, NOW)
+        series = pyramid.series(24, 120, ["a", "b", "c"], NOW)
+        assert len(series) <= 122
+        assert all(None not in values.values() for _, values in series)
+        timestamps = [ts for ts, _ in series]
+        assert timestamps == sorted(set(timestamps))
+        assert min(v["b"] for _, v in series) == 0.0
+        assert max(v["a"] for _, v in series) == 12.0
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+from geoloop.sensors.snapshot import SensorSnapshot
+
+
+class TestSensorSnapshot:
+    def setup_method(self):
+        self.now = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+
+    def test_should_start_empty(self):
+        snapshot = SensorSnapshot()
+        assert snapshot.empty
+        assert snapshot.describe(self.now)["stale"] is True
+
+    def test_should_return_latest_values(self):
+        snapshot = SensorSnapshot()
+        snapshot.update({"tank": 40.0, "loop_inlet": 2.0}, self.now)
+        snapshot.update({"tank": 41.0, "loop_inlet": 2.5}, self.now + timedelta(minutes=1))
+        assert snapshot.values() == {"tank": 41.0, "loop_inlet": 2.5}
+
+    def test_should_keep_last_value_when_read_fails(self):
+        snapshot = SensorSnapshot()
+        snapshot.update({"tank": 40.0}, self.now)
+        snapshot.update({"tank": None}, self.now + timedelta(minutes=1))
+        assert snapshot.values() == {"tank": 40.0}
+        assert snapshot.get("tank").timestamp == self.now
+
+    def test_should_report_age(self):
+        snapshot = SensorSnapshot()
+        snapshot.update({"tank": 40.0}, self.now)
+        meta = snapshot.describe(self.now + timedelta(seconds=30))
+        assert meta["age_seconds"] == 30.0
+        assert meta["stale"] is False
+        assert meta["updated_at"] == self.now.isoformat()
+
+    def test_should_flag_sensor_without_recent_reading(self):
+        snapshot = SensorSnapshot(stale_after=120)
+        snapshot.update({"tank": 40.0, "loop_inlet": 2.0}, self.now)
+        later = self.now + timedelta(minutes=5)
+        snapshot.update({"tank": 41.0, "loop_inlet": None}, later)
+        meta = snapshot.describe(later)
+        assert meta["stale_sensors"] == ["loop_inlet"]
+        assert meta["stale"] is True
+
+    def test_should_report_never_read_sensor_as_none(self):
+        snapshot = SensorSnapshot()
+        snapshot.update({"tank": None}, self.now)
+        assert snapshot.values() == {"tank": None}
+        assert snapshot.stale_sensors(self.now) == ["tank"]
+
+    def test_should_blank_stale_sensors_in_fresh_values(self):
+        snapshot = SensorSnapshot(stale_after=120)
+        snapshot.update({"tank": 40.0, "loop_inlet": 2.0}, self.now)
+        later = self.now + timedelta(minutes=5)
+        snapshot.update({"tank": 41.0, "loop_inlet": None}, later)
+        assert snapshot.fresh(later)
+        assert snapshot.fresh_values(later) == {"tank": 41.0, "loop_inlet": None}
+        assert not snapshot.fresh(later + timedelta(minutes=5))
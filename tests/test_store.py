@@ -1,6 +1,11 @@
+import sqlite3
+import time
 from datetime import datetime, timedelta, timezone
 
-from geoloop.db.store import Store
+import pytest
+
+from geoloop.db.pyramid import LEVELS
+from geoloop.db.store import _SCHEMA_VERSION, Store
 
 
 class TestStore:
@@ -57,6 +62,168 @@ class TestStore:
         assert rows[0]["temperature"] == 2.0
 
 
+class TestForecastCache:
+    def test_should_round_trip_forecast_with_metadata(self):
+        store = Store(":memory:")
+        expires = datetime(2025, 1, 15, 12, 30, tzinfo=timezone.utc)
+        store.save_forecast_cache(
+            "59.9100,10.7500", b'{"a": 1}', expires=expires, last_modified="lm"
+        )
+        cached = store.load_forecast_cache("59.9100,10.7500")
+        assert cached["body"] == b'{"a": 1}'
+        assert cached["expires"] == expires
+        assert cached["last_modified"] == "lm"
+        assert store.load_forecast_cache("0.0000,0.0000") is None
+        store.close()
+
+    def test_should_touch_expiry_without_rewriting_body(self):
+        store = Store(":memory:")
+        assert not store.touch_forecast_cache("loc", expires=None)
+        store.save_forecast_cache("loc", b"body", expires=None, last_modified="lm")
+        expires = datetime(2025, 1, 15, 13, 0, tzinfo=timezone.utc)
+        assert store.touch_forecast_cache("loc", expires=expires, fetched_at=expires)
+        cached = store.load_forecast_cache("loc")
+        assert cached["expires"] == expires
+        assert cached["fetched_at"] == expires
+        assert cached["body"] == b"body"
+        assert cached["last_modified"] == "lm"
+        store.close()
+
+    def test_should_replace_previous_forecast(self):
+        store = Store(":memory:")
+        store.save_forecast_cache("loc", b"1", expires=None, last_modified=None)
+        store.save_forecast_cache("loc", b"2", expires=None, last_modified=None)
+        assert store.load_forecast_cache("loc")["body"] == b"2"
+        assert store.load_forecast_cache("loc")["expires"] is None
+        store.close()
+
+
+def _issuance(base: datetime, temperature: float, hours: int = 3) -> list[dict]:
+    return [
+        {
+            "time": base + timedelta(hours=i),
+            "air_temperature": temperature + i,
+            "precipitation_amount": 0.3 if i == 0 else None,
+            "relative_humidity": 80.0,
+            "wind_speed": 3.2,
+        }
+        for i in range(hours)
+    ]
+
+
+class TestForecastArchive:
+    T0 = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+
+    def test_should_return_forecast_active_at_moment(self):
+        store = Store(":memory:")
+        store.save_forecast_issuance("loc", self.T0, _issuance(self.T0, -2.5), fetched_at=self.T0)
+        later = self.T0 + timedelta(hours=1)
+        store.save_forecast_issuance("loc", later, _issuance(later, 1.0), fetched_at=later)
+
+        archived = store.get_forecast_at("loc", self.T0 + timedelta(minutes=30))
+        assert archived["issued_at"] == self.T0.isoformat()
+        assert [e["air_temperature"] for e in archived["timeseries"]] == [-2.5, -1.5, -0.5]
+        assert archived["timeseries"][1]["time"] == (self.T0 + timedelta(hours=1)).isoformat()
+        assert archived["timeseries"][0]["precipitation_amount"] == 0.3
+        assert archived["timeseries"][1]["precipitation_amount"] is None
+        assert archived["timeseries"][0]["wind_speed"] == 3.2
+
+        assert store.get_forecast_at("loc", later)["issued_at"] == later.isoformat()
+        assert store.get_forecast_at("loc", self.T0 - timedelta(seconds=1)) is None
+        assert store.get_forecast_at("other", later) is None
+        store.close()
+
+    def test_should_ignore_duplicate_issuance(self):
+        store = Store(":memory:")
+        assert store.save_forecast_issuance(
+            "loc", self.T0, _issuance(self.T0, 1.0), fetched_at=self.T0
+        )
+        assert not store.save_forecast_issuance(
+            "loc", self.T0, _issuance(self.T0, 9.0), fetched_at=self.T0 + timedelta(minutes=5)
+        )
+        assert not store.save_forecast_issuance("loc", self.T0, [])
+        archived = store.get_forecast_at("loc", self.T0)
+        assert archived["timeseries"][0]["air_temperature"] == 1.0
+        store.close()
+
+    def test_should_select_by_fetch_time_not_issue_time(self):
+        store = Store(":memory:")
+        store.save_forecast_issuance("loc", self.T0, _issuance(self.T0, 1.0), fetched_at=self.T0)
+        # Utstedt 13:00, men først hentet 14:30 (f.eks. under backoff)
+        issued = self.T0 + timedelta(hours=1)
+        fetched = self.T0 + timedelta(hours=2, minutes=30)
+        store.save_forecast_issuance("loc", issued, _issuance(issued, 5.0), fetched_at=fetched)
+
+        active = store.get_forecast_at("loc", self.T0 + timedelta(hours=2))
+        assert active["issued_at"] == self.T0.isoformat()
+        active = store.get_forecast_at("loc", fetched)
+        assert active["issued_at"] == issued.isoformat()
+        assert active["fetched_at"] == fetched.isoformat()
+        store.close()
+
+    def test_should_store_issuance_compactly(self):
+        store = Store(":memory:")
+        store.save_forecast_issuance("loc", self.T0, _issuance(self.T0, 1.0, hours=90))
+        size = store._conn.execute(
+            "SELECT length(data) FROM forecast_issuances"
+        ).fetchone()[0]
+        # 90 tidspunkter × (4 + 4×4 byte) før komprimering
+        assert size < 90 * 20 + 1024
+        store.close()
+
+
+class TestLogPagination:
+    def setup_method(self):
+        self.store = Store(":memory:")
+        self.t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for i in range(10):
+            ts = self.t0 + timedelta(hours=i)
+            self.store.log_event("heating_on" if i % 2 else "heating_off", f"e{i}", timestamp=ts)
+            self.store.log_weather(temperature=float(i), timestamp=ts)
+
+    def teardown_method(self):
+        self.store.close()
+
+    def test_should_page_backwards_with_before_id(self):
+        first = self.store.get_events(limit=4)
+        second = self.store.get_events(limit=4, before_id=first[-1]["id"])
+        third = self.store.get_events(limit=4, before_id=second[-1]["id"])
+        messages = [e["message"] for e in first + second + third]
+        assert messages == [f"e{i}" for i in range(9, -1, -1)]
+
+    def test_should_filter_events_by_type(self):
+        rows = self.store.get_events(event_type="heating_on")
+        assert [e["message"] for e in rows] == ["e9", "e7", "e5", "e3", "e1"]
+
+    def test_should_filter_events_by_time_range(self):
+        rows = self.store.get_events(
+            since=self.t0 + timedelta(hours=3), until=self.t0 + timedelta(hours=6)
+        )
+        assert [e["message"] for e in rows] == ["e5", "e4", "e3"]
+
+    def test_should_combine_filters_with_cursor(self):
+        first = self.store.get_events(limit=2, event_type="heating_off")
+        rows = self.store.get_events(
+            limit=2, event_type="heating_off", before_id=first[-1]["id"],
+            since=self.t0 + timedelta(hours=2),
+        )
+        assert [e["message"] for e in rows] == ["e4", "e2"]
+
+    def test_should_page_weather_log(self):
+        first = self.store.get_weather_log(limit=3, since=self.t0 + timedelta(hours=2))
+        rest = self.store.get_weather_log(before_id=first[-1]["id"], since=self.t0 + timedelta(hours=2))
+        temps = [r["temperature"] for r in first + rest]
+        assert temps == [float(i) for i in range(9, 1, -1)]
+
+    def test_should_use_index_for_event_type_filter(self):
+        plan = self.store._conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM system_events "
+            "WHERE event_type = ? AND id < ? ORDER BY id DESC LIMIT 10",
+            ("startup", 100),
+        ).fetchall()
+        assert any("system_events_type_id" in row[-1] for row in plan)
+
+
 class TestCompaction:
     def setup_method(self):
         self.store = Store(":memory:")
@@ -72,14 +239,14 @@ class TestCompaction:
     def _count_rows(self, compacted=None):
         if compacted is not None:
             return self.store._conn.execute(
-                "SELECT COUNT(*) FROM sensor_log WHERE compacted = ?", (compacted,)
+                "SELECT COUNT(*) FROM sensor_cycles WHERE compacted = ?", (compacted,)
             ).fetchone()[0]
-        return self.store._conn.execute("SELECT COUNT(*) FROM sensor_log").fetchone()[0]
+        return self.store._conn.execute("SELECT COUNT(*) FROM sensor_cycles").fetchone()[0]
 
     def test_should_add_compacted_column(self):
         cols = {
             row[1]
-            for row in self.store._conn.execute("PRAGMA table_info(sensor_log)").fetchall()
+            for row in self.store._conn.execute("PRAGMA table_info(sensor_cycles)").fetchall()
         }
         assert "compacted" in cols
 
@@ -143,6 +310,46 @@ class TestSensorHistoryLimit:
         rows = self.store.get_sensor_history(hours=1, limit=0)
         assert len(rows) == 30
 
+    def test_should_return_same_points_as_columns(self):
+        for i in range(60):
+            self._insert_sensor("loop_inlet", 20.0 + i * 0.1, minutes_ago=i)
+        rows = self.store.get_sensor_history(hours=1, limit=10)
+        columns = self.store.get_sensor_history_columns(hours=1, limit=10)
+        assert len(columns["timestamps"]) == len(rows)
+        assert columns["sensors"]["loop_inlet"] == [row["loop_inlet"] for row in rows]
+        assert columns["sensors"]["tank"] == [None] * len(rows)
+
+    @pytest.mark.parametrize("method", ["lttb", "minmax"])
+    def test_should_keep_dip_with_peak_preserving_method(self, method):
+        for i in range(60):
+            value = -3.0 if i == 31 else 5.0 + (i % 3) * 0.1
+            ts = self.now - timedelta(minutes=i)
+            self.store.log_sensors({"loop_outlet": value, "tank": 40.0}, timestamp=ts)
+        rows = self.store.get_sensor_history(hours=1, limit=10, method=method)
+        outlet = [row["loop_outlet"] for row in rows if row["loop_outlet"] is not None]
+        assert len(outlet) == 10
+        assert min(outlet) == -3.0
+        # Snitt per bøtte glatter ut fallet
+        averaged = self.store.get_sensor_history(hours=1, limit=10)
+        assert min(row["loop_outlet"] for row in averaged) > -3.0
+
+    @pytest.mark.parametrize("method", ["lttb", "minmax"])
+    def test_should_keep_dip_after_compaction(self, method):
+        for i in range(6 * 60):
+            value = -5.0 if i == 120 else 2.0 + (i % 5) * 0.1
+            self._insert_sensor("loop_outlet", value, minutes_ago=i)
+        self.store.compact_sensor_data()
+        rows = self.store.get_sensor_history(hours=6, limit=50, method=method)
+        outlet = [row["loop_outlet"] for row in rows if row["loop_outlet"] is not None]
+        assert min(outlet) == -5.0
+        assert max(outlet) == pytest.approx(2.4)
+        timestamps = [row["timestamp"] for row in rows]
+        assert timestamps == sorted(timestamps)
+
+    def test_should_reject_unknown_downsample_method(self):
+        with pytest.raises(ValueError):
+            self.store.get_sensor_history(hours=1, limit=10, method="median")
+
     def test_should_downsample_when_limit_exceeded(self):
         # Sett inn 60 rader (1 per minutt) for siste time
         for i in range(60):
@@ -152,3 +359,569 @@ class TestSensorHistoryLimit:
         # Nedsampling skal gi færre rader enn totalt
         assert len(rows_limited) < len(rows_all)
         assert len(rows_limited) <= 15  # Noe mer enn limit pga bøtte-avrunding
+
+
+class TestHistoryPyramid:
+    def test_should_serve_dashboard_level_from_pyramid(self, monkeypatch):
+        store = Store(":memory:")
+        now = datetime.now(timezone.utc)
+        for i in range(600):
+            value = -3.0 if i == 300 else 5.0
+            store.log_sensors({"loop_outlet": value}, timestamp=now - timedelta(minutes=i))
+
+        def fail(*args, **kwargs):
+            raise AssertionError("skal ikke lese fra SQLite")
+
+        monkeypatch.setattr(store, "_reader", fail)
+        rows = store.get_sensor_history(hours=24, limit=120, method="minmax")
+        outlet = [row["loop_outlet"] for row in rows if row["loop_outlet"] is not None]
+        assert min(outlet) == -3.0
+        assert len(outlet) <= 122
+        store.close()
+
+    def test_should_seed_pyramid_from_database_on_open(self, tmp_path):
+        path = tmp_path / "geoloop.db"
+        now = datetime.now(timezone.utc)
+        store = Store(path)
+        for i in range(30):
+            store.log_sensors({"tank": 40.0 + i}, timestamp=now - timedelta(minutes=i))
+        before = store.get_sensor_history(hours=6, limit=120, method="minmax")
+        store.close()
+
+        reopened = Store(path)
+        assert reopened.get_sensor_history(hours=6, limit=120, method="minmax") == before
+        reopened.close()
+
+    def test_should_keep_extremes_of_compacted_data_after_restart(self, tmp_path):
+        path = tmp_path / "geoloop.db"
+        now = datetime.now(timezone.utc)
+        store = Store(path)
+        for i in range(6 * 60):
+            value = -5.0 if i == 120 else 2.2
+            store.log_sensors({"loop_outlet": value}, timestamp=now - timedelta(minutes=i))
+        store.compact_sensor_data()
+        store.close()
+
+        reopened = Store(path)
+        for hours, limit in LEVELS[1:]:
+            rows = reopened.get_sensor_history(hours=hours, limit=limit, method="minmax")
+            assert min(r["loop_outlet"] for r in rows if r["loop_outlet"] is not None) == -5.0
+        reopened.close()
+
+    def test_should_not_add_buffered_cycles_before_flush(self):
+        store = Store(":memory:", flush_interval=3600, flush_max_rows=100)
+        store.log_sensors({"tank": 40.0})
+        assert store.get_sensor_history(hours=1, limit=120, method="minmax") == []
+        store.flush()
+        assert len(store.get_sensor_history(hours=1, limit=120, method="minmax")) == 1
+        store.close()
+
+
+class TestBufferedIngestion:
+    def setup_method(self):
+        self.store = Store(":memory:", flush_interval=3600, flush_max_rows=10)
+
+    def teardown_method(self):
+        self.store.close()
+
+    def test_should_buffer_until_max_rows(self):
+        self.store.log_sensors({"loop_inlet": 1.0, "tank": 2.0})
+        assert self.store.pending_rows == 1
+        assert self.store.get_sensor_log() == []
+
+    def test_should_flush_when_max_rows_reached(self):
+        base = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+        for i in range(10):
+            self.store.log_sensors(
+                {"loop_inlet": float(i), "tank": float(i)},
+                timestamp=base + timedelta(minutes=i),
+            )
+        assert self.store.pending_rows == 0
+        assert len(self.store.get_sensor_log()) == 20
+
+    def test_should_skip_none_values(self):
+        self.store.log_sensors({"loop_inlet": 1.0, "tank": None})
+        self.store.flush()
+        rows = self.store.get_sensor_log()
+        assert [r["sensor_id"] for r in rows] == ["loop_inlet"]
+
+    def test_should_flush_before_compaction(self):
+        self.store.log_sensor("loop_inlet", 1.0)
+        self.store.compact_sensor_data()
+        assert self.store.pending_rows == 0
+        assert len(self.store.get_sensor_log()) == 1
+
+    def test_should_flush_on_close(self, tmp_path):
+        path = tmp_path / "buffer.db"
+        store = Store(path, flush_interval=3600, flush_max_rows=100)
+        store.log_sensors({"loop_inlet": 1.0, "tank": 2.0})
+        store.close()
+        reopened = Store(path)
+        assert len(reopened.get_sensor_log()) == 2
+        reopened.close()
+
+    @pytest.mark.parametrize(
+        ("flush_interval", "flush_max_rows"), [(300, 0), (0, 10)]
+    )
+    def test_should_keep_buffering_with_one_limit_disabled(self, flush_interval, flush_max_rows):
+        store = Store(":memory:", flush_interval=flush_interval, flush_max_rows=flush_max_rows)
+        base = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+        for i in range(5):
+            store.log_sensors({"tank": 40.0}, timestamp=base + timedelta(minutes=i))
+        assert store.pending_rows == 5
+        store.close()
+
+    def test_should_write_through_by_default(self):
+        store = Store(":memory:")
+        store.log_sensor("loop_inlet", 1.0)
+        assert store.pending_rows == 0
+        assert len(store.get_sensor_log()) == 1
+        store.close()
+
+
+class TestWalMode:
+    def test_should_enable_wal_for_file_database(self, tmp_path):
+        store = Store(tmp_path / "wal.db")
+        mode = store._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+        store.close()
+
+    def test_should_read_committed_rows_from_reader_pool(self, tmp_path):
+        store = Store(tmp_path / "wal.db", read_pool_size=2)
+        store.log_sensor("loop_inlet", 1.0)
+        store.log_event("startup", "test")
+        assert len(store.get_sensor_log()) == 1
+        assert store.get_events()[0]["event_type"] == "startup"
+        store.close()
+
+    def test_should_not_block_reads_during_open_write_transaction(self, tmp_path):
+        store = Store(tmp_path / "wal.db")
+        store.log_sensor("loop_inlet", 1.0)
+        store._conn.execute("BEGIN IMMEDIATE")
+        store._conn.execute(
+            "INSERT INTO sensor_cycles (timestamp, s5) VALUES (1, 2.0)"
+        )
+        # Leseren ser siste commit, ikke den åpne transaksjonen
+        assert len(store.get_sensor_log()) == 1
+        store._conn.commit()
+        assert len(store.get_sensor_log()) == 2
+        store.close()
+
+    def test_should_reject_writes_on_reader_connections(self, tmp_path):
+        store = Store(tmp_path / "wal.db")
+        with store._reader() as conn:
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM sensor_cycles")
+        store.close()
+
+    def test_should_use_single_connection_in_memory(self):
+        store = Store(":memory:")
+        with store._reader() as conn:
+            assert conn is store._conn
+        store.close()
+
+
+class TestSensorCycles:
+    def setup_method(self):
+        self.store = Store(":memory:")
+
+    def teardown_method(self):
+        self.store.close()
+
+    def test_should_store_one_row_per_cycle(self):
+        ts = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+        self.store.log_sensors({"loop_inlet": 1.0, "loop_outlet": 2.0, "tank": 3.0}, timestamp=ts)
+        count = self.store._conn.execute("SELECT COUNT(*) FROM sensor_cycles").fetchone()[0]
+        assert count == 1
+        assert len(self.store.get_sensor_log()) == 3
+
+    def test_should_merge_single_readings_with_same_timestamp(self):
+        ts = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+        self.store.log_sensor("loop_inlet", 1.0, timestamp=ts)
+        self.store.log_sensor("tank", 3.0, timestamp=ts)
+        rows = self.store.get_sensor_log()
+        assert {(r["sensor_id"], r["value"]) for r in rows} == {("loop_inlet", 1.0), ("tank", 3.0)}
+        count = self.store._conn.execute("SELECT COUNT(*) FROM sensor_cycles").fetchone()[0]
+        assert count == 1
+
+    def test_should_add_column_for_new_sensor(self):
+        self.store.log_sensor("garage", 7.5)
+        rows = self.store.get_sensor_log(sensor_id="garage")
+        assert rows[0]["value"] == 7.5
+
+    def test_should_accept_any_sensor_name(self):
+        self.store.log_sensor('bad name"; DROP', 1.0)
+        rows = self.store.get_sensor_log(sensor_id='bad name"; DROP')
+        assert rows[0]["value"] == 1.0
+
+    def test_should_register_sensor_in_dictionary(self):
+        self.store.log_sensor("garage", 7.5)
+        key = self.store._conn.execute(
+            "SELECT id FROM sensors WHERE name = 'garage'"
+        ).fetchone()[0]
+        assert isinstance(key, int)
+        cols = {
+            row[1]
+            for row in self.store._conn.execute("PRAGMA table_info(sensor_cycles)").fetchall()
+        }
+        assert f"s{key}" in cols
+
+    def test_should_store_integer_timestamps(self):
+        ts = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+        self.store.log_sensors({"tank": 40.0}, timestamp=ts)
+        self.store.log_event("startup", timestamp=ts)
+        self.store.log_weather(temperature=1.0, timestamp=ts)
+        for table in ("sensor_cycles", "system_events", "weather_log"):
+            value = self.store._conn.execute(f"SELECT timestamp FROM {table}").fetchone()[0]
+            assert value == int(ts.timestamp())
+
+    def test_should_return_all_default_keys_in_history(self):
+        self.store.log_sensors({"loop_inlet": 1.0})
+        rows = self.store.get_sensor_history(hours=1)
+        assert set(rows[0]) >= {"timestamp", "loop_inlet", "loop_outlet", "hp_inlet", "hp_outlet", "tank"}
+        assert rows[0]["tank"] is None
+
+
+class TestLegacyMigration:
+    def _create_v1(self, path, script):
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE weather_log (
+                id        INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT    NOT NULL,
+                temperature    REAL,
+                precipitation  REAL,
+                humidity       REAL,
+                wind_speed     REAL
+            );
+            CREATE TABLE system_events (
+                id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp  TEXT    NOT NULL,
+                event_type TEXT    NOT NULL,
+                message    TEXT
+            );
+            INSERT INTO weather_log (timestamp, temperature)
+                VALUES ('2025-01-15T12:00:00.123456+00:00', -2.0);
+            INSERT INTO system_events (timestamp, event_type, message)
+                VALUES ('2025-01-15T12:00:00+00:00', 'startup', 'GeoLoop startet');
+        """ + script)
+        conn.commit()
+        conn.close()
+
+    def _tables(self, store):
+        return {
+            row[0]
+            for row in store._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        }
+
+    def test_should_pivot_legacy_sensor_log(self, tmp_path):
+        path = tmp_path / "legacy.db"
+        self._create_v1(path, """
+            CREATE TABLE sensor_log (
+                id        INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT    NOT NULL,
+                sensor_id TEXT    NOT NULL,
+                value     REAL,
+                compacted INTEGER DEFAULT 0
+            );
+            INSERT INTO sensor_log (timestamp, sensor_id, value, compacted) VALUES
+                ('2025-01-15T12:00:00+00:00', 'loop_inlet', 1.0, 0),
+                ('2025-01-15T12:00:00+00:00', 'tank', 3.0, 0),
+                ('2025-01-15T12:01:00+00:00', 'loop_inlet', 1.5, 0),
+                ('2025-01-15T12:01:00+00:00', 'garage', 9.0, 0);
+        """)
+
+        store = Store(path)
+        assert "sensor_log" not in self._tables(store)
+        assert store._conn.execute("PRAGMA user_version").fetchone()[0] == _SCHEMA_VERSION
+        rows = store.get_sensor_log(limit=10)
+        assert [(r["timestamp"], r["sensor_id"], r["value"]) for r in rows] == [
+            ("2025-01-15T12:01:00+00:00", "loop_inlet", 1.5),
+            ("2025-01-15T12:01:00+00:00", "garage", 9.0),
+            ("2025-01-15T12:00:00+00:00", "loop_inlet", 1.0),
+            ("2025-01-15T12:00:00+00:00", "tank", 3.0),
+        ]
+        store.close()
+
+    def test_should_convert_wide_v1_sensor_cycles(self, tmp_path):
+        path = tmp_path / "wide.db"
+        self._create_v1(path, """
+            CREATE TABLE sensor_cycles (
+                id        INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT    NOT NULL UNIQUE,
+                compacted INTEGER DEFAULT 0,
+                loop_inlet REAL, loop_outlet REAL, hp_inlet REAL, hp_outlet REAL, tank REAL
+            );
+            INSERT INTO sensor_cycles (timestamp, compacted, loop_inlet, tank) VALUES
+                ('2025-01-15T12:00:00+00:00', 1, 1.0, 3.0);
+        """)
+
+        store = Store(path)
+        rows = store._conn.execute("SELECT timestamp, compacted, s1, s5 FROM sensor_cycles").fetchall()
+        assert [tuple(r) for r in rows] == [(1736942400, 1, 1.0, 3.0)]
+        store.close()
+
+    def test_should_convert_weather_and_event_timestamps(self, tmp_path):
+        path = tmp_path / "legacy.db"
+        self._create_v1(path, "")
+
+        store = Store(path)
+        assert store.get_weather_log()[0]["timestamp"] == "2025-01-15T12:00:00+00:00"
+        assert store.get_weather_log()[0]["temperature"] == -2.0
+        assert store.get_events()[0]["timestamp"] == "2025-01-15T12:00:00+00:00"
+        store.log_event("startup", "igjen")
+        assert store.get_events()[0]["id"] == 2
+        store.close()
+
+    def test_should_seed_watermarks_and_pyramid_from_compacted_v1_rows(self, tmp_path):
+        path = tmp_path / "compacted.db"
+        now = int(time.time())
+        rows = []
+        for i in range(1, 13):
+            rows.append((now - now % 60 - i * 60, 0, 2.0))
+        for i in range(13, 24 * 12):
+            ts = now - now % 300 - i * 300
+            rows.append((ts, 1, -4.0 if i == 100 else 2.0))
+        values = ",".join(
+            f"('{datetime.fromtimestamp(ts, timezone.utc).isoformat()}', {level}, {value})"
+            for ts, level, value in rows
+        )
+        self._create_v1(path, f"""
+            CREATE TABLE sensor_cycles (
+                id        INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT    NOT NULL UNIQUE,
+                compacted INTEGER DEFAULT 0,
+                loop_inlet REAL, loop_outlet REAL, hp_inlet REAL, hp_outlet REAL, tank REAL
+            );
+            INSERT INTO sensor_cycles (timestamp, compacted, loop_outlet) VALUES {values};
+        """)
+
+        store = Store(path)
+        marks = dict(store._conn.execute("SELECT level, watermark FROM compaction_state"))
+        newest_compacted = max(ts for ts, level, _ in rows if level == 1)
+        assert marks == {1: newest_compacted + 300}
+        history = store.get_sensor_history(hours=24, limit=120, method="minmax")
+        outlet = [r["loop_outlet"] for r in history if r["loop_outlet"] is not None]
+        assert len(outlet) > 60
+        assert min(outlet) == -4.0
+        lttb = store.get_sensor_history(hours=24, limit=50, method="lttb")
+        assert min(r["loop_outlet"] for r in lttb if r["loop_outlet"] is not None) == -4.0
+        store.close()
+
+    def test_should_be_idempotent_on_reopen(self, tmp_path):
+        path = tmp_path / "v2.db"
+        store = Store(path)
+        store.log_sensor("garage", 1.0)
+        store.close()
+        store = Store(path)
+        assert store.get_sensor_log(sensor_id="garage")[0]["value"] == 1.0
+        store.close()
+
+
+class TestIncrementalCompaction:
+    def setup_method(self):
+        self.store = Store(":memory:")
+        self.now = datetime.now(timezone.utc)
+
+    def teardown_method(self):
+        self.store.close()
+
+    def _insert_sensor(self, sensor_id, value, minutes_ago):
+        ts = self.now - timedelta(minutes=minutes_ago)
+        self.store.log_sensor(sensor_id, value, timestamp=ts)
+
+    def _watermarks(self):
+        return dict(
+            self.store._conn.execute("SELECT level, watermark FROM compaction_state").fetchall()
+        )
+
+    def _count_raw(self):
+        return self.store._conn.execute(
+            "SELECT COUNT(*) FROM sensor_cycles WHERE compacted = 0"
+        ).fetchone()[0]
+
+    def test_should_store_aligned_watermarks(self):
+        self._insert_sensor("loop_inlet", 1.0, minutes_ago=180)
+        self.store.compact_sensor_data()
+        marks = self._watermarks()
+        assert marks[1] % 300 == 0
+        assert marks[2] % 1800 == 0
+        assert marks[1] <= int(self.now.timestamp()) - 3600
+
+    def test_should_skip_buckets_behind_watermark(self):
+        self._insert_sensor("loop_inlet", 1.0, minutes_ago=180)
+        self.store.compact_sensor_data()
+        # Rad bak vannmerket blir ikke skannet på nytt
+        self._insert_sensor("loop_inlet", 2.0, minutes_ago=170)
+        self.store.compact_sensor_data()
+        assert self._count_raw() == 1
+
+    def test_should_process_backlog_in_bounded_chunks(self, monkeypatch):
+        monkeypatch.setattr("geoloop.db.store._COMPACTION_CHUNK_BUCKETS", 2)
+        monkeypatch.setattr("geoloop.db.store._COMPACTION_MAX_CHUNKS", 1)
+        for i in range(60):
+            self._insert_sensor("loop_inlet", 20.0, minutes_ago=120 + i)
+        self.store.compact_sensor_data()
+        first = self._watermarks()[1]
+        remaining = self._count_raw()
+        assert 0 < remaining < 60
+        self.store.compact_sensor_data()
+        assert self._watermarks()[1] == first + 600
+        assert self._count_raw() < remaining
+
+
+class TestRollups:
+    def setup_method(self):
+        self.store = Store(":memory:")
+        self.now = datetime.now(timezone.utc)
+
+    def teardown_method(self):
+        self.store.close()
+
+    def _insert_sensor(self, sensor_id, value, minutes_ago):
+        ts = self.now - timedelta(minutes=minutes_ago)
+        self.store.log_sensor(sensor_id, value, timestamp=ts)
+
+    def test_should_track_min_max_avg_count(self):
+        base = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+        for i, value in enumerate((1.0, 5.0, 3.0)):
+            self.store.log_sensor("loop_outlet", value, timestamp=base + timedelta(minutes=i))
+        row = self.store._conn.execute(
+            "SELECT min_value, max_value, total, count FROM sensor_rollups "
+            "WHERE resolution = 300 AND sensor = 2"
+        ).fetchone()
+        assert tuple(row) == (1.0, 5.0, 9.0, 3)
+
+    def test_should_maintain_every_resolution(self):
+        self._insert_sensor("tank", 40.0, minutes_ago=0)
+        resolutions = {
+            row[0]
+            for row in self.store._conn.execute("SELECT resolution FROM sensor_rollups")
+        }
+        assert resolutions == {300, 1800, 3600, 86400}
+
+    def test_should_return_rollups_with_extremes(self):
+        for i in range(5):
+            self._insert_sensor("loop_outlet", 10.0 - i, minutes_ago=i)
+        rows = self.store.get_sensor_rollups(86400, hours=48, sensor_id="loop_outlet")
+        assert sum(r["count"] for r in rows) == 5
+        assert min(r["min"] for r in rows) == 6.0
+        assert max(r["max"] for r in rows) == 10.0
+
+    def test_should_keep_rollups_after_raw_retention(self):
+        self._insert_sensor("tank", 40.0, minutes_ago=10 * 24 * 60)
+        self.store.compact_sensor_data()
+        assert self.store._conn.execute("SELECT COUNT(*) FROM sensor_cycles").fetchone()[0] == 0
+        rows = self.store.get_sensor_history(hours=24 * 30, limit=60)
+        assert [r["tank"] for r in rows if r["tank"] is not None] == [40.0]
+
+    def test_should_prune_expired_fine_rollups(self):
+        self._insert_sensor("tank", 40.0, minutes_ago=40 * 24 * 60)
+        self.store.compact_sensor_data()
+        resolutions = {
+            row[0]
+            for row in self.store._conn.execute("SELECT resolution FROM sensor_rollups")
+        }
+        assert 300 not in resolutions
+        assert 86400 in resolutions
+
+    def test_should_serve_history_from_rollups_when_downsampling(self):
+        for i in range(24 * 12):
+            self._insert_sensor("loop_inlet", float(i % 7), minutes_ago=i * 5)
+        rows = self.store.get_sensor_history(hours=24, limit=120)
+        assert 80 <= len(rows) <= 120
+        assert all(r["loop_inlet"] is None or 0.0 <= r["loop_inlet"] <= 6.0 for r in rows)
+
+    @pytest.mark.parametrize(("hours", "limit"), [(48, 50), (24, 120), (168, 70)])
+    def test_should_not_exceed_limit_from_rollups(self, hours, limit):
+        for i in range(0, hours * 60, 10):
+            self._insert_sensor("loop_inlet", 1.0, minutes_ago=i)
+        rows = self.store.get_sensor_history(hours=hours, limit=limit)
+        assert limit // 2 <= len(rows) <= limit
+
+    def test_should_backfill_rollups_on_upgrade(self, tmp_path):
+        path = tmp_path / "v2.db"
+        store = Store(path)
+        store.log_sensor("tank", 40.0)
+        store._conn.execute("DELETE FROM sensor_rollups")
+        store._conn.execute("PRAGMA user_version = 2")
+        store._conn.commit()
+        store.close()
+
+        store = Store(path)
+        count = store._conn.execute("SELECT COUNT(*) FROM sensor_rollups").fetchone()[0]
+        assert count == 4
+        store.close()
+
+
+class TestStats:
+    def setup_method(self):
+        self.store = Store(":memory:")
+
+    def teardown_method(self):
+        self.store.close()
+
+    def test_should_count_rows_per_table(self):
+        self.store.log_sensors({"loop_inlet": 1.0, "tank": 2.0})
+        self.store.log_weather(temperature=1.0)
+        self.store.log_event("startup")
+        self.store.log_event("error")
+        tables = self.store.stats()["tables"]
+        assert tables["sensor_cycles"] == 1
+        assert tables["weather_log"] == 1
+        assert tables["system_events"] == 2
+        assert tables["sensor_rollups"] == 8
+
+    def test_should_track_deletes_from_compaction(self):
+        ts = datetime.now(timezone.utc) - timedelta(days=8)
+        self.store.log_sensor("tank", 1.0, timestamp=ts)
+        self.store.compact_sensor_data()
+        assert self.store.stats()["tables"]["sensor_cycles"] == 0
+
+    def test_should_not_count_merged_cycles_twice(self):
+        ts = datetime(2025, 1, 15, 12, 0, tzinfo=timezone.utc)
+        self.store.log_sensor("loop_inlet", 1.0, timestamp=ts)
+        self.store.log_sensor("tank", 2.0, timestamp=ts)
+        assert self.store.stats()["tables"]["sensor_cycles"] == 1
+
+    def test_should_report_size(self, tmp_path):
+        store = Store(tmp_path / "stats.db")
+        store.log_event("startup")
+        stats = store.stats()
+        assert stats["size_bytes"] > 0
+        assert stats["tables"]["system_events"] == 1
+        store.close()
+
+    def test_should_seed_counters_on_upgrade(self, tmp_path):
+        path = tmp_path / "v3.db"
+        store = Store(path)
+        store.log_event("startup")
+        store.log_event("startup")
+        store._conn.execute("DELETE FROM table_stats")
+        store._conn.execute("PRAGMA user_version = 3")
+        store._conn.commit()
+        store.close()
+
+        store = Store(path)
+        assert store.stats()["tables"]["system_events"] == 2
+        store.close()
+
+
+class TestWriteVersion:
+    def test_should_bump_on_each_commit(self):
+        store = Store(":memory:")
+        start = store.write_version
+        store.log_event("startup")
+        store.log_weather(temperature=1.0)
+        store.log_sensor("tank", 40.0)
+        assert store.write_version == start + 3
+        store.close()
+
+    def test_should_not_bump_while_rows_are_buffered(self):
+        store = Store(":memory:", flush_interval=3600, flush_max_rows=100)
+        start = store.write_version
+        store.log_sensor("tank", 40.0)
+        assert store.write_version == start
+        store.flush()
+        assert store.write_version == start + 1
+        store.close()
@@ -1,16 +1,22 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import json
+import math
+import struct
+from datetime import datetime, timedelta, timezone
 from unittest.mock import AsyncMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
 
+from geoloop import broadcast, metrics
 from geoloop.controller.stub import StubController
+from geoloop.db.async_store import AsyncStore
 from geoloop.db.store import Store
+from geoloop.sensors.snapshot import SensorSnapshot
 from geoloop.sensors.stub import StubSensor
 from geoloop.weather.met_client import MetClient, WeatherForecast, WeatherSnapshot
-from geoloop.web.app import app, configure
+from geoloop.web.app import app, configure, stream
 
 
 def _sample_forecast() -> WeatherForecast:
@@ -23,9 +29,13 @@ def _sample_forecast() -> WeatherForecast:
 
 
 @pytest.fixture
-def client():
-    store = Store(":memory:")
-    met_client = MetClient("test/1.0")
+def store():
+    return AsyncStore(Store(":memory:"))
+
+
+@pytest.fixture
+def client(store):
+    met_client = MetClient("test/1.0", cache=store)
     sensors = {
         "loop_inlet": StubSensor("loop_inlet", 25.0),
         "tank": StubSensor("tank", 40.0),
@@ -54,6 +64,32 @@ class TestStatusEndpoint:
         assert "heating" in data
         assert data["heating"]["on"] is False
 
+    def test_should_flag_stale_weather(self, client):
+        forecast = _sample_forecast()
+        forecast.expires = datetime.now(timezone.utc) - timedelta(minutes=1)
+        with patch(
+            "geoloop.web.app._met_client.fetch_forecast",
+            new_callable=AsyncMock,
+            return_value=forecast,
+        ):
+            assert client.get("/api/status").json()["weather_stale"] is True
+            data = client.get("/api/weather").json()
+        assert data["stale"] is True
+        assert data["expires"] == forecast.expires.isoformat()
+
+    def test_should_report_missing_weather_instead_of_failing(self, client):
+        with patch(
+            "geoloop.web.app._met_client.fetch_forecast",
+            new_callable=AsyncMock,
+            side_effect=RuntimeError("Værprognose utilgjengelig"),
+        ):
+            resp = client.get("/api/status")
+            weather = client.get("/api/weather")
+        assert resp.status_code == 200
+        assert resp.json()["weather"] is None
+        assert weather.status_code == 200
+        assert "error" in weather.json()
+
     def test_should_return_sensor_readings(self, client):
         resp = client.get("/api/status")
         data = resp.json()
@@ -62,6 +98,25 @@ class TestStatusEndpoint:
         assert data["sensors"]["tank"] == pytest.approx(40.0)
 
 
+class TestWeatherArchiveEndpoint:
+    def test_should_return_forecast_active_at_moment(self, client, store):
+        issued = datetime(2025, 1, 15, 11, 0, tzinfo=timezone.utc)
+        store.store.save_forecast_issuance(
+            "59.9100,10.7500",
+            issued,
+            [{"time": issued + timedelta(hours=1), "air_temperature": -1.5}],
+            fetched_at=issued + timedelta(minutes=20),
+        )
+        data = client.get("/api/weather/archive", params={"at": "2025-01-15T11:30:00"}).json()
+        assert data["issued_at"] == issued.isoformat()
+        assert data["timeseries"][0]["air_temperature"] == -1.5
+        assert data["timeseries"][0]["wind_speed"] is None
+
+    def test_should_report_missing_archive(self, client):
+        data = client.get("/api/weather/archive", params={"at": "2000-01-01T00:00:00Z"}).json()
+        assert "error" in data
+
+
 class TestSensorsEndpoint:
     def test_should_return_all_sensors(self, client):
         resp = client.get("/api/sensors")
@@ -70,6 +125,44 @@ class TestSensorsEndpoint:
         assert data["sensors"]["loop_inlet"] == pytest.approx(25.0)
         assert data["sensors"]["tank"] == pytest.approx(40.0)
 
+    def test_should_serve_from_snapshot_without_reading_sensors(self, store):
+        sensor = StubSensor("tank", 40.0)
+        sensor.read = AsyncMock(side_effect=AssertionError("1-Wire skal ikke leses"))
+        snapshot = SensorSnapshot()
+        snapshot.update({"tank": 42.5}, datetime.now(timezone.utc) - timedelta(seconds=20))
+        configure(
+            met_client=MetClient("test/1.0"),
+            store=store,
+            lat=59.91,
+            lon=10.75,
+            sensors={"tank": sensor},
+            snapshot=snapshot,
+        )
+        data = TestClient(app).get("/api/sensors").json()
+        assert data["sensors"] == {"tank": 42.5}
+        assert data["age_seconds"] >= 20
+        assert data["stale"] is False
+
+    def test_should_use_configured_timeouts_on_cold_start(self, store):
+        configure(
+            met_client=MetClient("test/1.0"),
+            store=store,
+            lat=59.91,
+            lon=10.75,
+            sensors={"tank": StubSensor("tank", 40.0)},
+            sensor_timeouts={"tank": 5.0},
+        )
+        with patch(
+            "geoloop.web.app.acquire", new_callable=AsyncMock, return_value={"tank": 40.0}
+        ) as acquire:
+            TestClient(app).get("/api/sensors")
+        assert acquire.call_args.args[1] == {"tank": 5.0}
+
+    def test_should_report_snapshot_age_in_status(self, client):
+        data = client.get("/api/status").json()
+        assert data["sensor_snapshot"]["stale"] is False
+        assert data["sensor_snapshot"]["stale_sensors"] == []
+
 
 class TestHeatingEndpoints:
     def test_should_turn_on(self, client):
@@ -106,3 +199,207 @@ class TestLogEndpoint:
         assert "weather" in data
         assert "sensors" in data
         assert "events" in data
+
+    def test_should_page_events_with_cursor(self, client, store):
+        for i in range(5):
+            store.store.log_event("startup", f"e{i}")
+        first = client.get("/api/log?limit=3").json()
+        cursor = first["next_before_id"]["events"]
+        assert [e["message"] for e in first["events"]] == ["e4", "e3", "e2"]
+
+        second = client.get(f"/api/log?limit=3&before_id={cursor}").json()
+        assert [e["message"] for e in second["events"]] == ["e1", "e0"]
+        assert second["next_before_id"]["events"] is None
+
+    def test_should_filter_events_by_type_and_time(self, client, store):
+        t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        store.store.log_event("startup", "gammel", timestamp=t0)
+        store.store.log_event("error", "feil", timestamp=t0 + timedelta(hours=1))
+        store.store.log_event("startup", "ny", timestamp=t0 + timedelta(hours=2))
+
+        data = client.get("/api/log?event_type=startup").json()
+        assert [e["message"] for e in data["events"]] == ["ny", "gammel"]
+
+        data = client.get(
+            "/api/log", params={"since": "2025-01-01T00:30:00", "until": "2025-01-01T02:00:00Z"}
+        ).json()
+        assert [e["message"] for e in data["events"]] == ["feil"]
+
+
+class TestSystemEndpoint:
+    def test_should_return_database_stats(self, client):
+        client.post("/api/heating/on")
+        resp = client.get("/api/system")
+        assert resp.status_code == 200
+        db = resp.json()["database"]
+        assert db["events"] == 1
+        assert db["sensor_readings"] == 0
+        assert db["size_bytes"] > 0
+
+
+class TestHistoryEndpoint:
+    @pytest.fixture(autouse=True)
+    def _seed(self, store):
+        now = datetime.now(timezone.utc)
+        for minutes_ago, tank in ((20, 40.0), (10, 41.0)):
+            store.store.log_sensors(
+                {"tank": tank, "loop_inlet": None if minutes_ago == 10 else 2.0},
+                timestamp=now - timedelta(minutes=minutes_ago),
+            )
+
+    def test_should_return_rows_by_default(self, client):
+        data = client.get("/api/history?hours=1").json()
+        assert [row["tank"] for row in data["sensors"]] == [40.0, 41.0]
+        assert data["heating_on"] is False
+
+    def test_should_return_columns(self, client):
+        data = client.get("/api/history?hours=1&format=columns").json()
+        assert len(data["timestamps"]) == 2
+        assert isinstance(data["timestamps"][0], int)
+        assert data["sensors"]["tank"] == [40.0, 41.0]
+        assert data["sensors"]["loop_inlet"] == [2.0, None]
+        assert "heating_periods" in data
+
+    def test_should_pack_float32_binary(self, client):
+        resp = client.get("/api/history?hours=1&format=f32")
+        assert resp.headers["content-type"] == "application/octet-stream"
+        names = resp.headers["x-sensors"].split(",")
+        points = int(resp.headers["x-points"])
+        body = resp.content
+        assert len(body) == 4 * points * (1 + len(names))
+        offset = 4 * points * (1 + names.index("loop_inlet"))
+        values = struct.unpack(f"<{points}f", body[offset:offset + 4 * points])
+        assert values[0] == 2.0
+        assert math.isnan(values[1])
+
+    def test_should_stream_ndjson(self, client):
+        resp = client.get("/api/history?hours=1&format=ndjson")
+        assert resp.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in resp.text.splitlines()]
+        assert "tank" in lines[0]["sensors"]
+        assert lines[1]["sensors"]["tank"] == [40.0, 41.0]
+
+    def test_should_accept_downsample_method(self, client):
+        data = client.get("/api/history?hours=1&limit=1&format=columns&downsample=lttb").json()
+        assert data["sensors"]["tank"].count(None) == len(data["timestamps"]) - 1
+
+    def test_should_accept_minmax_with_single_point(self, client):
+        resp = client.get("/api/history?hours=1&limit=1&downsample=minmax")
+        assert resp.status_code == 200
+
+    def test_should_reject_unknown_downsample_method(self, client):
+        assert "error" in client.get("/api/history?downsample=median").json()
+
+    def test_should_reject_unknown_format(self, client):
+        assert "error" in client.get("/api/history?format=xml").json()
+
+
+class TestResponseCache:
+    def test_should_return_etag_and_304_when_unchanged(self, client):
+        first = client.get("/api/history?hours=1")
+        etag = first.headers["etag"]
+        second = client.get("/api/history?hours=1", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.content == b""
+
+    def test_should_skip_database_on_cache_hit(self, client, store, monkeypatch):
+        client.get("/api/log")
+        calls = []
+        original = store.get_events
+
+        async def counting(*args, **kwargs):
+            calls.append(1)
+            return await original(*args, **kwargs)
+
+        monkeypatch.setattr(store, "get_events", counting)
+        assert client.get("/api/log").status_code == 200
+        assert client.get("/api/log", headers={"If-None-Match": "*"}).status_code == 304
+        assert calls == []
+
+    def test_should_change_etag_after_write(self, client, store):
+        etag = client.get("/api/log").headers["etag"]
+        store.store.log_event("startup", "ny rad")
+        resp = client.get("/api/log", headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.headers["etag"] != etag
+        assert resp.json()["events"][0]["event_type"] == "startup"
+
+    def test_should_key_cache_on_parameters(self, client):
+        a = client.get("/api/history?hours=1").headers["etag"]
+        b = client.get("/api/history?hours=6").headers["etag"]
+        c = client.get("/api/history?hours=1&format=columns").headers["etag"]
+        assert len({a, b, c}) == 3
+
+    def test_should_keep_binary_headers_on_cached_response(self, client):
+        first = client.get("/api/history?hours=1&format=f32")
+        second = client.get("/api/history?hours=1&format=f32")
+        assert second.content == first.content
+        assert second.headers["x-sensors"] == first.headers["x-sensors"]
+
+
+class TestStreamEndpoint:
+    async def test_should_stream_published_events(self):
+        response = await stream()
+        assert response.media_type == "text/event-stream"
+        chunks = response.body_iterator
+        assert (await anext(chunks)).startswith(b"retry:")
+        broadcast.publish("thresholds", {"ice_temp_min": -2.0})
+        message = await anext(chunks)
+        assert message.startswith(b"event: thresholds")
+        await chunks.aclose()
+        assert broadcast.subscriber_count() == 0
+
+    def test_should_publish_heating_change(self, client, monkeypatch):
+        published = []
+        monkeypatch.setattr("geoloop.broadcast.publish", lambda *args: published.append(args))
+        client.post("/api/heating/on")
+        assert ("heating", {"on": True, "mode": "on"}) in published
+
+
+class TestCompression:
+    def test_should_gzip_large_json_responses(self, client, store):
+        for i in range(20):
+            store.store.log_event("startup", f"hendelse {i}")
+        resp = client.get("/api/log", headers={"Accept-Encoding": "gzip"})
+        assert resp.headers["content-encoding"] == "gzip"
+        assert len(resp.json()["events"]) == 20
+
+    def test_should_not_compress_small_json_responses(self, client):
+        resp = client.get("/api/system", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in resp.headers
+
+    def test_should_serve_fingerprinted_assets_from_index(self, client):
+        html = client.get("/").text
+        assert "/static/app.js" not in html
+        src = html.split('<script src="')[1].split('"')[0]
+        resp = client.get(src, headers={"Accept-Encoding": "gzip"})
+        assert resp.status_code == 200
+        assert resp.headers["cache-control"] == "public, max-age=31536000, immutable"
+        assert resp.headers["content-encoding"] == "gzip"
+        assert "startStream" in resp.text
+
+    def test_should_revalidate_html_pages(self, client):
+        assert client.get("/").headers["cache-control"] == "no-cache"
+
+
+class TestMetricsEndpoint:
+    def test_should_expose_prometheus_text(self, client):
+        resp = client.get("/metrics")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "# TYPE geoloop_http_request_duration_seconds histogram" in resp.text
+
+    def test_should_label_requests_by_route_template(self, client):
+        before = metrics.HTTP_REQUEST_SECONDS.count(
+            method="GET", route="/static/{name}", status="404"
+        )
+        client.get("/static/finnes-ikke.js")
+        after = metrics.HTTP_REQUEST_SECONDS.count(
+            method="GET", route="/static/{name}", status="404"
+        )
+        assert after == before + 1
+
+    def test_should_record_database_query_time(self, client):
+        count = metrics.DB_QUERY_SECONDS.count(operation="get_events")
+        client.get("/api/log?limit=7")
+        assert metrics.DB_QUERY_SECONDS.count(operation="get_events") == count + 1